@@ -50,7 +50,15 @@ setup(name='comptests',
       
       entry_points={
         'console_scripts': [
-            'comptests = comptests:main_comptests'
+            'comptests = comptests:main_comptests',
+            'comptests-bench = comptests_bench:main_comptests_bench',
+            'comptests-export = comptests:main_comptests_export',
+            'comptests-history = comptests:main_comptests_history',
+            'comptests-merge = comptests:main_comptests_merge',
+            'comptests-worker = comptests:main_comptests_worker',
+       ],
+        'pytest11': [
+            'comptests = comptests_pytest',
        ],
       #         'nose.plugins.0.10': [
       #             'xunitext = xunitext:XUnitExt'
@@ -3,3 +3,13 @@ __version__ = '1.3.7'
 from .registrar import *
 from .comptests import *
 from .results import *
+from .benchmarks import *
+from .fixtures import *
+from .requirements import *
+from .serializers import *
+from .failures import query_failures, build_failures_index
+from .outcomes import read_outcomes
+from .export import export_results, main_comptests_export
+from .distributed import main_comptests_worker
+from .history import HistoryDB, main_comptests_history
+from .sharding import main_comptests_merge
@@ -0,0 +1,81 @@
+from multiprocessing.pool import ThreadPool
+import traceback
+
+from .outcomes import NoOutcome
+
+
+__all__ = [
+    'ConcurrentWrap',
+    'ObjectFailure',
+    'ConcurrentTestError',
+]
+
+
+class ConcurrentWrap():
+    """
+        Runs the test f, which takes (id_object, object), for many objects
+        concurrently in one job, as a batched test, in a pool of threads
+        (useful for tests that mostly wait for I/O).
+        Returns a dict id_object -> result, where the result is an
+        ObjectFailure if the test raised an exception for that object.
+        With retries, the test is called again only for the objects 
+        that failed.
+    """
+    def __init__(self, f, max_concurrency):
+        self.f = f
+        self.max_concurrency = max_concurrency
+        self.__name__ = f.__name__
+        self.__module__ = f.__module__
+
+    def __call__(self, objects, retries=0):
+        if not objects:
+            return {}
+        ids = [id_object for id_object, _ in objects]
+        pool = ThreadPool(min(self.max_concurrency, len(objects)))
+        try:
+            results = pool.map(lambda x: self.call_one(x, retries), objects)
+        finally:
+            pool.close()
+            pool.join()
+        return dict(zip(ids, results))
+
+    def call_one(self, id_object_ob, retries=0):
+        from .registrar import call_with_retries
+        id_object, ob = id_object_ob
+        try:
+            # the attempts are recorded by get_batched_result()
+            return call_with_retries(NoOutcome(), retries, self.f,
+                                     id_object, ob)
+        except Exception as e:
+            return ObjectFailure(exception=type(e).__name__,
+                                 message=str(e),
+                                 traceback=traceback.format_exc(),
+                                 assertion=isinstance(e, AssertionError))
+
+
+class ObjectFailure(object):
+    """ 
+        Stands for the exception raised by a concurrent test for one object.
+        The exception itself is not kept: the batch is pickled, and 
+        exceptions with their own __init__ arguments do not unpickle.
+    """
+    def __init__(self, exception, message, traceback, assertion=False):
+        self.exception = exception
+        self.message = message
+        self.traceback = traceback
+        self.assertion = assertion
+
+    def get_exception(self):
+        """ Returns the exception to raise in place of the original one. """
+        msg = '%s: %s\n\n%s' % (self.exception, self.message, self.traceback)
+        if self.assertion:
+            # the test failed rather than raising an error
+            return AssertionError(msg)
+        return ConcurrentTestError(msg)
+
+    def __repr__(self):
+        return 'ObjectFailure(%s: %s)' % (self.exception, self.message)
+
+
+class ConcurrentTestError(Exception):
+    """ Raised for an object of a concurrent test which raised an error. """
@@ -0,0 +1,186 @@
+import json
+import os
+from timeit import default_timer
+
+from conf_tools import ObjectSpec
+from contracts import contract
+from quickapp import logger
+
+from .registrar import register_indep, register_pair, register_single
+from .results import BenchmarkResult
+from .segments import get_output_path
+from .sharding import get_test_key
+
+
+__all__ = [
+    'comptest_benchmark',
+    'comptests_for_all_benchmark',
+    'comptests_for_all_pairs_benchmark',
+    'set_benchmark_settings',
+]
+
+# Where the timing statistics are stored:
+#   <output dir>/comptests-benchmarks/current/<key>.json   the last measurement
+#   <baseline dir>/<key>.json  the reference to compare with (--benchmark_baseline)
+# where key is "module:objspec:function-id_object".
+def get_benchmarks_dir(output_dir=None):
+    return get_output_path('comptests-benchmarks', output_dir)
+
+
+def get_benchmark_settings_filename(output_dir=None):
+    return os.path.join(get_benchmarks_dir(output_dir), 'settings.json')
+
+
+def set_benchmark_settings(output_dir, baseline=None, update=False):
+    """ 
+        Called by comptests at the start of the run: the benchmark jobs, 
+        which can run in other processes, read the settings in the output dir.
+        
+        baseline: the directory with the baseline (None: no comparison)
+        update: write the measurements as the new baseline
+    """
+    settings = dict(baseline=baseline, update=update)
+    save_stats(get_benchmark_settings_filename(output_dir), settings)
+
+
+def get_benchmark_settings():
+    filename = get_benchmark_settings_filename()
+    if not os.path.exists(filename):
+        return dict(baseline=None, update=False)
+    with open(filename) as f:
+        return json.load(f)
+
+
+class BenchmarkWrap():
+    """
+        Runs the function "repeat" times (after "warmup" runs)
+        and returns a BenchmarkResult. The positional arguments are
+        assumed to be (id_object, object) pairs; the keyword arguments
+        (fixtures) are passed through.
+    """
+    def __init__(self, f, warmup, repeat, tolerance, objspec=None):
+        self.f = f
+        self.warmup = warmup
+        self.repeat = repeat
+        self.tolerance = tolerance
+        self.objspec = objspec
+        self.__name__ = f.__name__
+        self.__module__ = f.__module__
+
+    def __call__(self, *args, **kwargs):
+        for _ in range(self.warmup):
+            self.f(*args, **kwargs)
+        times = []
+        for _ in range(self.repeat):
+            t0 = default_timer()
+            self.f(*args, **kwargs)
+            times.append(default_timer() - t0)
+
+        key = self.get_key(list(args[::2]))
+        stats = timing_stats(times)
+        save_stats(get_current_filename(key), stats)
+
+        settings = get_benchmark_settings()
+        baseline = None
+        if settings['baseline'] is None:
+            logger.info('No baseline for %s (see --benchmark_baseline).' % key)
+        else:
+            baseline_fn = get_stats_filename(settings['baseline'], key)
+            if os.path.exists(baseline_fn):
+                with open(baseline_fn) as f:
+                    baseline = json.load(f)
+            else:
+                logger.info('No baseline for %s in %s.' % 
+                            (key, settings['baseline']))
+            if settings['update']:
+                # compared with the previous one, which is replaced
+                save_stats(baseline_fn, stats)
+
+        res = BenchmarkResult(stats=stats, baseline=baseline,
+                              tolerance=self.tolerance)
+        if res.is_regression():
+            logger.warn('Performance regression for %s: %s' %
+                        (key, res.get_string()))
+        return res
+
+    def get_key(self, ids):
+        """ The name of the statistics for these objects. """
+        module = self.f.__module__.split('.')[0]
+        key = get_test_key(module, self.objspec, self.f.__name__)
+        return '-'.join([key] + ids)
+
+
+def timing_stats(times):
+    n = len(times)
+    mean = sum(times) / n
+    std = (sum((t - mean) ** 2 for t in times) / n) ** 0.5
+    ordered = sorted(times)
+    if n % 2:
+        median = ordered[n // 2]
+    else:
+        median = (ordered[n // 2 - 1] + ordered[n // 2]) / 2.0
+    return dict(n=n, mean=mean, std=std, min=ordered[0], median=median)
+
+
+def get_stats_filename(dirname, key):
+    return os.path.join(dirname, key + '.json')
+
+
+def get_current_filename(key):
+    """ The last measurement, in the output dir. """
+    return get_stats_filename(os.path.join(get_benchmarks_dir(), 'current'), key)
+
+
+def save_stats(filename, stats):
+    d = os.path.dirname(filename)
+    if not os.path.exists(d):
+        os.makedirs(d)
+    with open(filename, 'w') as f:
+        json.dump(stats, f)
+
+
+def comptest_benchmark(f=None, warmup=1, repeat=5, tolerance=0.2):
+    """
+        Like @comptest, but the function is benchmarked.
+        Can be used as ``@comptest_benchmark`` or
+        ``@comptest_benchmark(repeat=10)``.
+    """
+    def register(f):
+        w = BenchmarkWrap(f, warmup=warmup, repeat=repeat,
+                          tolerance=tolerance)
+        register_indep(w, dynamic=False, args=(), kwargs={})
+        return f
+
+    if f is not None:
+        return register(f)
+    return register
+
+
+@contract(objspec=ObjectSpec, warmup='int,>=0', repeat='int,>=1',
+          tolerance='float|int,>=0')
+def comptests_for_all_benchmark(objspec, warmup=1, repeat=5, tolerance=0.2):
+    """
+        Returns a decorator for benchmarks, which should take two
+        parameters: id and object. The function is timed for each object
+        and compared with the baseline (see --benchmark_baseline); regressions
+        larger than ``tolerance`` (relative) are reported.
+    """
+    def register(f):
+        w = BenchmarkWrap(f, warmup=warmup, repeat=repeat,
+                          tolerance=tolerance, objspec=objspec.name)
+        register_single(objspec, w, dynamic=False)
+        return f
+    return register
+
+
+@contract(objspec1=ObjectSpec, objspec2=ObjectSpec, warmup='int,>=0',
+          repeat='int,>=1', tolerance='float|int,>=0')
+def comptests_for_all_pairs_benchmark(objspec1, objspec2, warmup=1, repeat=5,
+                                      tolerance=0.2):
+    """ Same as comptests_for_all_benchmark, for pairs. """
+    def register(f):
+        w = BenchmarkWrap(f, warmup=warmup, repeat=repeat,
+                          tolerance=tolerance, objspec=objspec1.name)
+        register_pair(objspec1, objspec2, w, dynamic=False)
+        return f
+    return register
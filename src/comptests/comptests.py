@@ -1,9 +1,26 @@
 from .find_modules_imp import find_modules, find_modules_main
 from .nose import jobs_nosetests, jobs_nosetests_single
+from compmake import StorageFilesystem
 from conf_tools import GlobalConfig, import_name, reset_config
 from contracts import contract
 from quickapp import QuickApp
+import multiprocessing
 import os
+import subprocess
+import sys
+import time
+
+from .benchmarks import set_benchmark_settings
+from .direct import run_direct
+from .distributed import DistributedQueue, get_queue_dir
+from .history import get_history_db, record_run
+from .outcomes import get_outcomes_dir
+from .planner import (estimate_plan, format_plan, plan_modules,
+    read_duration_history, write_plan)
+from .registrar import set_comptests_settings
+from .sharding import (assign_shards, get_shard_units, parse_shard,
+    read_durations)
+from . import startup
 
 
 __all__ = [
@@ -31,6 +48,79 @@ class CompTests(QuickApp):
         params.add_flag('nocomp', help='Disable comptests hooks')
         
         params.add_flag('reports', help='Create reports jobs')
+
+        params.add_string('only_function', default=None,
+                          help='Only define the tests with these functions '
+                               '(comma separated, wildcards allowed)')
+        params.add_string('only_objspec', default=None,
+                          help='Only define the tests for these objspecs')
+        params.add_string('only_object', default=None,
+                          help='Only define the tests for these objects')
+
+        params.add_flag('distributed',
+                        help='Execute the jobs together with the workers '
+                             'started with "comptests-worker" (shared filesystem)')
+
+        params.add_int('retries', default=0,
+                       help='Execute the failing tests up to this many more '
+                            'times; those that pass are marked as flaky')
+
+        params.add_string('instance_cache', default=None,
+                          help='Directory in which the instanced objects are '
+                               'stored and reused by later runs (for example '
+                               '~/.cache/comptests/instances)')
+        params.add_int('instance_cache_size', default=2048,
+                       help='Maximum size of the instance cache (MB); the '
+                            'least recently used objects are removed')
+        params.add_flag('instance_cache_compress',
+                        help='Compress the objects in the instance cache')
+        params.add_string('instance_cache_salt', default='',
+                          help='Added to the keys of the instance cache; '
+                               'change it to instance the objects again')
+
+        params.add_string('serializer', default=None,
+                          help='Store the instances and fixtures in the DB '
+                               'with this serializer ("pickle", "zlib", "lz4" '
+                               'or one added with register_serializer())')
+
+        params.add_string('benchmark_baseline', default=None,
+                          help='Directory with the baseline timings of the '
+                               'benchmarks (outside the output dir, so that '
+                               'it can be committed)')
+        params.add_flag('update_baseline',
+                        help='Write the timings of this run as the new '
+                             'baseline in --benchmark_baseline')
+
+        params.add_string('history', default=None,
+                          help='SQLite database to which the outcomes of '
+                               'each run are appended ("" to disable; the '
+                               'default is comptests-history.sqlite in the '
+                               'output dir)')
+
+        params.add_flag('profile_startup',
+                        help='Only show the time spent importing comptests '
+                             'and the modules')
+
+        params.add_flag('direct',
+                        help='Run the comptests in this process, without '
+                             'compmake (no nosetests, reports or DB)')
+        params.add_int('direct_processes', default=0,
+                       help='With --direct, run the tests in a pool of '
+                            'this many processes')
+
+        params.add_string('shard', default=None,
+                          help='Run only the part "i/N" of the tests (for '
+                               'example 2/8), for splitting a run across '
+                               'machines; see comptests-merge')
+        params.add_string('shard_durations', default=None,
+                          help='Durations written by comptests-merge, used '
+                               'to balance the shards (otherwise, they are '
+                               'balanced by the number of jobs)')
+
+        params.add_flag('plan', help='Only count the jobs and estimate the '
+                                     'running time; do not run the tests')
+        params.add_int('plan_workers', default=1,
+                       help='Number of workers for the estimate of --plan')
         
         params.accept_extra()
          
@@ -43,15 +133,200 @@ class CompTests(QuickApp):
             raise Exception('No modules found.') # XXX: what's the nicer way?
 
         options = self.get_options()        
+        shard = self.get_shard(modules)
         if not options.nonose:
             do_coverage = options.coverage
-            self.instance_nosetests_jobs(context, modules, do_coverage)
+            nose_modules = modules if shard is None else shard['nose']
+            self.instance_nosetests_jobs(context, nose_modules, do_coverage)
         
         #self.instance_nosesingle_jobs(context, modules)
         
         if not options.nocomp:
-            self.instance_comptests_jobs(context, modules,
-                                         create_reports=options.reports)
+            settings = self.get_comptests_settings()
+            if shard is not None:
+                settings['shard_tests'] = shard['tests']
+            self.instance_comptests_jobs(context, modules, settings=settings)
+
+    def go(self):
+        options = self.get_options()
+        if options.plan:
+            return self.go_plan()
+        if options.profile_startup:
+            return self.go_profile_startup()
+        self.set_benchmark_settings()
+        if options.direct:
+            return self.go_direct()
+        if options.distributed:
+            # remove the previous session before changing the DB
+            queue_dir = get_queue_dir(os.path.realpath(options.output))
+            DistributedQueue(queue_dir).remove_session()
+            if options.command is None:
+                options.command = 'distmake'
+        if options.command is not None:
+            # compmake wants a str
+            options.command = str(options.command)
+        t0 = time.time()
+        ret = QuickApp.go(self)
+        if options.history != '':
+            self.record_history(since=t0)
+        return ret
+
+    def set_benchmark_settings(self):
+        """ Writes --benchmark_baseline for the benchmark jobs. """
+        options = self.get_options()
+        baseline = options.benchmark_baseline
+        if baseline is None:
+            if options.update_baseline:
+                raise ValueError('--update_baseline needs --benchmark_baseline')
+        else:
+            baseline = str(os.path.realpath(os.path.expanduser(baseline)))
+        set_benchmark_settings(options.output, baseline=baseline,
+                               update=bool(options.update_baseline))
+
+    def record_history(self, since):
+        """ Appends the outcomes of the jobs executed by this run to the history. """
+        options = self.get_options()
+        # the parmake workers flush their outcomes when they exit
+        for p in multiprocessing.active_children():
+            p.join(10)
+        storage = os.path.join(options.output, 'compmake')
+        db = StorageFilesystem(storage) if os.path.exists(storage) else None
+        filename = self.get_history_filename()
+        run_id = record_run(self.get_modules(), since=since, db=db,
+                            filename=filename,
+                            outcomes=get_outcomes_dir(options.output))
+        if run_id is not None:
+            self.info('Outcomes recorded as run %d in %s' % (run_id, filename))
+
+    def get_history_filename(self):
+        options = self.get_options()
+        if options.history is not None:
+            return str(options.history)
+        return get_history_db(str(options.output))
+
+    def go_direct(self):
+        """ Runs the comptests with the DirectExecutor; returns 1 if any failed. """
+        options = self.get_options()
+        GlobalConfig.global_load_dir('default')
+        modules = self.get_modules()
+        if options.reports:
+            self.warn('The reports are not created with --direct.')
+        settings = self.get_comptests_settings()
+        shard = self.get_shard(modules)
+        if shard is not None:
+            settings['shard_tests'] = shard['tests']
+        t0 = time.time()
+        executor = run_direct(modules, settings,
+                              processes=options.direct_processes,
+                              output_dir=options.output)
+        self.info(executor.get_summary())
+        if options.history != '':
+            filename = self.get_history_filename()
+            run_id = record_run(modules, since=t0, db=None, filename=filename,
+                                outcomes=get_outcomes_dir(options.output))
+            if run_id is not None:
+                self.info('Outcomes recorded as run %d in %s' %
+                          (run_id, filename))
+        return 1 if executor.get_failed() else 0
+
+    def go_profile_startup(self):
+        """ Imports comptests and the modules in a new interpreter, timing them. """
+        modules = self.get_modules()
+        filename = startup.__file__
+        if filename.endswith('.pyc'):
+            filename = filename[:-1]
+        # the file is run directly, so that comptests is not yet imported
+        code = ('import runpy, sys; sys.argv = sys.argv[1:]; '
+                'runpy.run_path(sys.argv[0], run_name="__main__")')
+        return subprocess.call([sys.executable, '-c', code, filename] + modules)
+
+    def go_plan(self):
+        """ 
+            Runs only the definition of the comptests (in this process, 
+            without defining jobs), prints the job counts and the estimates
+            and writes them to plan.json in the output dir.
+        """
+        GlobalConfig.global_load_dir('default')
+        options = self.get_options()
+        modules = self.get_modules()
+        settings = self.get_comptests_settings()
+        entries = plan_modules(modules, settings, options.output)
+        for module in modules:
+            for function in ['instance_comptests_jobs2_m', 'comptests_jobs_wrap']:
+                entries.append(dict(module=module, objspec=None,
+                                    function=function, kind='definition',
+                                    njobs=1, dynamic=False))
+        if not options.nonose:
+            for module in modules:
+                entries.append(dict(module=module, objspec=None,
+                                    function='call_nosetests', kind='nose',
+                                    njobs=1, dynamic=False))
+
+        # the durations of the previous run, if any
+        storage = os.path.join(options.output, 'compmake')
+        db = StorageFilesystem(storage) if os.path.exists(storage) else None
+        history = read_duration_history(db,
+                                        get_outcomes_dir(options.output))
+        estimate = estimate_plan(entries, history, options.plan_workers)
+        self.info(format_plan(entries, estimate))
+
+        filename = os.path.join(options.output, 'plan.json')
+        write_plan(filename, entries, estimate)
+        self.info('Written to %s' % filename)
+        return 0
+
+    def get_shard(self, modules):
+        """
+            With --shard i/N, returns dict(tests, nose): the comptests
+            (module, objspec, function) and the modules whose nosetests are in
+            this shard (see sharding.py); otherwise None.
+        """
+        options = self.get_options()
+        if options.shard is None:
+            return None
+        i, n = parse_shard(str(options.shard))
+        durations = {}
+        if options.shard_durations:
+            durations = read_durations(str(options.shard_durations))
+        else:
+            self.info('No --shard_durations: balancing by number of jobs.')
+        entries = []
+        if not options.nocomp:
+            entries = plan_modules(modules, self.get_comptests_settings(),
+                                   options.output)
+        nose_modules = [] if options.nonose else modules
+        shards = assign_shards(get_shard_units(entries, nose_modules),
+                               durations, n)
+        mine = shards[i - 1]
+        self.info('Shard %d/%d: %d of %d units, estimated %.1f s of %.1f s.' %
+                  (i, n, len(mine), sum(len(x) for x in shards),
+                   sum(u['weight'] for u in mine),
+                   sum(u['weight'] for x in shards for u in x)))
+        tests = set()
+        for u in mine:
+            tests.update(u['tests'])
+        nose = [u['nose'] for u in mine if u['nose'] is not None]
+        return dict(tests=sorted(tests), nose=nose)
+
+    def get_comptests_settings(self):
+        """ Options passed to the jobs that define the comptests. """
+        options = self.get_options()
+        settings = dict(create_reports=options.reports,
+                        retries=options.retries,
+                        output_dir=str(options.output))
+        for k in ['only_function', 'only_objspec', 'only_object']:
+            pattern = getattr(options, k)
+            settings[k] = None if pattern is None else str(pattern)
+        if options.serializer:
+            settings['serializer'] = str(options.serializer)
+        if options.instance_cache:
+            dirname = os.path.realpath(os.path.expanduser(options.instance_cache))
+            settings['instance_cache'] = \
+                dict(dirname=str(dirname),
+                     max_size=options.instance_cache_size * 1024 * 1024,
+                     compress=bool(options.instance_cache_compress),
+                     salt=str(options.instance_cache_salt))
+        return settings
 
     @contract(returns='list(str)')
     def get_modules(self):
@@ -92,7 +367,8 @@ class CompTests(QuickApp):
     def instance_nosetests_jobs(self, context, modules, do_coverage):
         for module in modules:
             c = context.child(module)
-            jobs_nosetests(c, module, do_coverage = do_coverage)
+            jobs_nosetests(c, module, do_coverage=do_coverage,
+                           output_dir=self.get_options().output)
     
     def instance_nosesingle_jobs(self, context, modules):
         for module in modules:
@@ -100,8 +376,8 @@ class CompTests(QuickApp):
             c.comp_dynamic(jobs_nosetests_single, module, job_id='nosesingle')
             
     
-    @contract(modules='list(str)', create_reports='bool')
-    def instance_comptests_jobs(self, context, modules, create_reports):
+    @contract(modules='list(str)', settings='dict')
+    def instance_comptests_jobs(self, context, modules, settings):
 
         for module in modules:
 
@@ -112,12 +388,12 @@ class CompTests(QuickApp):
 
             c.add_extra_report_keys(module=module)
             c.comp_config_dynamic(instance_comptests_jobs2_m, module_name=module,
-                                  create_reports=create_reports,
+                                  settings=settings,
                                   job_id='comptests')
 
 
 
-def instance_comptests_jobs2_m(context, module_name, create_reports):
+def instance_comptests_jobs2_m(context, module_name, settings):
     is_first = not '.' in module_name
     warn_errors = is_first
 
@@ -139,10 +415,11 @@ def instance_comptests_jobs2_m(context, module_name, create_reports):
 
     ff = module.__dict__[fname]
 
-    context.comp_dynamic(comptests_jobs_wrap, ff, job_id=module_name)
+    context.comp_dynamic(comptests_jobs_wrap, ff, settings, job_id=module_name)
 
-def comptests_jobs_wrap(context, ff):
+def comptests_jobs_wrap(context, ff, settings):
     reset_config()
+    set_comptests_settings(settings)
     ff(context)
     
 main_comptests = CompTests.get_sys_main()
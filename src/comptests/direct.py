@@ -0,0 +1,386 @@
+from collections import OrderedDict
+import multiprocessing
+import os
+import time
+import traceback
+
+from compmake import Promise
+from compmake.jobs.dependencies import collect_dependencies
+from compmake.jobs.job_execution import JobCompute
+from compmake.jobs.storage import job2key
+from compmake.structures import Job
+from conf_tools import GlobalConfig
+from contracts import contract
+from quickapp import logger
+from quickapp.compmake_context import wrap_state, wrap_state_dynamic
+
+
+__all__ = [
+    'DirectContext',
+    'DirectExecutor',
+    'define_direct',
+    'run_direct',
+]
+
+# Status of the jobs executed by DirectExecutor
+DONE = 'done'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+
+class DirectJob(object):
+    def __init__(self, job_id, f, args, kwargs, deps, context=None):
+        self.job_id = job_id
+        self.f = f
+        self.args = args
+        self.kwargs = kwargs
+        self.deps = deps
+        # the context passed to the dynamic jobs
+        self.context = context
+
+
+class DirectExecutor(object):
+    """
+        Executes the jobs defined through a DirectContext in this process
+        (or in a multiprocessing pool), without the compmake DB: a small
+        replacement for compmake, for developers iterating on few tests.
+
+        The dynamic jobs always run in this process, as they define more
+        jobs; with processes > 0 the others run in the pool.
+    """
+
+    @contract(processes='int,>=0')
+    def __init__(self, processes=0):
+        self.processes = processes
+        self.jobs = OrderedDict()  # job_id -> DirectJob
+        self.pending = OrderedDict()  # job_id -> None, not started yet
+        self.results = {}  # job_id -> result
+        self.status = {}  # job_id -> DONE, FAILED, BLOCKED
+        self.errors = {}  # job_id -> message
+        self.blocked_by = {}  # job_id -> failed dependency
+        self.tracebacks = {}  # job_id -> traceback of the failed jobs
+        self.durations = {}  # job_id -> seconds
+        self.counter = 0
+
+    def get_compmake_db(self):
+        return DirectDB(self)
+
+    def add_job(self, job_id, f, args, kwargs, context=None):
+        if job_id in self.jobs:
+            logger.warn('Job %r redefined.' % job_id)
+        deps = collect_dependencies((args, kwargs))
+        self.jobs[job_id] = DirectJob(job_id, f, args, kwargs, deps, context)
+        self.pending[job_id] = None
+        return Promise(job_id)
+
+    def get_new_job_id(self, prefix, name):
+        self.counter += 1
+        return join_prefix(prefix, '%s-%d' % (name, self.counter))
+
+    def run(self):
+        """ Executes all the jobs, including those defined meanwhile. """
+        pool = multiprocessing.Pool(self.processes) if self.processes else None
+        running = {}  # job_id -> AsyncResult
+        try:
+            while True:
+                ready = [self.jobs[k] for k in self.pending
+                         if all(d in self.status for d in self.jobs[k].deps)]
+                if not ready and not running:
+                    break
+                for job in ready:
+                    del self.pending[job.job_id]
+                    failed = sorted(d for d in job.deps
+                                    if self.status[d] != DONE)
+                    if failed:
+                        self.set_blocked(job.job_id, failed[0])
+                    elif job.context is not None or pool is None:
+                        self.set_outcome(job.job_id, *self.execute(job))
+                    else:
+                        args, kwargs = self.substitute(job)
+                        running[job.job_id] = pool.apply_async(
+                            execute_job, (job.job_id, job.f, args, kwargs))
+                self.collect(running, wait=not ready)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        for job_id in self.pending:  # they depend on undefined jobs
+            missing = sorted(d for d in self.jobs[job_id].deps
+                             if not d in self.jobs)
+            self.set_status(job_id, BLOCKED, 'Undefined dependency %r' % missing)
+
+    def define(self):
+        """
+            Executes only the dynamic jobs which do not depend on the
+            others, that is, it defines the jobs without computing them.
+        """
+        while True:
+            ready = [self.jobs[k] for k in self.pending
+                     if self.jobs[k].context is not None and
+                     all(self.status.get(d) == DONE and
+                         self.jobs[d].context is not None
+                         for d in self.jobs[k].deps)]
+            if not ready:
+                break
+            for job in ready:
+                del self.pending[job.job_id]
+                self.set_outcome(job.job_id, *self.execute(job))
+
+    def compute(self, job_id):
+        """
+            Executes job_id in this process, after its dependencies
+            (the jobs already executed are not repeated); returns its status.
+        """
+        if job_id in self.status:
+            return self.status[job_id]
+        if not job_id in self.jobs:
+            raise ValueError('Undefined job %r.' % job_id)
+        job = self.jobs[job_id]
+        for d in sorted(job.deps):
+            if not d in self.jobs:
+                self.set_status(job_id, BLOCKED, 'Undefined dependency %r' % d)
+                break
+            if self.compute(d) != DONE:
+                self.set_blocked(job_id, d)
+                break
+        else:
+            self.set_outcome(job_id, *self.execute(job))
+        self.pending.pop(job_id, None)
+        return self.status[job_id]
+
+    def get_failure_cause(self, job_id):
+        """ Returns the failed job which blocked job_id (or job_id). """
+        while job_id in self.blocked_by:
+            job_id = self.blocked_by[job_id]
+        return job_id
+
+    def collect(self, running, wait):
+        """ Records the results of the finished pool jobs. """
+        while running:
+            finished = [k for k, r in running.items() if r.ready()]
+            for job_id in finished:
+                self.set_outcome(job_id, *running.pop(job_id).get())
+            if finished or not wait:
+                return
+            time.sleep(0.005)
+
+    def execute(self, job):
+        args, kwargs = self.substitute(job)
+        if job.context is not None:
+            args = (job.context,) + tuple(args)
+        return execute_job(job.job_id, job.f, args, kwargs)
+
+    def substitute(self, job):
+        return (substitute_promises(job.args, self.results),
+                substitute_promises(job.kwargs, self.results))
+
+    def set_outcome(self, job_id, ok, res, duration):
+        self.durations[job_id] = duration
+        if ok:
+            self.results[job_id] = res
+            self.set_status(job_id, DONE)
+        else:
+            message, self.tracebacks[job_id] = res
+            self.set_status(job_id, FAILED, message)
+
+    def set_blocked(self, job_id, failed):
+        self.blocked_by[job_id] = failed
+        self.set_status(job_id, BLOCKED, "Failure of dependency '%s'" % failed)
+
+    def set_status(self, job_id, status, error=None):
+        self.status[job_id] = status
+        if error is not None:
+            self.errors[job_id] = error
+
+    def get_summary(self):
+        """ Returns a compact summary of the run. """
+        counts = dict((s, 0) for s in [DONE, FAILED, BLOCKED])
+        for status in self.status.values():
+            counts[status] += 1
+        s = ('%d jobs in %.2f s (%d done, %d failed, %d blocked)' %
+             (len(self.status), sum(self.durations.values()),
+              counts[DONE], counts[FAILED], counts[BLOCKED]))
+        for job_id, status in self.status.items():
+            if status == FAILED:
+                s += '\n  %s: %s' % (job_id, self.errors[job_id])
+        return s
+
+    def get_failed(self):
+        return [k for k, v in self.status.items() if v != DONE]
+
+
+def execute_job(job_id, f, args, kwargs):
+    """ Returns (ok, result or (message, traceback), duration). """
+    JobCompute.current_job_id = job_id
+    t0 = time.time()
+    try:
+        res = f(*args, **kwargs)
+    except Exception as e:
+        lines = str(e).strip().split('\n')
+        message = '%s: %s' % (type(e).__name__, lines[0])
+        return False, (message, traceback.format_exc()), time.time() - t0
+    finally:
+        JobCompute.current_job_id = None
+    return True, res, time.time() - t0
+
+
+class DirectDB(object):
+    """ Enough of the compmake DB interface for assert_job_exists(). """
+    def __init__(self, executor):
+        self.executor = executor
+
+    def get_job_id(self, key):
+        prefix = job2key('')
+        return key[len(prefix):] if key.startswith(prefix) else None
+
+    def __contains__(self, key):
+        return self.get_job_id(key) in self.executor.jobs
+
+    def __getitem__(self, key):
+        job_id = self.get_job_id(key)
+        if not job_id in self.executor.jobs:
+            raise KeyError(key)
+        # only checked with isinstance(); Job() would inspect __main__
+        job = Job.__new__(Job)
+        job.job_id = job_id
+        job.children = set()
+        job.command_desc = job_id
+        return job
+
+
+class DirectContext(object):
+    """
+        Implements the part of QuickAppContext used by comptests and by
+        the jobs_comptests() hooks, defining the jobs in a DirectExecutor.
+        The reports are ignored.
+    """
+    def __init__(self, executor, job_prefix=None, output_dir='out-comptests',
+                 extra_dep=()):
+        self.cc = executor
+        self._job_prefix = job_prefix
+        self._output_dir = output_dir
+        self._extra_dep = list(extra_dep)
+        self.extra_report_keys = {}
+
+    def __str__(self):
+        return 'DirectContext(%s)' % self._job_prefix
+
+    def comp(self, f, *args, **kwargs):
+        return self._define(f, args, kwargs, dynamic=False)
+
+    def comp_dynamic(self, f, *args, **kwargs):
+        return self._define(f, args, kwargs, dynamic=True)
+
+    def comp_config(self, f, *args, **kwargs):
+        if not 'command_name' in kwargs:
+            kwargs['command_name'] = f.__name__
+        return self.comp(wrap_state, GlobalConfig.get_state(), f,
+                         *args, **kwargs)
+
+    def comp_config_dynamic(self, f, *args, **kwargs):
+        if not 'command_name' in kwargs:
+            kwargs['command_name'] = f.__name__
+        return self.comp_dynamic(wrap_state_dynamic, GlobalConfig.get_state(),
+                                 f, *args, **kwargs)
+
+    def _define(self, f, args, kwargs, dynamic):
+        job_id = kwargs.pop('job_id', None)
+        command_name = kwargs.pop('command_name', f.__name__)
+        extra_dep = kwargs.pop('extra_dep', [])
+        if isinstance(extra_dep, Promise):
+            extra_dep = [extra_dep]
+        if job_id is None:
+            job_id = self.cc.get_new_job_id(self._job_prefix, command_name)
+        else:
+            job_id = join_prefix(self._job_prefix, job_id)
+        # the extra dependencies are passed (and ignored) as a keyword
+        if self._extra_dep or extra_dep:
+            args = (list(self._extra_dep) + list(extra_dep), f) + tuple(args)
+            f = call_after if not dynamic else call_after_dynamic
+        context = self if dynamic else None
+        return self.cc.add_job(job_id, f, args, kwargs, context=context)
+
+    def child(self, name, qapp=None, add_job_prefix=None, add_outdir=None,
+              extra_dep=[], extra_report_keys=None, **_):
+        name_friendly = name.replace('-', '_')
+        if add_job_prefix is None:
+            add_job_prefix = name_friendly
+        if add_outdir is None:
+            add_outdir = name_friendly
+        job_prefix = self._job_prefix
+        if add_job_prefix != '':
+            job_prefix = join_prefix(job_prefix, add_job_prefix)
+        output_dir = self._output_dir
+        if add_outdir != '':
+            output_dir = os.path.join(output_dir, name)
+        c = DirectContext(self.cc, job_prefix=job_prefix, output_dir=output_dir,
+                          extra_dep=self._extra_dep + list(extra_dep))
+        c.extra_report_keys.update(self.extra_report_keys)
+        c.extra_report_keys.update(extra_report_keys or {})
+        return c
+
+    def get_output_dir(self):
+        if not os.path.exists(self._output_dir):
+            os.makedirs(self._output_dir)
+        return self._output_dir
+
+    def add_extra_report_keys(self, **keys):
+        self.extra_report_keys.update(keys)
+
+    def add_report(self, report, report_type, **params):
+        pass
+
+    def needs(self, rtype, **params):
+        pass
+
+
+def call_after(_deps, f, *args, **kwargs):
+    return f(*args, **kwargs)
+
+
+def call_after_dynamic(context, _deps, f, *args, **kwargs):
+    return f(context, *args, **kwargs)
+
+
+def join_prefix(prefix, job_id):
+    return job_id if not prefix else '%s-%s' % (prefix, job_id)
+
+
+def substitute_promises(x, results):
+    """
+        Replaces the Promises in x (also in dicts, lists, tuples) with the
+        results of the jobs; the containers without Promises are not copied.
+    """
+    if isinstance(x, Promise):
+        return results[x.job_id]
+    if not collect_dependencies(x):
+        return x
+    if isinstance(x, dict):
+        return type(x)((k, substitute_promises(v, results))
+                       for k, v in x.items())
+    return type(x)([substitute_promises(v, results) for v in x])
+
+
+@contract(modules='list(str)', settings='dict', processes='int,>=0')
+def run_direct(modules, settings, processes=0, output_dir='out-comptests'):
+    """
+        Runs the comptests of the modules without compmake
+        (see DirectExecutor); returns the executor.
+    """
+    executor = DirectExecutor(processes=processes)
+    context = DirectContext(executor, output_dir=output_dir)
+    define_direct(context, modules, settings)
+    executor.run()
+    return executor
+
+
+def define_direct(context, modules, settings):
+    """ Defines the jobs that define the comptests of the modules. """
+    from .comptests import instance_comptests_jobs2_m
+
+    settings = dict(settings, create_reports=False)
+    for module in modules:
+        context.comp_config_dynamic(instance_comptests_jobs2_m,
+                                    module_name=module, settings=settings,
+                                    job_id='comptests-%s' % module)
@@ -0,0 +1,364 @@
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+
+from compmake import Context, StorageFilesystem
+from compmake.exceptions import CommandFailed, JobFailed
+from compmake.jobs.actions import make
+from compmake.jobs.queries import direct_children, direct_parents
+from compmake.jobs.storage import (all_jobs, db_job_add_dynamic_children,
+    db_job_add_parent)
+from compmake.jobs.uptodate import CacheQueryDB
+from compmake.ui import ACTIONS, ui_command
+from contracts import contract
+from quickapp import QuickAppBase, logger
+
+
+__all__ = [
+    'DistributedQueue',
+    'distributed_worker',
+    'CompTestsWorker',
+    'main_comptests_worker',
+]
+
+
+class DistributedQueue(object):
+    """
+        Coordination of several workers (possibly on several hosts)
+        executing the jobs of the same compmake DB, using only files
+        on the shared filesystem:
+
+            <dirname>/session.json      created by the master
+            <dirname>/leases/<job_id>   the job is being executed;
+                                        touched by the worker every
+                                        "heartbeat" seconds
+            <dirname>/finished/<job_id> the job was executed (json)
+
+        A lease not touched for "timeout" seconds belongs to a dead
+        worker: the job is given to another worker.
+    """
+
+    def __init__(self, dirname, timeout=120.0):
+        self.dirname = dirname
+        self.timeout = timeout
+        self.leases = os.path.join(dirname, 'leases')
+        self.finished = os.path.join(dirname, 'finished')
+        self.worker = '%s-%s' % (socket.gethostname(), os.getpid())
+
+    def remove_session(self):
+        """ Called by the master before defining the jobs. """
+        if os.path.exists(self.dirname):
+            shutil.rmtree(self.dirname)
+
+    def create_session(self):
+        """ Called by the master, once the jobs are defined. """
+        self.remove_session()
+        os.makedirs(self.leases)
+        os.makedirs(self.finished)
+        fn = os.path.join(self.dirname, 'session.json')
+        with open(fn + '.tmp', 'w') as f:
+            json.dump(dict(master=self.worker, started=time.time()), f)
+        os.rename(fn + '.tmp', fn)
+
+    def session_exists(self):
+        return os.path.exists(os.path.join(self.dirname, 'session.json'))
+
+    def _lease(self, job_id):
+        return os.path.join(self.leases, job_id)
+
+    def _finished(self, job_id):
+        return os.path.join(self.finished, job_id)
+
+    def is_finished(self, job_id):
+        return os.path.exists(self._finished(job_id))
+
+    def try_acquire(self, job_id):
+        """ Returns True if we got the lease for the job. """
+        fn = self._lease(job_id)
+        if os.path.exists(fn):
+            if not self.is_expired(fn):
+                return False
+            # Only one worker can rename it.
+            stale = '%s.expired-%s' % (fn, self.worker)
+            try:
+                os.rename(fn, stale)
+            except OSError:
+                return False
+            logger.warn('Requeuing %s: worker %s is not responding.' %
+                        (job_id, read_file(stale)))
+            os.unlink(stale)
+        try:
+            fd = os.open(fn, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:
+            return False
+        os.write(fd, self.worker)
+        os.close(fd)
+        # somebody might have finished it in the meantime
+        if self.is_finished(job_id):
+            self.release(job_id)
+            return False
+        return True
+
+    def is_expired(self, fn):
+        try:
+            return time.time() - os.path.getmtime(fn) > self.timeout
+        except OSError:  # just released
+            return False
+
+    def heartbeat(self, job_id):
+        try:
+            os.utime(self._lease(job_id), None)
+        except OSError:
+            pass
+
+    def release(self, job_id):
+        try:
+            os.unlink(self._lease(job_id))
+        except OSError:
+            pass
+
+    def mark_finished(self, job_id, state):
+        """ Records the state ('done' or 'failed'), then releases the lease. """
+        fn = self._finished(job_id)
+        with open(fn + '.tmp-' + self.worker, 'w') as f:
+            json.dump(dict(state=state, worker=self.worker,
+                           timestamp=time.time()), f)
+        os.rename(fn + '.tmp-' + self.worker, fn)
+        self.release(job_id)
+
+    def active_leases(self):
+        """ Returns the jobs leased by live workers. """
+        res = []
+        for job_id in os.listdir(self.leases):
+            if '.expired-' in job_id:
+                continue
+            if not self.is_expired(self._lease(job_id)):
+                res.append(job_id)
+        return res
+
+    def get_failed(self):
+        failed = []
+        for job_id in os.listdir(self.finished):
+            if '.tmp-' in job_id:
+                continue
+            with open(self._finished(job_id)) as f:
+                if json.load(f)['state'] == 'failed':
+                    failed.append(job_id)
+        return sorted(failed)
+
+
+def read_file(fn):
+    try:
+        with open(fn) as f:
+            return f.read()
+    except IOError:
+        return '?'
+
+
+class Heartbeat(threading.Thread):
+    """ Touches the lease of the current job every "interval" seconds. """
+    def __init__(self, queue, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.queue = queue
+        self.interval = interval
+        self.job_id = None
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            job_id = self.job_id
+            if job_id is not None:
+                self.queue.heartbeat(job_id)
+
+
+@contract(output_dir='str')
+def get_queue_dir(output_dir):
+    """ The queue is next to the compmake storage, in the output dir. """
+    return os.path.join(output_dir, 'comptests-queue')
+
+
+class TodoJobs(object):
+    """
+        The jobs still to do, as known by this worker. It is updated
+        with the jobs executed here (and the jobs they define); the
+        jobs executed by the other workers are seen only by rescan(),
+        which reads the whole DB.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.failed = set()
+        self.rescans = 0
+        self.rescan()
+
+    def rescan(self):
+        cq = CacheQueryDB(self.db)
+        todo, _, ready = cq.list_todo_targets(list(all_jobs(self.db)))
+        self.todo = set(todo)
+        self.ready = set(ready) - self.failed
+        self.rescans += 1
+
+    def get_ready(self):
+        return sorted(self.ready)
+
+    def discard(self, job_id):
+        """ The job was finished by another worker. """
+        self.ready.discard(job_id)
+
+    def is_ready(self, job_id):
+        for child in direct_children(job_id, self.db):
+            if child in self.todo or child in self.failed:
+                return False
+        return True
+
+    def set_done(self, job_id, new_jobs):
+        self.todo.discard(job_id)
+        self.ready.discard(job_id)
+        if new_jobs:
+            cq = CacheQueryDB(self.db)
+            new_jobs = [j for j in new_jobs if not cq.up_to_date(j)[0]]
+            self.todo.update(new_jobs)
+        for j in list(new_jobs) + list(direct_parents(job_id, self.db)):
+            if j in self.todo and self.is_ready(j):
+                self.ready.add(j)
+
+    def set_failed(self, job_id):
+        self.todo.discard(job_id)
+        self.ready.discard(job_id)
+        self.failed.add(job_id)
+
+
+def acquire_ready(queue, todo):
+    """ Returns a ready job for which we got the lease, or None. """
+    for job_id in todo.get_ready():
+        if queue.is_finished(job_id):
+            todo.discard(job_id)
+        elif queue.try_acquire(job_id):
+            return job_id
+    return None
+
+
+@contract(heartbeat='float|int,>0', poll='float|int,>0', returns='dict')
+def distributed_worker(context, queue, heartbeat=10.0, poll=1.0):
+    """
+        Executes the ready jobs of the DB until there is nothing
+        else to do for anybody. Returns the counts of jobs done and failed
+        by this worker, and the number of times the DB was scanned.
+    """
+    db = context.get_compmake_db()
+    beat = Heartbeat(queue, heartbeat)
+    beat.start()
+    counts = dict(done=0, failed=0)
+    todo = TodoJobs(db)
+    while True:
+        job_id = acquire_ready(queue, todo)
+        if job_id is None:
+            # the other workers might have made more jobs ready
+            todo.rescan()
+            job_id = acquire_ready(queue, todo)
+        if job_id is None:
+            if not queue.active_leases():
+                # Nothing ready and nobody is working
+                break
+            time.sleep(poll)
+            continue
+
+        beat.job_id = job_id
+        try:
+            result = make(job_id, context=context)
+        except JobFailed as e:
+            logger.error('Job %s failed: %s' % (job_id, e.reason))
+            state = 'failed'
+            todo.set_failed(job_id)
+        else:
+            update_parents(job_id, result['user_object_deps'], db)
+            state = 'done'
+            todo.set_done(job_id, result['new_jobs'])
+        beat.job_id = None
+        queue.mark_finished(job_id, state)
+        counts[state] += 1
+    counts['rescans'] = todo.rescans
+    return counts
+
+
+def update_parents(job_id, deps, db):
+    """
+        If the result of a job refers to other jobs, the jobs
+        depending on it depend on those as well (as in compmake's Manager).
+    """
+    if not deps:
+        return
+    for parent in direct_parents(job_id, db):
+        db_job_add_dynamic_children(job_id=parent, children=deps,
+                                    returned_by=job_id, db=db)
+        for d in deps:
+            db_job_add_parent(job_id=d, parent=parent, db=db)
+
+
+@ui_command(section=ACTIONS, dbchange=True)
+def distmake(context, timeout=120.0, heartbeat=10.0, poll=1.0):
+    """
+        Makes all jobs together with the workers started with
+        "comptests-worker" on other hosts sharing the filesystem.
+
+        Options:
+            distmake timeout=120   Seconds after which the job of
+                                   a silent worker is given to another.
+    """
+    db = context.get_compmake_db()
+    queue = DistributedQueue(get_queue_dir(os.path.dirname(db.basepath)),
+                             timeout=timeout)
+    queue.create_session()
+    counts = distributed_worker(context, queue, heartbeat=heartbeat, poll=poll)
+    logger.info('This worker: %d done, %d failed.' %
+                (counts['done'], counts['failed']))
+    failed = queue.get_failed()
+    if failed:
+        raise CommandFailed('%d jobs failed: %s' % (len(failed),
+                                                    ', '.join(failed)))
+
+
+class CompTestsWorker(QuickAppBase):
+    """
+        Executes comptests jobs for the master started with
+        "comptests --distributed", using the DB on the shared filesystem.
+    """
+
+    cmd = 'comptests-worker'
+
+    def define_program_options(self, params):
+        params.add_string('output', short='o', default='out-comptests',
+                          help='Output directory of the master')
+        params.add_float('timeout', default=120.0,
+                         help='Seconds after which the job of a silent '
+                              'worker is given to another')
+        params.add_float('heartbeat', default=10.0,
+                         help='Interval for touching the lease')
+        params.add_float('wait', default=600.0,
+                         help='Seconds to wait for the master')
+
+    def go(self):
+        options = self.get_options()
+        output = str(options.output)
+        db = StorageFilesystem(os.path.join(output, 'compmake'))
+        queue = DistributedQueue(get_queue_dir(os.path.realpath(output)),
+                                 timeout=options.timeout)
+
+        t0 = time.time()
+        while not queue.session_exists():
+            if time.time() - t0 > options.wait:
+                self.error('No session in %s.' % queue.dirname)
+                return 1
+            time.sleep(1)
+
+        context = Context(db=db, currently_executing=['root'])
+        counts = distributed_worker(context, queue, heartbeat=options.heartbeat)
+        self.info('%d done, %d failed.' % (counts['done'], counts['failed']))
+        return 0
+
+
+main_comptests_worker = CompTestsWorker.get_sys_main()
@@ -0,0 +1,218 @@
+import json
+import os
+import tempfile
+from xml.etree import ElementTree as ET
+
+from compmake import StorageFilesystem
+from contracts import contract
+from quickapp import QuickAppBase
+
+from .nose import get_nose_dir
+from .outcomes import (BLOCKED, ERROR, FAILED, OK, PARTIALLY_SKIPPED, SKIPPED,
+                       get_outcomes_dir, read_outcomes)
+
+
+__all__ = [
+    'export_results',
+    'CompTestsExport',
+    'main_comptests_export',
+]
+
+
+class CompTestsExport(QuickAppBase):
+    """
+        Exports the results of the last comptests run (comptests jobs
+        and nosetests) as JUnit XML and JSON Lines.
+    """
+
+    cmd = 'comptests-export'
+
+    def define_program_options(self, params):
+        params.add_string('output', short='o', default='out-comptests',
+                          help='Output directory of the comptests run; the '
+                               'defaults of the other options are in it')
+        params.add_string('outcomes', default=None,
+                          help='Directory with the outcomes of the comptests jobs')
+        params.add_string('nose', default=None,
+                          help='Directory with the xunit files of nosetests')
+        params.add_string('db', default=None,
+                          help='Compmake DB, used for failed/blocked jobs '
+                               '(ignored if it does not exist)')
+        params.add_string('junit', default=None,
+                          help='JUnit XML file to write')
+        params.add_string('jsonl', default=None,
+                          help='JSON Lines file to write')
+
+    def go(self):
+        options = self.get_options()
+        output = options.output
+        dbname = options.db or os.path.join(output, 'compmake')
+        db = None
+        if os.path.exists(dbname):
+            db = StorageFilesystem(dbname)
+        else:
+            self.info('DB %r not found; using only the outcomes.' % dbname)
+
+        junit = options.junit or os.path.join(output, 'comptests-results.xml')
+        jsonl = options.jsonl or os.path.join(output, 'comptests-results.jsonl')
+        counts = export_results(junit=str(junit), jsonl=str(jsonl),
+                                outcomes=str(options.outcomes or
+                                             get_outcomes_dir(output)),
+                                nose=str(options.nose or get_nose_dir(output)),
+                                db=db)
+        self.info('%d tests (%d failures, %d errors, %d skipped)' %
+                  (counts['tests'], counts['failures'], counts['errors'],
+                   counts['skipped']))
+        self.info('Written %s and %s' % (junit, jsonl))
+
+
+main_comptests_export = CompTestsExport.get_sys_main()
+
+
+@contract(junit='str', jsonl='str', outcomes='None|str', nose='None|str',
+          returns='dict')
+def export_results(junit, jsonl, outcomes=None, nose=None, db=None):
+    """
+        Writes all results to the files junit and jsonl, in one pass.
+        The comptests outcomes are read from the compact records
+        (see read_outcomes), never from the user objects in the DB.
+        Returns the counts of tests, failures, errors, skipped.
+    """
+    if outcomes is None:
+        outcomes = get_outcomes_dir()
+    if nose is None:
+        nose = get_nose_dir()
+    return write_results(junit, jsonl, iterate_all_records(outcomes, nose, db))
+
+
+def write_results(junit, jsonl, records):
+    """ Writes the records to the files junit and jsonl; returns the counts. """
+    for fn in [junit, jsonl]:
+        d = os.path.dirname(fn)
+        if d and not os.path.exists(d):
+            os.makedirs(d)
+
+    counts = dict(tests=0, failures=0, errors=0, skipped=0, time=0.0)
+
+    # The testsuite element needs the counts, so we write the testcases
+    # first to a temporary file, then copy them after the header.
+    with tempfile.TemporaryFile() as body:
+        with open(jsonl, 'w') as fj:
+            for record in records:
+                fj.write(json.dumps(record) + '\n')
+                body.write(testcase_xml(record))
+                body.write('\n')
+                update_counts(counts, record['status'], record['duration'])
+
+        with open(junit, 'w') as fx:
+            fx.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            fx.write('<testsuite name="comptests" tests="%d" failures="%d" '
+                     'errors="%d" skipped="%d" time="%.3f">\n' %
+                     (counts['tests'], counts['failures'], counts['errors'],
+                      counts['skipped'], counts['time']))
+            body.seek(0)
+            for line in body:
+                fx.write(line)
+            fx.write('</testsuite>\n')
+    return counts
+
+
+def update_counts(counts, status, duration):
+    counts['tests'] += 1
+    counts['time'] += duration
+    if status == FAILED:
+        counts['failures'] += 1
+    elif status == ERROR:
+        counts['errors'] += 1
+    elif status in [SKIPPED, BLOCKED]:
+        counts['skipped'] += 1
+
+
+def iterate_all_records(outcomes, nose, db):
+    """ Yields the records of the comptests jobs, then the nose tests. """
+    comptests = read_outcomes(outcomes, db=db)
+    for job_id in sorted(comptests):
+        r = comptests[job_id]
+        yield dict(source='comptests',
+                   job_id=r['job_id'],
+                   module=r.get('module'),
+                   function=r['function'],
+                   objspecs=r.get('objspecs', []),
+                   objects=r.get('objects', []),
+                   status=r['status'],
+                   message=r.get('message'),
+                   traceback=r.get('traceback'),
+                   duration=r.get('duration', 0.0),
+                   attempts=r.get('attempts', 1),
+                   flaky=r.get('flaky', False))
+
+    if os.path.exists(nose):
+        for fn in sorted(os.listdir(nose)):
+            if fn.endswith('.xml'):
+                for r in iterate_nose_records(os.path.join(nose, fn)):
+                    yield r
+
+
+def iterate_nose_records(filename):
+    """ Converts the testcases of a nose xunit file to records. """
+    for _, elem in ET.iterparse(filename):
+        if elem.tag != 'testcase':
+            continue
+        classname = elem.get('classname', '')
+        name = elem.get('name', '')
+        status, message, tb = OK, None, None
+        for tag, s in [('failure', FAILED), ('error', ERROR),
+                       ('skipped', SKIPPED)]:
+            child = elem.find(tag)
+            if child is not None:
+                status = s
+                message = child.get('message')
+                tb = child.text
+        yield dict(source='nose',
+                   job_id='%s.%s' % (classname, name),
+                   module=classname.split('.')[0],
+                   function=name,
+                   objspecs=[],
+                   objects=[],
+                   status=status,
+                   message=message,
+                   traceback=tb,
+                   duration=float(elem.get('time', 0)))
+        elem.clear()
+
+
+def testcase_xml(record):
+    """ Returns the <testcase> element for the record, as a string. """
+    if record['source'] == 'nose':
+        classname, _, name = record['job_id'].rpartition('.')
+    else:
+        classname = 'comptests.%s' % record['function']
+        name = record['job_id']
+    tc = ET.Element('testcase', classname=classname, name=name,
+                    time='%.3f' % record['duration'])
+
+    if record['objspecs'] or record['objects']:
+        properties = ET.SubElement(tc, 'properties')
+        for objspec in record['objspecs']:
+            ET.SubElement(properties, 'property', name='objspec', value=objspec)
+        for id_object in record['objects']:
+            ET.SubElement(properties, 'property', name='object',
+                          value=id_object)
+
+    status = record['status']
+    message = record['message'] or ''
+    if status in [FAILED, ERROR]:
+        tag = 'failure' if status == FAILED else 'error'
+        e = ET.SubElement(tc, tag, message=message)
+        e.text = record['traceback'] or message
+    elif status in [SKIPPED, BLOCKED]:
+        ET.SubElement(tc, 'skipped', message=message or status)
+    elif status == PARTIALLY_SKIPPED:
+        e = ET.SubElement(tc, 'system-out')
+        e.text = 'Partially skipped: %s' % message
+    if record.get('flaky'):
+        e = ET.SubElement(tc, 'system-err')
+        e.text = 'Flaky: passed at attempt %d' % record['attempts']
+
+    # (non-ASCII characters become character references)
+    return ET.tostring(tc)
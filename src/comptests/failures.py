@@ -0,0 +1,101 @@
+import json
+import os
+import time
+
+from contracts import contract
+
+from .segments import (SegmentLog, get_output_path, get_segment_log,
+                       iterate_segments)
+
+
+__all__ = [
+    'FailuresLog',
+    'get_failures_log',
+    'build_failures_index',
+    'query_failures',
+]
+
+
+def get_failures_dir(output_dir=None):
+    return get_output_path('comptests-failures', output_dir)
+
+
+class FailuresLog(SegmentLog):
+    """ Log of the expected failures (see check_fails). """
+
+    def append(self, job_id, function, exception, message, traceback):
+        record = dict(job_id=job_id, function=function, exception=exception,
+                      message=message, traceback=traceback,
+                      timestamp=time.time())
+        self.append_record(record)
+
+
+def get_failures_log():
+    return get_segment_log(FailuresLog, get_failures_dir())
+
+
+@contract(dirname='None|str', returns='dict')
+def build_failures_index(dirname=None):
+    """
+        Creates the file index.json in dirname, with the location
+        of the records by job id, function and exception type.
+    """
+    if dirname is None:
+        dirname = get_failures_dir()
+    index = dict(job_id={}, function={}, exception={})
+    for segment, offset, r in iterate_segments(dirname):
+        location = [segment, offset]
+        index['job_id'].setdefault(r['job_id'], []).append(location)
+        index['function'].setdefault(r['function'], []).append(location)
+        index['exception'].setdefault(r['exception'], []).append(location)
+
+    with open(os.path.join(dirname, 'index.json'), 'w') as f:
+        json.dump(index, f)
+    return index
+
+
+def index_is_current(dirname):
+    """ True if index.json is newer than all the segments. """
+    index_fn = os.path.join(dirname, 'index.json')
+    if not os.path.exists(index_fn):
+        return False
+    t = os.path.getmtime(index_fn)
+    for segment in os.listdir(dirname):
+        if segment.endswith('.jsonl'):
+            if os.path.getmtime(os.path.join(dirname, segment)) >= t:
+                return False
+    return True
+
+
+def query_failures(dirname=None, job_id=None, function=None,
+                   exception=None):
+    """
+        Returns the list of records matching all the given criteria,
+        using (and creating if needed) the index.
+    """
+    if dirname is None:
+        dirname = get_failures_dir()
+    index_fn = os.path.join(dirname, 'index.json')
+    if index_is_current(dirname):
+        with open(index_fn) as f:
+            index = json.load(f)
+    else:
+        index = build_failures_index(dirname)
+
+    locations = None
+    for key, value in [('job_id', job_id), ('function', function),
+                       ('exception', exception)]:
+        if value is None:
+            continue
+        found = set(tuple(l) for l in index[key].get(value, []))
+        locations = found if locations is None else locations & found
+
+    if locations is None:
+        return [r for _, _, r in iterate_segments(dirname)]
+
+    records = []
+    for segment, offset in sorted(locations):
+        with open(os.path.join(dirname, segment)) as f:
+            f.seek(offset)
+            records.append(json.loads(f.readline()))
+    return records
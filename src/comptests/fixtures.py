@@ -0,0 +1,229 @@
+from collections import defaultdict
+import inspect
+
+from compmake import Promise
+from conf_tools import ObjectSpec
+from contracts import contract
+
+from .serializers import serialize
+from .transport import transport_load
+
+
+__all__ = [
+    'comptests_fixture',
+    'comptests_pair_fixture',
+]
+
+
+class ComptestsFixtures(object):
+    """ Static storage """
+    objspec2fixtures = defaultdict(dict)  # name -> fixture name -> f
+    objspecs2fixtures = defaultdict(dict)  # (name1, name2) -> fixture name -> f
+
+
+@contract(objspec=ObjectSpec)
+def comptests_fixture(objspec):
+    """
+        Returns a decorator for a fixture of the objects of objspec:
+        a function taking (id_object, object) that is computed once
+        per object, in its own job. Its result is passed to the tests
+        of objspec (and to the pair tests) having a parameter
+        with the same name as the fixture:
+
+            @comptests_fixture(robots)
+            def robot_spec(id_robot, robot):
+                ...
+
+            @for_all_robots
+            def check_spec(id_robot, robot, robot_spec):
+                ...
+    """
+    def register(f):
+        ComptestsFixtures.objspec2fixtures[objspec.name][f.__name__] = f
+        return f
+    return register
+
+
+@contract(objspec1=ObjectSpec, objspec2=ObjectSpec)
+def comptests_pair_fixture(objspec1, objspec2):
+    """
+        Returns a decorator for a fixture of the pairs of objects:
+        a function taking (id_ob1, ob1, id_ob2, ob2) that is computed
+        once per pair and passed to the pair tests of objspec1 and objspec2.
+    """
+    def register(f):
+        key = (objspec1.name, objspec2.name)
+        ComptestsFixtures.objspecs2fixtures[key][f.__name__] = f
+        return f
+    return register
+
+
+def get_fixture_params(f, nfixed):
+    """
+        Returns the parameters of the test f after the first nfixed ones
+        and without a default value: the fixtures it uses.
+        The wrappers (such as BenchmarkWrap) are looked through.
+    """
+    while not inspect.isfunction(f) and hasattr(f, 'f'):
+        f = f.f
+    try:
+        spec = inspect.getargspec(f)
+    except TypeError:  # not a Python function
+        return []
+    ndefaults = len(spec.defaults or ())
+    return spec.args[nfixed:len(spec.args) - ndefaults]
+
+
+def fixtures_used_by(f, dynamic, name1, name2=None):
+    """
+        Returns the fixtures used by the test f of objspec name1 (or of
+        the pairs of name1 and name2), as a dict parameter -> (which, fixture),
+        where which is 1 or 2 for the fixture of the first or second
+        object, and 0 for a pair fixture.
+    """
+    nfixed = (2 if name2 is None else 4) + (1 if dynamic else 0)
+    res = {}
+    for param in get_fixture_params(f, nfixed):
+        if name2 is not None:
+            pair = ComptestsFixtures.objspecs2fixtures.get((name1, name2), {})
+            if param in pair:
+                res[param] = (0, pair[param])
+                continue
+        found = []
+        for which, name in [(1, name1), (2, name2)]:
+            fixtures = ComptestsFixtures.objspec2fixtures.get(name, {})
+            if name is not None and param in fixtures:
+                found.append((which, fixtures[param]))
+        if not found:
+            msg = ('Test %s has the parameter %r, but there is no fixture '
+                   'with that name for %s.' %
+                   (f.__name__, param, ' or '.join(filter(None, [name1, name2]))))
+            raise ValueError(msg)
+        if len(found) > 1:
+            msg = ('Test %s: the fixture %r exists for both %s and %s; use '
+                   'comptests_pair_fixture().' % (f.__name__, param, name1, name2))
+            raise ValueError(msg)
+        res[param] = found[0]
+    return res
+
+
+@contract(registrations='dict(str:dict)', returns='dict(str:dict)')
+def add_fixtures_used(registrations):
+    """
+        Returns a copy of registrations (see get_registrations()) in which
+        each test has the key "fixtures" (see fixtures_used_by()).
+    """
+    res = {}
+    for name, r in registrations.items():
+        res[name] = {}
+        for k, tests in r.items():
+            res[name][k] = []
+            for x in tests:
+                if k == 'batched':  # they take all the objects at once
+                    res[name][k].append(dict(x, fixtures={}))
+                    continue
+                name2 = x['objspec2'].name if 'objspec2' in x else None
+                fixtures = fixtures_used_by(x['function'], x['dynamic'],
+                                            name, name2)
+                res[name][k].append(dict(x, fixtures=fixtures))
+    return res
+
+
+@contract(registrations='dict(str:dict)', returns='dict(str:dict(str:*))')
+def get_needed_fixtures(registrations):
+    """
+        Returns the per-object fixtures used by the tests, as a dict
+        objspec name -> fixture name -> function.
+    """
+    needed = defaultdict(dict)
+    for name, r in registrations.items():
+        for tests in r.values():
+            for x in tests:
+                names = (name, x['objspec2'].name if 'objspec2' in x else None)
+                for param, (which, f) in x['fixtures'].items():
+                    if which > 0:
+                        needed[names[which - 1]][param] = f
+    return dict(needed)
+
+
+@contract(names2test_objects='dict(str:dict(str:str))',
+          needed='dict(str:dict(str:*))',
+          returns='dict(str:dict(str:dict(str:str)))')
+def get_fixtures_promises(context, names2test_objects, needed, serializer=None):
+    """
+        Defines the jobs of the fixtures in needed (see get_needed_fixtures())
+        for each instanced object; returns
+        objspec name -> fixture name -> id_object -> job_id.
+        If serializer is given, the fixtures are stored serialized.
+    """
+    params = {} if serializer is None else dict(serializer=serializer)
+    fixtures = {}
+    for name in sorted(needed):
+        objects = names2test_objects.get(name, {})
+        fixtures[name] = {}
+        for fixture_name in sorted(needed[name]):
+            f = needed[name][fixture_name]
+            promises = {}
+            for id_object in sorted(objects):
+                ob = Promise(objects[id_object])
+                job_id = '%s-%s-%s' % (name, fixture_name, id_object)
+                job = context.comp_config(compute_fixture, f, id_object, ob,
+                                          job_id=job_id,
+                                          command_name=fixture_name, **params)
+                promises[id_object] = job.job_id
+            fixtures[name][fixture_name] = promises
+    return fixtures
+
+
+class FixtureJobs(object):
+    """
+        The fixtures for the tests defined by define_tests_for():
+        the per-object ones were defined by get_fixtures_promises();
+        the ones for pairs are defined here, the first time they are used.
+    """
+
+    @contract(fixtures='dict(str:dict(str:dict(str:str)))')
+    def __init__(self, context, fixtures, serializer=None):
+        self.context = context
+        self.fixtures = fixtures
+        self.serializer = serializer
+        self.pairs = {}
+
+    def get_promises(self, used, objspecs, ids, obs):
+        """ Returns the dict parameter -> Promise to pass to the test. """
+        res = {}
+        for param, (which, f) in used.items():
+            if which == 0:
+                res[param] = self.get_pair_promise(f, objspecs, ids, obs)
+            else:
+                name, id_object = objspecs[which - 1], ids[which - 1]
+                res[param] = Promise(self.fixtures[name][param][id_object])
+        return res
+
+    def get_pair_promise(self, f, objspecs, ids, obs):
+        key = (objspecs[1], f.__name__, ids[0], ids[1])
+        if not key in self.pairs:
+            job_id = '%s-%s-%s-%s' % key
+            params = dict(job_id=job_id, command_name=f.__name__)
+            if self.serializer is not None:
+                params['serializer'] = self.serializer
+            self.pairs[key] = self.context.comp_config(compute_pair_fixture,
+                                                       f, ids[0], obs[0],
+                                                       ids[1], obs[1], **params)
+        return self.pairs[key]
+
+
+def compute_fixture(f, id_ob, ob, serializer=None):
+    ob = transport_load(ob)
+    return serialize(f(id_ob, ob), serializer)
+
+
+def compute_pair_fixture(f, id_ob1, ob1, id_ob2, ob2, serializer=None):
+    ob1 = transport_load(ob1)
+    ob2 = transport_load(ob2)
+    return serialize(f(id_ob1, ob1, id_ob2, ob2), serializer)
+
+
+def load_fixtures(fixtures):
+    """ Returns the values of the fixtures received by a test job. """
+    return dict((k, transport_load(v)) for k, v in (fixtures or {}).items())
@@ -0,0 +1,368 @@
+import os
+import socket
+import sqlite3
+import subprocess
+import time
+
+from contracts import contract
+from quickapp import QuickAppBase
+
+from .outcomes import (ERROR, FAILED, SKIPPED, get_outcomes_log, read_outcomes)
+from .segments import get_output_path
+
+
+__all__ = [
+    'HistoryDB',
+    'record_run',
+    'CompTestsHistory',
+    'main_comptests_history',
+]
+
+
+def get_history_db(output_dir=None):
+    return get_output_path('comptests-history.sqlite', output_dir)
+
+schema = """
+    CREATE TABLE IF NOT EXISTS runs (
+        run_id INTEGER PRIMARY KEY,
+        timestamp REAL,
+        commit_id TEXT,
+        host TEXT,
+        modules TEXT
+    );
+    CREATE TABLE IF NOT EXISTS outcomes (
+        run_id INTEGER REFERENCES runs(run_id),
+        job_id TEXT,
+        function TEXT,
+        objspecs TEXT,
+        objects TEXT,
+        status TEXT,
+        duration REAL,
+        message TEXT,
+        timestamp REAL,
+        attempts INTEGER DEFAULT 1,
+        flaky INTEGER DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS outcomes_job ON outcomes(job_id, run_id);
+    CREATE INDEX IF NOT EXISTS outcomes_function ON outcomes(function);
+    CREATE INDEX IF NOT EXISTS outcomes_status ON outcomes(status);
+"""
+
+# columns added after the first version: name -> definition
+added_columns = {
+    'attempts': 'INTEGER DEFAULT 1',
+    'flaky': 'INTEGER DEFAULT 0',
+}
+
+failing = (FAILED, ERROR)
+
+
+class HistoryDB(object):
+    """
+        SQLite database with the outcomes of all runs: one row in "runs"
+        for each run, one row in "outcomes" for each job executed in it.
+        The objspecs and objects are stored comma-separated.
+    """
+
+    @contract(filename='None|str')
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = get_history_db()
+        d = os.path.dirname(filename)
+        if d and not os.path.exists(d):
+            os.makedirs(d)
+        self.conn = sqlite3.connect(filename)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(schema)
+        columns = [row[1] for row in
+                   self.conn.execute('PRAGMA table_info(outcomes)')]
+        for name, definition in sorted(added_columns.items()):
+            if not name in columns:
+                self.conn.execute('ALTER TABLE outcomes ADD COLUMN %s %s' %
+                                  (name, definition))
+
+    def close(self):
+        self.conn.close()
+
+    @contract(records='list(dict)', modules='list(str)', returns='int')
+    def add_run(self, records, commit_id=None, modules=[], timestamp=None):
+        """ Adds a run with the given outcomes; returns its run_id. """
+        with self.conn:
+            c = self.conn.execute('INSERT INTO runs (timestamp, commit_id, '
+                                  'host, modules) VALUES (?, ?, ?, ?)',
+                                  (timestamp or time.time(), commit_id,
+                                   socket.gethostname(), ','.join(modules)))
+            run_id = c.lastrowid
+            rows = [(run_id, r['job_id'], r['function'],
+                     ','.join(r.get('objspecs', [])),
+                     ','.join(r.get('objects', [])),
+                     r['status'], r.get('duration', 0.0), r.get('message'),
+                     r.get('timestamp'), r.get('attempts', 1),
+                     int(r.get('flaky', False)))
+                    for r in records]
+            self.conn.executemany('INSERT INTO outcomes (run_id, job_id, '
+                                  'function, objspecs, objects, status, '
+                                  'duration, message, timestamp, attempts, '
+                                  'flaky) VALUES '
+                                  '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return run_id
+
+    def runs(self, limit=20):
+        """ Returns the last runs, with the number of outcomes and failures. """
+        q = ('SELECT runs.*, COUNT(outcomes.job_id) AS njobs, '
+             'SUM(outcomes.status IN (?, ?)) AS nfailed '
+             'FROM runs LEFT JOIN outcomes USING (run_id) '
+             'GROUP BY run_id ORDER BY run_id DESC LIMIT ?')
+        return self.conn.execute(q, failing + (limit,)).fetchall()
+
+    def outcomes(self, job=None, function=None, obj=None, status=None,
+                 limit=100):
+        """
+            Returns the outcomes (with the run's commit_id), most recent
+            first. The filters accept "*" as a wildcard.
+        """
+        where, args = self._where(job, function, obj)
+        if status is not None:
+            where.append('status = ?')
+            args.append(status)
+        q = ('SELECT outcomes.*, runs.commit_id FROM outcomes '
+             'JOIN runs USING (run_id) %s '
+             'ORDER BY run_id DESC, job_id LIMIT ?' % _and(where))
+        return self.conn.execute(q, args + [limit]).fetchall()
+
+    def first_failures(self, job=None, function=None, obj=None):
+        """
+            For each job that is failing in its last outcome, returns
+            the first outcome of the current streak of failures
+            (that is, when it started failing) and the last success before.
+        """
+        where, args = self._where(job, function, obj)
+        q = ('SELECT job_id, MAX(run_id) AS last_run FROM outcomes %s '
+             'GROUP BY job_id' % _and(where))
+        res = []
+        for row in self.conn.execute(q, args).fetchall():
+            job_id = row['job_id']
+            last = self._outcome(job_id, row['last_run'])
+            if not last['status'] in failing:
+                continue
+            q = ('SELECT MAX(run_id) FROM outcomes WHERE job_id = ? '
+                 'AND status NOT IN (?, ?)')
+            last_ok = self.conn.execute(q, (job_id,) + failing).fetchone()[0]
+            q = ('SELECT MIN(run_id) FROM outcomes WHERE job_id = ? '
+                 'AND run_id > ?')
+            first_run = self.conn.execute(q, (job_id, last_ok or 0)).fetchone()[0]
+            res.append(dict(job_id=job_id,
+                            first=self._outcome(job_id, first_run),
+                            last_ok=(self._outcome(job_id, last_ok)
+                                     if last_ok is not None else None)))
+        return res
+
+    def slower(self, factor=1.5, min_duration=0.01, previous=5,
+               job=None, function=None, obj=None):
+        """
+            Returns the jobs whose duration in their last run is more than
+            factor times the mean of the "previous" runs before,
+            as (job_id, last duration, mean before), slowest first.
+        """
+        where, args = self._where(job, function, obj)
+        where.append('status != ?')
+        args.append(SKIPPED)
+        q = ('SELECT job_id, run_id, duration FROM outcomes %s '
+             'ORDER BY job_id, run_id DESC' % _and(where))
+        res = []
+        current = None
+        durations = []
+
+        def check():
+            if len(durations) < 2:
+                return
+            last = durations[0]
+            before = durations[1:previous + 1]
+            mean = sum(before) / len(before)
+            if last > min_duration and last > factor * mean:
+                res.append((current, last, mean))
+
+        for row in self.conn.execute(q, args):
+            if row['job_id'] != current:
+                check()
+                current = row['job_id']
+                durations = []
+            durations.append(row['duration'])
+        check()
+        return sorted(res, key=lambda x: -x[1] / max(x[2], 1e-9))
+
+    def flakiness(self, min_rate=0.0, job=None, function=None, obj=None):
+        """
+            Returns, for each (function, objects), the number of executions,
+            of flaky passes and of failures, and the flakiness rate
+            (flaky / executions), highest rate first.
+        """
+        where, args = self._where(job, function, obj)
+        where.append('status != ?')
+        args.append(SKIPPED)
+        q = ('SELECT function, objects, COUNT(*) AS n, SUM(flaky) AS nflaky, '
+             'SUM(status IN (?, ?)) AS nfailed, '
+             'CAST(SUM(flaky) AS REAL) / COUNT(*) AS rate '
+             'FROM outcomes %s GROUP BY function, objects '
+             'HAVING SUM(flaky) > 0 AND rate >= ? '
+             'ORDER BY rate DESC, n DESC' % _and(where))
+        return self.conn.execute(q, failing + tuple(args) + (min_rate,)).fetchall()
+
+    def _outcome(self, job_id, run_id):
+        q = ('SELECT outcomes.*, runs.commit_id FROM outcomes '
+             'JOIN runs USING (run_id) WHERE job_id = ? AND run_id = ?')
+        return self.conn.execute(q, (job_id, run_id)).fetchone()
+
+    def _where(self, job, function, obj):
+        where = []
+        args = []
+        for column, pattern in [('job_id', job), ('function', function)]:
+            if pattern is not None:
+                where.append('%s GLOB ?' % column)
+                args.append(pattern)
+        if obj is not None:
+            # one of the comma-separated objects
+            where.append("(',' || objects || ',') GLOB ?")
+            args.append('*,%s,*' % obj)
+        return where, args
+
+
+def _and(where):
+    return ('WHERE ' + ' AND '.join(where)) if where else ''
+
+
+def get_commit_id(dirname):
+    """ Returns the git commit of the directory, or None. """
+    try:
+        p = subprocess.Popen(['git', 'rev-parse', 'HEAD'], cwd=dirname,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, _ = p.communicate()
+    except OSError:
+        return None
+    if p.returncode != 0:
+        return None
+    return out.strip().decode('ascii')
+
+
+@contract(modules='list(str)', since='float|int', returns='None|int')
+def record_run(modules, since, filename=None, outcomes=None, db=None,
+               commit_id=None):
+    """
+        Appends to the history the outcomes recorded after the
+        time "since" (the jobs executed by this run), and the jobs
+        that failed or were blocked in the compmake db. Returns the run_id,
+        or None if nothing was executed.
+    """
+    get_outcomes_log().flush()  # the jobs executed by this process
+    records = [r for r in read_outcomes(outcomes, db=db).values()
+               if (r['timestamp'] or 0) >= since]
+    if not records:
+        return None
+    if commit_id is None and modules:
+        from conf_tools import import_name
+        try:
+            module = import_name(modules[0])
+            commit_id = get_commit_id(os.path.dirname(module.__file__))
+        except ValueError:
+            pass
+    history = HistoryDB(filename)
+    try:
+        return history.add_run(sorted(records, key=lambda r: r['job_id']),
+                               commit_id=commit_id, modules=modules)
+    finally:
+        history.close()
+
+
+class CompTestsHistory(QuickAppBase):
+    """
+        Queries the history of the outcomes of the comptests jobs,
+        across runs.
+    """
+
+    cmd = 'comptests-history'
+
+    def define_program_options(self, params):
+        params.add_string('output', short='o', default='out-comptests',
+                          help='Output directory of the comptests runs')
+        params.add_string('db', default=None,
+                          help='History database (default: in the output '
+                               'directory)')
+        params.add_string('query', default='outcomes',
+                          help='One of: runs, outcomes, first_failures, '
+                               'slower, flaky')
+        params.add_string('job', default=None, help='Job id (wildcards: *)')
+        params.add_string('function', default=None, help='Test function')
+        params.add_string('object', default=None, help='Object id')
+        params.add_string('status', default=None, help='Only this status')
+        params.add_float('factor', default=1.5,
+                         help='For "slower": ratio to the mean of the '
+                              'previous runs')
+        params.add_int('limit', default=50, help='Maximum number of rows')
+
+    def go(self):
+        options = self.get_options()
+        filename = options.db or get_history_db(options.output)
+        if not os.path.exists(filename):
+            self.error('History %r does not exist.' % filename)
+            return 1
+        history = HistoryDB(str(filename))
+        f = lambda x: None if x is None else str(x)
+        filters = dict(job=f(options.job), function=f(options.function),
+                       obj=f(options.object))
+        query = options.query
+        if query == 'runs':
+            for r in history.runs(limit=options.limit):
+                print('run %4d  %s  %s  %4d jobs  %4d failed  %s' %
+                      (r['run_id'], format_time(r['timestamp']),
+                       r['commit_id'] or '-', r['njobs'], r['nfailed'] or 0,
+                       r['modules']))
+        elif query == 'outcomes':
+            for r in history.outcomes(status=f(options.status),
+                                      limit=options.limit, **filters):
+                print(format_outcome(r))
+        elif query == 'first_failures':
+            for x in history.first_failures(**filters):
+                print('%s: failing since run %d (%s)' %
+                      (x['job_id'], x['first']['run_id'],
+                       format_time(x['first']['timestamp'])))
+                print('    %s' % format_outcome(x['first']))
+                if x['last_ok'] is None:
+                    print('    (never passed)')
+                else:
+                    print('    last success: %s' % format_outcome(x['last_ok']))
+        elif query == 'slower':
+            slower = history.slower(factor=options.factor, **filters)
+            for job_id, last, mean in slower[:options.limit]:
+                print('%8.3f s (was %8.3f s, x%.1f)  %s' %
+                      (last, mean, last / max(mean, 1e-9), job_id))
+        elif query == 'flaky':
+            for r in history.flakiness(**filters)[:options.limit]:
+                print('%5.1f%% flaky (%d of %d runs, %d failed)  %s(%s)' %
+                      (100 * r['rate'], r['nflaky'], r['n'], r['nfailed'],
+                       r['function'], r['objects']))
+        else:
+            self.error('Unknown query %r.' % query)
+            return 1
+        history.close()
+        return 0
+
+
+main_comptests_history = CompTestsHistory.get_sys_main()
+
+
+def format_time(timestamp):
+    if timestamp is None:
+        return '-'
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+def format_outcome(r):
+    s = 'run %4d  %-8s %8.3f s  %s' % (r['run_id'], r['status'],
+                                       r['duration'] or 0.0, r['job_id'])
+    if r['commit_id']:
+        s += '  @%s' % r['commit_id'][:8]
+    if r['flaky']:
+        s += '  flaky (%d attempts)' % r['attempts']
+    if r['message']:
+        s += '  (%s)' % r['message'].split('\n')[0][:80]
+    return s
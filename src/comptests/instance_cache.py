@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import sys
+import zlib
+
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: no cover
+    import pickle
+
+from contracts import contract
+from quickapp import logger
+
+
+__all__ = [
+    'InstanceCache',
+    'get_instance_key',
+]
+
+
+class InstanceCache():
+    """
+        A persistent store for the instanced test objects, shared between
+        output directories (and runs on the same machine). The objects
+        are stored in files named after their key (see get_instance_key()),
+        pickled and optionally compressed; when the total size exceeds
+        max_size bytes, the least recently used ones are removed.
+        The salt is added to the keys, to invalidate the objects by hand.
+    """
+
+    # dirname -> total size of the objects, as known by this process;
+    # the instances of the class are pickled in the jobs, so it is not
+    # an attribute
+    sizes = {}
+
+    @contract(dirname='str', max_size='int,>=0', compress='bool', salt='str')
+    def __init__(self, dirname, max_size, compress=False, salt=''):
+        self.dirname = dirname
+        self.max_size = max_size
+        self.compress = compress
+        self.salt = salt
+
+    def get_filename(self, key):
+        ext = '.pickle.z' if self.compress else '.pickle'
+        return os.path.join(self.dirname, key[:2], key + ext)
+
+    def get(self, key):
+        """ Returns (True, object) if key is in the cache, else (False, None). """
+        fn = self.get_filename(key)
+        try:
+            with open(fn, 'rb') as f:
+                data = f.read()
+            if self.compress:
+                data = zlib.decompress(data)
+            ob = pickle.loads(data)
+        except (IOError, OSError):
+            return False, None
+        except Exception as e:  # truncated or from another version
+            logger.warn('Ignoring the cached object %s: %s' % (fn, e))
+            return False, None
+        try:
+            os.utime(fn, None)  # for the LRU order
+        except OSError:  # evicted meanwhile
+            pass
+        return True, ob
+
+    def put(self, key, ob):
+        try:
+            data = pickle.dumps(ob, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warn('Cannot cache the object %s: %s' % (key, e))
+            return
+        if self.compress:
+            data = zlib.compress(data, 1)
+        fn = self.get_filename(key)
+        d = os.path.dirname(fn)
+        if not os.path.exists(d):
+            try:
+                os.makedirs(d)
+            except OSError:  # created by another process
+                pass
+        size = self.get_size()
+        try:
+            size -= os.path.getsize(fn)
+        except OSError:
+            pass
+        # written atomically, as other processes might be reading it
+        tmp = '%s.tmp%d' % (fn, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, fn)
+        InstanceCache.sizes[self.dirname] = size + len(data)
+        if size + len(data) > self.max_size:
+            self.evict()
+
+    def get_size(self):
+        """ The total size, read from the directory only the first time. """
+        if not self.dirname in InstanceCache.sizes:
+            entries = self.get_entries()
+            InstanceCache.sizes[self.dirname] = sum(size for _, size, _ in entries)
+        return InstanceCache.sizes[self.dirname]
+
+    def get_entries(self):
+        """ Returns the list of (last use, size, filename), oldest first. """
+        entries = []
+        if not os.path.exists(self.dirname):
+            return entries
+        for d in os.listdir(self.dirname):
+            dirname = os.path.join(self.dirname, d)
+            if not os.path.isdir(dirname):
+                continue
+            for name in os.listdir(dirname):
+                if not '.pickle' in name or '.tmp' in name:
+                    continue
+                fn = os.path.join(dirname, name)
+                try:
+                    st = os.stat(fn)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fn))
+        return sorted(entries)
+
+    def evict(self):
+        """
+            Removes the least recently used objects, down to 90% of
+            max_size, so that the next puts do not evict again.
+        """
+        entries = self.get_entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_size:
+            for _, size, fn in entries:
+                if total <= self.max_size * 0.9:
+                    break
+                try:
+                    os.unlink(fn)
+                except OSError:
+                    pass
+                total -= size
+        InstanceCache.sizes[self.dirname] = total
+
+
+def get_instance_key(objspec, id_object, salt=''):
+    """
+        Returns the key of the instance of id_object: a hash of its spec,
+        of the version and the source of the top-level packages of the
+        classes it uses, and of the salt, so that changing any of them
+        invalidates the cached object.
+    """
+    spec = objspec[id_object]
+    packages = sorted(set(c.split('.')[0] for c in get_constructors(spec)))
+    d = dict(objspec=objspec.name, spec=spec,
+             packages=[(p,) + get_package_version(p) for p in packages],
+             python=list(sys.version_info[:2]), salt=salt)
+    s = json.dumps(d, sort_keys=True, default=repr)
+    return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+
+def get_constructors(x):
+    """ Returns the names of the classes/functions in the "code" entries. """
+    if isinstance(x, dict):
+        code = x.get('code')
+        if isinstance(code, (list, tuple)) and code and isinstance(code[0], str):
+            yield code[0]
+        for v in x.values():
+            for c in get_constructors(v):
+                yield c
+    elif isinstance(x, (list, tuple)):
+        for v in x:
+            for c in get_constructors(v):
+                yield c
+
+
+# package -> (version, hash of the source), computed once per process
+package_versions = {}
+
+
+def get_package_version(package):
+    """
+        Returns the version of the package (None if unknown) and the hash
+        of all its Python source files (None if it cannot be imported).
+    """
+    if not package in package_versions:
+        package_versions[package] = (get_distribution_version(package),
+                                     get_source_hash(package))
+    return package_versions[package]
+
+
+def get_distribution_version(package):
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution(package).version
+    except Exception:  # not installed as a distribution
+        pass
+    module = sys.modules.get(package)
+    return getattr(module, '__version__', None)
+
+
+def get_source_hash(package):
+    try:
+        __import__(package)
+        fn = sys.modules[package].__file__
+    except Exception:  # will fail when instancing
+        return None
+    if os.path.basename(fn).split('.')[0] != '__init__':
+        filenames = [fn[:-1] if fn.endswith(('.pyc', '.pyo')) else fn]
+        root = os.path.dirname(fn)
+    else:
+        root = os.path.dirname(fn)
+        filenames = []
+        for dirpath, dirnames, files in os.walk(root):
+            dirnames.sort()
+            filenames.extend(os.path.join(dirpath, f) for f in sorted(files)
+                             if f.endswith('.py'))
+    h = hashlib.sha1()
+    for fn in filenames:
+        h.update(os.path.relpath(fn, root).encode('utf-8'))
+        try:
+            with open(fn, 'rb') as f:
+                h.update(f.read())
+        except IOError:
+            pass
+    return h.hexdigest()
@@ -6,6 +6,8 @@ import os
 import tempfile
 import warnings
 
+from .segments import get_output_path
+
 
 __all__ = ['jobs_nosetests']
 
@@ -20,44 +22,57 @@ def create_tmp_dir():
     except:
         raise
 
-def jobs_nosetests(context, module, do_coverage=False):
+def jobs_nosetests(context, module, do_coverage=False, output_dir=None):
     """ Instances the mcdp_lang_tests for the given module. """
     if do_coverage:
         try: 
             import coverage  # @UnusedImport
         except ImportError as e:
             print('No coverage module found: %s' % e)
-            context.comp(call_nosetests, module, 
+            context.comp(call_nosetests, module, output_dir,
                          job_id='nosetests')
         else:
-            covdata = context.comp(call_nosetests_plus_coverage, module, 
-                                   job_id='nosetests')
+            covdata = context.comp(call_nosetests_plus_coverage, module,
+                                   output_dir, job_id='nosetests')
             if do_coverage:
                 outdir = os.path.join(context.get_output_dir(), 'coverage')
                 context.comp(write_coverage_report, outdir, covdata, module)
             else:
                 warnings.warn('Skipping coverage report.')
     else:
-        context.comp(call_nosetests, module, 
+        context.comp(call_nosetests, module, output_dir,
                      job_id='nosetests')
         
-def call_nosetests(module):
+def get_nose_dir(output_dir=None):
+    """ The nose results in xunit format, read by comptests-export. """
+    return get_output_path('comptests-nose', output_dir)
+
+def get_xunit_args(module, output_dir=None):
+    dirname = get_nose_dir(output_dir)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    fn = os.path.abspath(os.path.join(dirname, '%s.xml' % module))
+    return ['--with-xunit', '--xunit-file=%s' % fn]
+
+def call_nosetests(module, output_dir=None):
+    xunit_args = get_xunit_args(module, output_dir)
     with create_tmp_dir() as cwd:
-        cmd = ['nosetests', module]
+        cmd = ['nosetests'] + xunit_args + [module]
         system_cmd_result(
             cwd=cwd, cmd=cmd,
             display_stdout=True,
             display_stderr=True,
             raise_on_error=True)
 
-def call_nosetests_plus_coverage(module):
+def call_nosetests_plus_coverage(module, output_dir=None):
     """ 
         This also calls the coverage module. 
         It returns the .coverage file as a string. 
     """
+    xunit_args = get_xunit_args(module, output_dir)
     with create_tmp_dir() as cwd:
         prog = find_command_path('nosetests')
-        cmd = [prog, module]
+        cmd = [prog] + xunit_args + [module]
         
         # note: coverage -> python-coverage in Ubuntu14
         cmd = ['coverage', 'run'] + cmd
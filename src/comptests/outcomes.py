@@ -0,0 +1,162 @@
+import time
+import traceback
+
+from compmake.jobs.job_execution import JobCompute
+from compmake.jobs.storage import all_jobs, get_job, get_job_cache, job_exists
+from compmake.structures import Cache
+
+from .results import BenchmarkResult, Flaky, PartiallySkipped, Skipped
+from .segments import (SegmentLog, get_output_path, get_segment_log,
+                       iterate_segments, set_output_dir)
+
+
+__all__ = [
+    'OutcomesLog',
+    'record_outcome',
+    'read_outcomes',
+]
+
+
+def get_outcomes_dir(output_dir=None):
+    return get_output_path('comptests-outcomes', output_dir)
+
+
+# Possible values of the "status" field
+OK = 'ok'
+SKIPPED = 'skipped'
+PARTIALLY_SKIPPED = 'partially_skipped'
+FAILED = 'failed'  # AssertionError or benchmark regression
+ERROR = 'error'  # any other exception
+BLOCKED = 'blocked'  # did not run because a dependency failed
+
+
+class OutcomesLog(SegmentLog):
+    """
+        Compact record of the outcome of each comptests job:
+        job_id, module, function, objspecs, objects, status, duration, message
+        (and attempts, flaky for the tests that passed after a retry).
+    """
+
+
+def get_outcomes_log():
+    return get_segment_log(OutcomesLog, get_outcomes_dir())
+
+
+class record_outcome(object):
+    """
+        Context manager used by the wrappers to record the outcome of
+        one test; the exceptions are recorded and passed through. ::
+
+            with record_outcome(f, objspecs, objects, output_dir) as outcome:
+                res = f(...)
+                outcome.set_result(res)
+
+        The records go to the output dir of the run (default: the last one
+        given), which is also used by the logs written by the test.
+    """
+    def __init__(self, function, objspecs, objects, output_dir=None):
+        set_output_dir(output_dir)
+        module = getattr(function, '__module__', None) or ''
+        self.record = dict(job_id=JobCompute.current_job_id,
+                           module=module.split('.')[0],
+                           function=function.__name__,
+                           objspecs=list(objspecs),
+                           objects=list(objects),
+                           status=OK,
+                           message=None)
+
+    def set_attempts(self, attempts, flaky):
+        """ The test was tried "attempts" times (see --retries); it is
+            flaky if the last attempt passed. """
+        self.record['attempts'] = attempts
+        self.record['flaky'] = flaky
+
+    def set_result(self, res):
+        status, message = status_from_result(res)
+        self.record['status'] = status
+        self.record['message'] = message
+
+    def __enter__(self):
+        self.t0 = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            if issubclass(exc_type, AssertionError):
+                self.record['status'] = FAILED
+            else:
+                self.record['status'] = ERROR
+            self.record['message'] = '%s: %s' % (exc_type.__name__, exc_value)
+            self.record['traceback'] = ''.join(traceback.format_exception(
+                                                    exc_type, exc_value, tb))
+        self.record['duration'] = time.time() - self.t0
+        self.record['timestamp'] = time.time()
+        get_outcomes_log().append_record(self.record)
+        return False
+
+
+class NoOutcome(object):
+    """ Stands for record_outcome() for the jobs which are not tests. """
+    def set_attempts(self, attempts, flaky):
+        pass
+
+    def set_result(self, res):
+        pass
+
+
+def status_from_result(res):
+    """ Returns the status and message for the value returned by a test. """
+    if isinstance(res, Flaky):
+        return status_from_result(res.get_result())
+    if isinstance(res, Skipped):
+        return SKIPPED, res.get_reason()
+    elif isinstance(res, PartiallySkipped):
+        return PARTIALLY_SKIPPED, 'no ' + ','.join(sorted(res.get_skipped_parts()))
+    elif isinstance(res, BenchmarkResult):
+        if res.is_regression():
+            return FAILED, res.get_string()
+        return OK, res.get_string()
+    return OK, None
+
+
+def read_outcomes(dirname=None, db=None):
+    """
+        Returns a dict job_id -> record with the latest outcome of each job.
+
+        If the compmake db is given, the outcomes of jobs that are not
+        in the DB anymore are ignored, and the jobs that failed or were 
+        blocked without recording an outcome (for example, because the
+        instance job failed) are added; the status is read from the
+        job cache only, not from the user objects.
+    """
+    if dirname is None:
+        dirname = get_outcomes_dir()
+    outcomes = {}
+    for _, _, r in iterate_segments(dirname):
+        job_id = r['job_id']
+        if (not job_id in outcomes or
+                outcomes[job_id]['timestamp'] <= r['timestamp']):
+            outcomes[job_id] = r
+
+    if db is not None:
+        for job_id in list(outcomes):
+            if not job_exists(job_id, db):
+                del outcomes[job_id]
+
+        for job_id in all_jobs(db):
+            if job_id in outcomes:
+                continue
+            cache = get_job_cache(job_id, db)
+            if cache.state == Cache.FAILED:
+                status = ERROR
+            elif cache.state == Cache.BLOCKED:
+                status = BLOCKED
+            else:
+                continue
+            job = get_job(job_id, db)
+            outcomes[job_id] = dict(job_id=job_id, function=job.command_desc,
+                                    objspecs=[], objects=[], status=status,
+                                    message=cache.exception,
+                                    traceback=cache.backtrace,
+                                    duration=0.0, timestamp=cache.timestamp)
+    return outcomes
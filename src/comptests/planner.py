@@ -0,0 +1,185 @@
+from collections import defaultdict
+import heapq
+import json
+import os
+
+from compmake.jobs.storage import all_jobs, get_job, get_job_cache
+from compmake.structures import Cache
+from conf_tools import import_name, reset_config
+from contracts import contract
+
+from .outcomes import get_outcomes_dir, read_outcomes
+from .registrar import ComptestsRegistrar, set_comptests_settings
+from .sharding import get_test_key, test_kinds
+
+
+__all__ = [
+    'plan_modules',
+    'read_duration_history',
+    'estimate_plan',
+    'format_plan',
+]
+
+
+class PlanContext(object):
+    """
+        Stand-in for the QuickAppContext passed to the modules' hooks
+        by plan_modules(): jobs defined directly by the hook are
+        counted, not created.
+    """
+    def __init__(self, output_dir, counts):
+        self.output_dir = output_dir
+        self.counts = counts
+
+    def child(self, *args, **kwargs):
+        return self
+
+    def get_output_dir(self):
+        return self.output_dir
+
+    def add_extra_report_keys(self, **keys):
+        pass
+
+    def add_report(self, *args, **kwargs):
+        pass
+
+    def comp(self, f, *args, **kwargs):
+        self.counts[getattr(f, '__name__', str(f))] += 1
+
+    comp_config = comp
+    comp_dynamic = comp
+    comp_config_dynamic = comp
+
+
+@contract(modules='list(str)', settings='dict', returns='list(dict)')
+def plan_modules(modules, settings, output_dir):
+    """
+        Runs the hook of each module as comptests_jobs_wrap() would,
+        but with settings['plan'] set, so that jobs_registrar() only
+        counts the jobs. Returns the entries with the module name added.
+    """
+    from .comptests import CompTests
+
+    entries = []
+    for module_name in modules:
+        module = import_name(module_name)
+        ff = module.__dict__.get(CompTests.hook_name, None)
+        if ff is None:
+            continue
+
+        reset_config()
+        set_comptests_settings(dict(settings, plan=True))
+        ComptestsRegistrar.planned = []
+        counts = defaultdict(lambda: 0)
+        ff(PlanContext(output_dir, counts))
+
+        for e in ComptestsRegistrar.planned:
+            entries.append(dict(e, module=module_name))
+        for name, n in counts.items():
+            entries.append(dict(module=module_name, objspec=None,
+                                function=name, kind='other', njobs=n,
+                                dynamic=False))
+    set_comptests_settings(settings)
+    return entries
+
+
+def read_duration_history(db=None, outcomes=None):
+    """
+        Returns a dict name -> mean duration of the jobs, from the 
+        outcomes log for the tests (named as get_test_key() does, as the
+        same function name can be used in other modules, or for other 
+        objspecs) and from the compmake DB of the previous run for the
+        other jobs (named by their function, the command).
+    """
+    durations = defaultdict(list)
+    if outcomes is None:
+        outcomes = get_outcomes_dir()
+    if os.path.exists(outcomes):
+        for r in read_outcomes(outcomes).values():
+            objspecs = r.get('objspecs') or [None]
+            key = get_test_key(r.get('module'), objspecs[0], r['function'])
+            durations[key].append(r.get('duration', 0.0))
+
+    if db is not None:
+        for job_id in all_jobs(db):
+            cache = get_job_cache(job_id, db)
+            if cache.state != Cache.DONE:
+                continue
+            name = get_job(job_id, db).command_desc
+            durations[name].append(cache.int_compute.get_walltime_used())
+
+    return dict((k, sum(v) / len(v)) for k, v in durations.items())
+
+
+def get_history_key(e):
+    """ The name of the jobs of the plan entry e in read_duration_history(). """
+    # the outcomes of the batched tests are those of each object, not 
+    # of the chunks: their jobs are found in the DB
+    if e['kind'] in test_kinds and e['kind'] != 'batched':
+        return get_test_key(e['module'].split('.')[0], e['objspec'],
+                            e['function'])
+    return e['function']
+
+
+@contract(entries='list(dict)', history='dict', workers='int,>=1',
+          returns='dict')
+def estimate_plan(entries, history, workers):
+    """
+        Returns total number of jobs, total CPU time and the makespan
+        with the given number of workers (longest job first, ignoring
+        the dependencies between jobs), using the mean durations in history.
+    """
+    njobs = 0
+    nunknown = 0
+    durations = []
+    for e in entries:
+        njobs += e['njobs']
+        key = get_history_key(e)
+        if key in history:
+            durations.extend([history[key]] * e['njobs'])
+        else:
+            nunknown += e['njobs']
+
+    durations.sort(reverse=True)
+    loads = [0.0] * workers
+    for d in durations:
+        heapq.heapreplace(loads, loads[0] + d)
+
+    return dict(njobs=njobs, nunknown=nunknown, workers=workers,
+                cpu_time=sum(durations), makespan=max(loads))
+
+
+def format_plan(entries, estimate):
+    """ Returns a string with the job counts per module/objspec/function. """
+    by = dict(module=defaultdict(lambda: 0),
+              objspec=defaultdict(lambda: 0),
+              function=defaultdict(lambda: 0))
+    dynamic = set()
+    for e in entries:
+        for k in by:
+            by[k][e[k] or '-'] += e['njobs']
+        if e['dynamic']:
+            dynamic.add(e['function'])
+
+    s = ''
+    for k in ['module', 'objspec', 'function']:
+        s += '\nJobs per %s:\n' % k
+        for name, n in sorted(by[k].items(), key=lambda x: -x[1]):
+            mark = ' (dynamic: defines more jobs)' if name in dynamic else ''
+            s += '  %8d  %s%s\n' % (n, name, mark)
+
+    s += '\n%d jobs' % estimate['njobs']
+    if estimate['nunknown']:
+        s += ' (%d without duration history)' % estimate['nunknown']
+    s += '\nEstimated CPU time: %.1f s' % estimate['cpu_time']
+    s += '\nEstimated makespan with %d workers: %.1f s' % (estimate['workers'],
+                                                           estimate['makespan'])
+    return s
+
+
+def write_plan(filename, entries, estimate):
+    d = os.path.dirname(filename)
+    if d and not os.path.exists(d):
+        os.makedirs(d)
+    with open(filename, 'w') as f:
+        json.dump(dict(entries=entries, estimate=estimate), f, indent=2)
@@ -0,0 +1,161 @@
+"""
+    The pytest items of the comptests of a module, one for each test job 
+    (e.g. "check_class1[c1a]"), for the plugin in comptests_pytest.
+
+    The jobs are defined and computed in each pytest process as in
+    "comptests --direct" (see direct.py): the objects are instanced once
+    per process, the first time a test needs them.
+    The item ids do not depend on the process, as xdist requires.
+"""
+import inspect
+import os
+
+import pytest
+
+from quickapp.compmake_context import wrap_state, wrap_state_dynamic
+
+from .direct import (BLOCKED, DONE, DirectContext, DirectExecutor, call_after,
+                     call_after_dynamic, define_direct)
+from .registrar import (ComptestsRegistrar, default_settings, get_batched_result,
+                        wrap_func, wrap_func_dyn, wrap_func_pair,
+                        wrap_func_pair_dyn, wrap_func_simple)
+from .results import Skipped
+
+
+__all__ = []
+
+# The jobs which are tests -> positions of the object ids in their arguments
+test_wrappers = {
+    wrap_func: (1,),
+    wrap_func_dyn: (1,),
+    wrap_func_pair: (1, 3),
+    wrap_func_pair_dyn: (1, 3),
+    get_batched_result: (2,),
+    wrap_func_simple: (),
+}
+
+
+def make_node(cls, parent, **kwargs):
+    if hasattr(cls, 'from_parent'):  # pytest >= 5.4
+        return cls.from_parent(parent, **kwargs)
+    return cls(parent=parent, **kwargs)
+
+
+class ComptestsCollector(pytest.Collector):
+    """ The comptests of one module; owns the executor of its jobs. """
+
+    def __init__(self, name, parent, module, **kwargs):
+        super(ComptestsCollector, self).__init__(name, parent, **kwargs)
+        self.module = module
+        self.executor = DirectExecutor()
+        self.test_jobs = set()
+
+    def collect(self):
+        settings = dict(default_settings)
+        context = DirectContext(self.executor)
+        define_direct(context, [self.module], settings)
+        self.executor.define()
+        for job_id, status in self.executor.status.items():
+            if status != DONE:
+                msg = ('Could not define the comptests of %s:\n%s' %
+                       (self.module, self.executor.tracebacks.get(job_id)))
+                raise pytest.UsageError(msg)
+        items = self.get_items(list(self.executor.jobs))
+        # the same order in all the xdist workers
+        return sorted(items, key=lambda item: item.name)
+
+    def get_items(self, job_ids):
+        regular_dynamic = [x['function'] for x in ComptestsRegistrar.regular
+                           if x['dynamic']]
+        items = []
+        names = set()
+        for job_id in job_ids:
+            if job_id in self.executor.status:
+                continue
+            f, args = get_job_function(self.executor.jobs[job_id])
+            if f in test_wrappers:
+                func = args[0]
+                ids = [args[i] for i in test_wrappers[f]]
+            elif f in regular_dynamic:
+                func = f
+                ids = []
+            else:  # instances, fixtures, reports
+                continue
+            name = func.__name__
+            if ids:
+                name += '[%s]' % '-'.join(ids)
+            # the same function can be registered more than once
+            unique = name
+            i = 1
+            while unique in names:
+                i += 1
+                unique = '%s-%d' % (name, i)
+            names.add(unique)
+            self.test_jobs.add(job_id)
+            items.append(make_node(ComptestsItem, parent=self, name=unique,
+                                   job_id=job_id, func=func))
+        return items
+
+
+class ComptestsJobFailed(Exception):
+    pass
+
+
+class ComptestsItem(pytest.Item):
+    """ A test job, computed (with its dependencies) when the item runs. """
+
+    def __init__(self, name, parent, job_id, func, **kwargs):
+        super(ComptestsItem, self).__init__(name, parent, **kwargs)
+        self.job_id = job_id
+        self.func = func
+
+    def runtest(self):
+        executor = self.parent.executor
+        before = set(executor.jobs)
+        self.check(self.job_id)
+        # the dynamic tests define more jobs, which are part of the test
+        for job_id in list(executor.jobs):
+            if not job_id in before:
+                self.check(job_id)
+
+    def check(self, job_id):
+        executor = self.parent.executor
+        status = executor.compute(job_id)
+        if status == DONE:
+            res = executor.results[job_id]
+            if isinstance(res, Skipped):
+                pytest.skip(res.get_reason())
+            return
+        cause = executor.get_failure_cause(job_id)
+        if status == BLOCKED and cause in self.parent.test_jobs:
+            # comptests_requires(): the prerequisite is reported by itself
+            pytest.skip(executor.errors[job_id])
+        msg = '%s: %s' % (cause, executor.errors[cause])
+        raise ComptestsJobFailed(msg, executor.tracebacks.get(cause))
+
+    def repr_failure(self, excinfo):
+        if isinstance(excinfo.value, ComptestsJobFailed):
+            msg, tb = excinfo.value.args
+            return '%s\n\n%s' % (msg, tb) if tb else msg
+        return super(ComptestsItem, self).repr_failure(excinfo)
+
+    def reportinfo(self):
+        func = self.func
+        while not inspect.isfunction(func) and hasattr(func, 'f'):
+            func = func.f  # the wrappers with __name__ and __module__
+        try:
+            filename = inspect.getsourcefile(func)
+            lineno = inspect.getsourcelines(func)[1] - 1
+        except (TypeError, IOError):
+            return self.fspath, None, self.name
+        return os.path.abspath(filename), lineno, self.name
+
+
+def get_job_function(job):
+    """ Returns the function of a DirectJob and its arguments, unwrapped. """
+    f, args = job.f, tuple(job.args)
+    if f in (call_after, call_after_dynamic):
+        f, args = args[1], args[2:]
+    if f in (wrap_state, wrap_state_dynamic):
+        f, args = args[1], args[2:]
+    return f, args
@@ -10,11 +10,22 @@ from conf_tools import ConfigMaster, GlobalConfig, ObjectSpec
 from conf_tools.utils import expand_string
 from contracts import contract
 from contracts.utils import raise_desc
-from quickapp import iterate_context_names, iterate_context_names_pair
+from quickapp import iterate_context_names
 from quickapp import logger
 
+from .asynctests import ConcurrentWrap, ObjectFailure
 from .reports import (report_results_pairs, report_results_pairs_jobs,
-    report_results_single)
+    report_results_single, report_results_single_jobs)
+from .failures import get_failures_log
+from .instance_cache import InstanceCache, get_instance_key
+from .fixtures import (FixtureJobs, add_fixtures_used, get_fixtures_promises,
+    get_needed_fixtures, load_fixtures)
+from .outcomes import NoOutcome, record_outcome
+from .requirements import (check_requirements, get_requirements, get_requires,
+    split_requiring)
+from .results import BenchmarkResult, Flaky, PartiallySkipped, Skipped
+from .serializers import get_serializer, serialize
+from .transport import shared_arrays_dump, transport_load
 
 
 __all__ = [
@@ -24,9 +35,28 @@ __all__ = [
     'comptests_for_some_pairs',
     'comptests_for_all_dynamic',
     'comptests_for_all_pairs_dynamic',
+    'comptests_for_all_batched',
+    'comptests_for_all_concurrent',
+    'comptests_shared_arrays',
+    'comptests_keep_result',
     'jobs_registrar',
 ]
 
+# Options of the current run (from the command line); they are set
+# by comptests_jobs_wrap() before calling the module's hook.
+default_settings = dict(create_reports=False, plan=False, retries=0,
+                        # dict(dirname, max_size, compress) for InstanceCache
+                        instance_cache=None,
+                        # name of the serializer for instances and fixtures
+                        serializer=None,
+                        # patterns with the semantics of expand_string()
+                        only_function=None, only_objspec=None, only_object=None,
+                        # with --shard, the (module, objspec, function name)
+                        # selected
+                        shard_tests=None,
+                        # the -o of the run, where the outcomes are written
+                        output_dir=None)
+
 
 class ComptestsRegistrar(object):
     """ Static storage """
@@ -36,6 +66,18 @@ class ComptestsRegistrar(object):
     objspec2pairs = defaultdict(list)  # -> (objspec2, f)
     objspec2testsome = defaultdict(list)  # -> dict(function, id_object, dynamic=False)
     objspec2testsomepairs = defaultdict(list)
+    objspec2batched = defaultdict(list)  # -> dict(function, chunk, dynamic=False)
+    objspec2transport = {}  # -> dict(threshold=int)
+
+    settings = dict(default_settings)
+
+    # With settings['plan'], jobs_registrar() only counts the jobs here
+    planned = []  # list of dict(objspec, function, kind, njobs, dynamic)
+    planned_regular = set()  # id() of the "regular" entries already counted
+
+
+def set_comptests_settings(settings):
+    ComptestsRegistrar.settings = dict(default_settings, **settings)
     
 
 @contract(objspec=ObjectSpec, dynamic=bool)
@@ -43,9 +85,15 @@ def register_single(objspec, f, dynamic):
     ts = ComptestsRegistrar.objspec2tests[objspec.name]
     ts.append(dict(function=f, dynamic=dynamic))
 
-def register_pair(objspec1, objspec2, f, dynamic):
+def register_pair(objspec1, objspec2, f, dynamic, symmetric=False,
+                  include_diagonal=True):
+    if (symmetric or not include_diagonal) and objspec1.name != objspec2.name:
+        msg = ('symmetric and include_diagonal need the same objspec, '
+               'got %r and %r.' % (objspec1.name, objspec2.name))
+        raise ValueError(msg)
     ts = ComptestsRegistrar.objspec2pairs[objspec1.name]
-    ts.append(dict(objspec2=objspec2, function=f, dynamic=dynamic))
+    ts.append(dict(objspec2=objspec2, function=f, dynamic=dynamic,
+                   symmetric=symmetric, include_diagonal=include_diagonal))
 
 def register_for_some_pairs(objspec1, objspec2, f, which1, which2, dynamic):
     ts = ComptestsRegistrar.objspec2testsomepairs[objspec1.name]
@@ -57,6 +105,11 @@ def register_for_some(objspec, f, which, dynamic):
     ts = ComptestsRegistrar.objspec2testsome[objspec.name]
     ts.append(dict(function=f, which=which, dynamic=dynamic))
 
+@contract(objspec=ObjectSpec, chunk='None|int,>=1')
+def register_batched(objspec, f, chunk):
+    ts = ComptestsRegistrar.objspec2batched[objspec.name]
+    ts.append(dict(function=f, chunk=chunk, dynamic=False))
+
 def register_indep(f, dynamic, args, kwargs):
     d = dict(function=f, dynamic=dynamic, args=args, kwargs=kwargs)
     ComptestsRegistrar.regular.append(d)
@@ -72,18 +125,14 @@ def check_fails(f, *args, **kwargs):
         logger.error('Known failure for %s ' % f)
         logger.warn('Fails with error %s' % e)
         #comptest_fails = kwargs.get('comptest_fails', f.__name__)
-        d = 'out/comptests-failures'
-        if not os.path.exists(d):
-            os.makedirs(d)
         job_id = JobCompute.current_job_id
         if job_id is None:
             job_id = 'nojob-%s' % f.__name__
-        out = os.path.join(d, job_id + '.txt')
-#         for i in range(1000):
-#             outi = out % i
-#             if not os.path.exists(outi):
-        with open(out, 'w') as f:
-            f.write(traceback.format_exc(e))
+        # see query_failures() to read them back
+        get_failures_log().append(job_id=job_id, function=f.__name__,
+                                  exception=type(e).__name__,
+                                  message=str(e),
+                                  traceback=traceback.format_exc())
     else:
         msg = 'Function was supposed to fail.'
         raise_desc(Exception, msg, f=f, args=args, kwargs=kwargs)
@@ -107,6 +156,32 @@ def comptest_dynamic(f):
     return f
 
 
+def comptests_keep_result(f):
+    """ 
+        Decorator that marks a test whose return value must be stored 
+        even when reports are not created.
+    """
+    f.comptests_keep_result = True
+    return f
+
+
+def keep_result(f, create_reports):
+    """ Whether the return value of the test f is ever read. """
+    return create_reports or getattr(f, 'comptests_keep_result', False)
+
+
+def compact_result(res, keep):
+    """ 
+        Returns what needs to be stored for the test result: 
+        if nobody reads it, only the status (Skipped, etc.) is kept.
+    """
+    if isinstance(res, Flaky):
+        return Flaky(compact_result(res.get_result(), keep), res.get_attempts())
+    if keep or isinstance(res, (Skipped, PartiallySkipped, BenchmarkResult)):
+        return res
+    return None
+
+
 @contract(objspec=ObjectSpec)
 def comptests_for_all(objspec):
     """ 
@@ -141,6 +216,40 @@ def comptests_for_all_dynamic(objspec):
     return register    
 
 
+@contract(objspec=ObjectSpec, chunk='None|int,>=1')
+def comptests_for_all_batched(objspec, chunk=10):
+    """ 
+        Returns a decorator for a test which takes a list of 
+        (id_object, object) pairs, with at most chunk elements (None: 
+        all the objects), and returns a dict id_object -> result.
+        A result that is an exception makes that object fail. 
+        
+        Each chunk is one job; the results are then split in one job 
+        per object, as for comptests_for_all().
+    """
+    def register(f):
+        register_batched(objspec, f, chunk=chunk)
+        return f
+    return register
+
+
+@contract(objspec=ObjectSpec, chunk='None|int,>=1', max_concurrency='int,>=1')
+def comptests_for_all_concurrent(objspec, chunk=None, max_concurrency=16):
+    """ 
+        Returns a decorator for tests taking (id_object, object) that 
+        mostly wait (for I/O, simulators, ...): the tests for up to chunk 
+        objects (default: max_concurrency) run concurrently in one job, 
+        at most max_concurrency at a time, in threads. The outcomes are recorded 
+        per object, as for comptests_for_all_batched(); with --retries, 
+        only the objects that failed are tested again.
+    """
+    def register(f):
+        w = ConcurrentWrap(f, max_concurrency=max_concurrency)
+        register_batched(objspec, w, chunk=chunk or max_concurrency)
+        return f
+    return register
+
+
 @contract(objspec=ObjectSpec)
 def comptests_for_some(objspec):
     """ Returns a decorator for a test involving one object only. """
@@ -183,55 +292,392 @@ def comptests_for_some_pairs_dynamic(objspec1, objspec2):
     return dec
 
 
-@contract(objspec1=ObjectSpec, objspec2=ObjectSpec)
-def comptests_for_all_pairs_dynamic(objspec1, objspec2):
+@contract(objspec1=ObjectSpec, objspec2=ObjectSpec, symmetric='bool',
+          include_diagonal='bool')
+def comptests_for_all_pairs_dynamic(objspec1, objspec2, symmetric=False,
+                                    include_diagonal=True):
+    """ See comptests_for_all_pairs() for the options. """
     def register(f):
-        register_pair(objspec1, objspec2, f, dynamic=True)  
+        register_pair(objspec1, objspec2, f, dynamic=True, symmetric=symmetric,
+                      include_diagonal=include_diagonal)
         return f
     return register    
 
-@contract(objspec1=ObjectSpec, objspec2=ObjectSpec)
-def comptests_for_all_pairs(objspec1, objspec2):
+@contract(objspec1=ObjectSpec, objspec2=ObjectSpec, symmetric='bool',
+          include_diagonal='bool')
+def comptests_for_all_pairs(objspec1, objspec2, symmetric=False,
+                            include_diagonal=True):
+    """ 
+        Returns a decorator for a test taking two objects. 
+        
+        If objspec1 and objspec2 are the same, symmetric=True tests
+        only one of (a, b) and (b, a) (the reports show the result in 
+        both cells), and include_diagonal=False skips the pairs (a, a).
+    """
     def register(f):
-        register_pair(objspec1, objspec2, f, dynamic=False)  
+        register_pair(objspec1, objspec2, f, dynamic=False, symmetric=symmetric,
+                      include_diagonal=include_diagonal)
         return f
     return register    
 
-@contract(cm=ConfigMaster)
-def jobs_registrar(context, cm, create_reports=False):
+@contract(objspec=ObjectSpec, threshold='int,>=0')
+def comptests_shared_arrays(objspec, threshold=1024 * 1024):
+    """ 
+        Opt-in: the NumPy arrays larger than threshold bytes in the objects
+        of this objspec are stored once in a file and memory-mapped 
+        (read-only) by every test, rather than copied in the compmake DB.
+    """
+    ComptestsRegistrar.objspec2transport[objspec.name] = dict(threshold=threshold)
+
+
+@contract(cm=ConfigMaster, create_reports='None|bool')
+def jobs_registrar(context, cm, create_reports=None):
+    """ 
+        Defines the jobs for all tests registered for the objects in cm. 
+        
+        If create_reports is None, it is taken from the command line.
+    """
     assert isinstance(cm, ConfigMaster)
+    if create_reports is None:
+        create_reports = ComptestsRegistrar.settings['create_reports']
+
+    if ComptestsRegistrar.settings['plan']:
+        ComptestsRegistrar.planned.extend(plan_registrar(cm, create_reports))
+        return
     
     # Sep 15: remove name
 #     context = context.child(cm.name)
     context = context.child("")
     
+    registrations = get_registrations(cm)
+    registrations = add_fixtures_used(registrations)
     names = sorted(cm.specs.keys())
+    check_requirements(registrations, get_registered_for_all(names))
+    only_object = ComptestsRegistrar.settings['only_object']
+    retries = ComptestsRegistrar.settings['retries']
+    output_dir = ComptestsRegistrar.settings['output_dir']
+    cache = get_instance_cache()
+    serializer = ComptestsRegistrar.settings['serializer']
+    if serializer is not None:
+        serializer = get_serializer(serializer)
+
+    if registrations:
+        # only the objects used by the tests are instanced
+        shapes = get_registrations_shapes(registrations)
+        transports = dict(ComptestsRegistrar.objspec2transport)
+        names2test_objects = context.comp_config_dynamic(get_testobjects_promises, cm,
+                                                         transports=transports,
+                                                         shapes=shapes,
+                                                         only_object=only_object,
+                                                         cache=cache,
+                                                         serializer=serializer)
+        needed = get_needed_fixtures(registrations)
+        if needed:
+            fixtures = context.comp_config_dynamic(get_fixtures_promises,
+                                                   names2test_objects, needed,
+                                                   serializer=serializer)
+        else:
+            fixtures = {}
     
-    names2test_objects = context.comp_config_dynamic(get_testobjects_promises, cm)
-    
-    for c, name in iterate_context_names(context, names):
-
-        pairs = ComptestsRegistrar.objspec2pairs[name]
-        functions = ComptestsRegistrar.objspec2tests[name]
-        some = ComptestsRegistrar.objspec2testsome[name]
-        some_pairs = ComptestsRegistrar.objspec2testsomepairs[name]
-
-        c.comp_config_dynamic(define_tests_for,
+    def define(c, name, r, **params):
+        if serializer is not None:
+            params['serializer'] = serializer
+        return c.comp_config_dynamic(define_tests_for,
                           cm=cm,
                           name=name,
                           names2test_objects=names2test_objects,
-                          pairs=pairs,
-                          functions=functions,
-                          some=some,
-                          some_pairs=some_pairs,
-                          create_reports=create_reports)
+                          pairs=r['pairs'],
+                          functions=r['functions'],
+                          some=r['some'],
+                          some_pairs=r['some_pairs'],
+                          batched=r['batched'],
+                          create_reports=create_reports,
+                          only_object=only_object,
+                          retries=retries,
+                          fixtures=fixtures,
+                          output_dir=output_dir,
+                          **params)
+
+    # The tests requiring other tests (see comptests_requires) are defined
+    # by a second job, once the job ids of the required tests are known.
+    defined = {}
+    requiring = []
+    it = iterate_context_names_selected(context, names, registrations)
+    for c, name in it:
+        first, later = split_requiring(registrations[name])
+        defined[name] = define(c, name, first)
+        if any(later.values()):
+            requiring.append((c, name, later))
+
+    for c, name, r in requiring:
+        names_used = get_names_used(name, r)
+        required = dict((n, defined[n]) for n in names_used if n in defined)
+        define(c, name, r, required=required,
+               job_id='define_tests_for_requiring')
  
-    jobs_registrar_simple(context)
+    jobs_registrar_simple(context, create_reports=create_reports,
+                          retries=retries, output_dir=output_dir)
+
+
+def select_names(pattern, names):
+    """ 
+        Returns the names matching pattern (expand_string() semantics), 
+        in the same order; all of them if pattern is None.
+    """
+    if pattern is None:
+        return list(names)
+    if isinstance(pattern, unicode):
+        pattern = str(pattern)
+    try:
+        expanded = expand_string(pattern, list(names))
+    except ValueError:  # a wildcard did not match anything
+        return []
+    return [x for x in names if x in expanded]
+
+
+def function_selected(f):
+    pattern = ComptestsRegistrar.settings['only_function']
+    return bool(select_names(pattern, [f.__name__]))
+
+
+def shard_selected(objspec_name, f):
+    """ Whether the test is in this shard (see sharding.py). """
+    tests = ComptestsRegistrar.settings['shard_tests']
+    if tests is None:
+        return True
+    module = f.__module__.split('.')[0]
+    return (module, objspec_name, f.__name__) in tests
+
+
+@contract(cm=ConfigMaster, returns='dict(str:dict)')
+def get_registrations(cm):
+    """ 
+        Returns the registered tests for the objspecs in cm, 
+        filtered by the --only-function and --only-objspec options:
+        a dict name -> dict(functions, pairs, some, some_pairs, batched). 
+        The objspecs without tests selected are omitted.
+    """
+    objspecs = select_names(ComptestsRegistrar.settings['only_objspec'],
+                            sorted(cm.specs.keys()))
+
+    def selected(x, name):
+        if not function_selected(x['function']):
+            return False
+        if not shard_selected(name, x['function']):
+            return False
+        # pairs are selected if either objspec is
+        return name in objspecs or ('objspec2' in x and 
+                                    x['objspec2'].name in objspecs)
+
+    registrations = {}
+    for name in sorted(cm.specs.keys()):
+        r = dict(functions=ComptestsRegistrar.objspec2tests[name],
+                 pairs=ComptestsRegistrar.objspec2pairs[name],
+                 some=ComptestsRegistrar.objspec2testsome[name],
+                 some_pairs=ComptestsRegistrar.objspec2testsomepairs[name],
+                 batched=ComptestsRegistrar.objspec2batched[name])
+        for k in r:
+            r[k] = [x for x in r[k] if selected(x, name)]
+        if any(r.values()):
+            registrations[name] = r
+    return registrations
+
+
+def get_registered_for_all(names):
+    """ Returns objspec name -> functions registered with comptests_for_all. """
+    return dict((name, [x['function'] for x in ComptestsRegistrar.objspec2tests[name]])
+                for name in names)
+
+
+def get_names_used(name, r):
+    """ The objspecs used by the tests r of the objspec name. """
+    names = set([name])
+    for tests in r.values():
+        for x in tests:
+            if 'objspec2' in x:
+                names.add(x['objspec2'].name)
+    return sorted(names)
+
+
+def get_registrations_shapes(registrations):
+    """ 
+        Returns, for each test, the objects it uses, as a tuple with 
+        one or two (objspec name, which) elements; which=None means all.
+    """
+    shapes = []
+    for name, r in registrations.items():
+        for _ in r['functions'] + r['batched']:
+            shapes.append(((name, None),))
+        for x in r['some']:
+            shapes.append(((name, x['which']),))
+        for x in r['pairs']:
+            shapes.append(((name, None), (x['objspec2'].name, None)))
+        for x in r['some_pairs']:
+            shapes.append(((name, x['which1']), (x['objspec2'].name, x['which2'])))
+    return shapes
+
+
+@contract(names2objects='dict(str:list(str))', shapes='list(tuple)',
+          returns='dict(str:list(str))')
+def get_needed_objects(names2objects, shapes, only_object=None):
+    """ 
+        Returns the objects that need to be instanced for the given tests
+        (see get_registrations_shapes); the objspecs without tests get none.
+        
+        With only_object, a single test uses the matching objects only; 
+        a pair test uses the pairs in which either object matches.
+    """
+    needed = dict((name, set()) for name in names2objects)
+    for shape in shapes:
+        candidates = [select_names(which, names2objects[name])
+                      for name, which in shape]
+        matching = [select_names(only_object, x) for x in candidates]
+        if len(shape) == 1:
+            needed[shape[0][0]].update(matching[0])
+        else:
+            a, b = shape[0][0], shape[1][0]
+            if matching[0]:
+                needed[a].update(matching[0])
+                needed[b].update(candidates[1])
+            if matching[1]:
+                needed[b].update(matching[1])
+                needed[a].update(candidates[0])
+    return dict((name, sorted(ids)) for name, ids in needed.items())
+
+def add_pair_fixtures(pair_fixtures, name, x, objects1, objects2):
+    """ Adds the pairs of objects for which the pair fixtures of x are computed. """
+    only_object = ComptestsRegistrar.settings['only_object']
+    matching1 = select_names(only_object, objects1)
+    matching2 = select_names(only_object, objects2)
+    for param, (which, _) in x['fixtures'].items():
+        if which == 0:
+            pair_fixtures[(name, x['objspec2'].name, param)].update(
+                (a, b) for a in objects1 for b in objects2
+                if a in matching1 or b in matching2)
+
+
+@contract(cm=ConfigMaster, create_reports='bool', returns='list(dict)')
+def plan_registrar(cm, create_reports):
+    """ 
+        Returns the jobs that jobs_registrar() would define, without 
+        defining them: one entry per objspec/function with the number of jobs.
+    """
+    entries = []
+
+    def add(objspec, function, kind, njobs, dynamic=False, requires=()):
+        entries.append(dict(objspec=objspec, function=function, kind=kind,
+                            njobs=njobs, dynamic=dynamic,
+                            requires=[g.__name__ for g in requires]))
+
+    registrations = add_fixtures_used(get_registrations(cm))
+    only_object = ComptestsRegistrar.settings['only_object']
 
-def jobs_registrar_simple(context):
+    names2objects = {}
+    for name in sorted(cm.specs.keys()):
+        objspec = cm.specs[name]
+        objspec.master.load()
+        names2objects[name] = sorted(objspec.keys())
+
+    shapes = get_registrations_shapes(registrations)
+    instanced = get_needed_objects(names2objects, shapes, only_object)
+
+    if registrations:
+        add(None, 'get_testobjects_promises', 'definition', 1)
+    for name in sorted(cm.specs.keys()):
+        add(name, 'instance_%s' % name, 'instance', len(instanced[name]))
+
+    needed = get_needed_fixtures(registrations)
+    if needed:
+        add(None, 'get_fixtures_promises', 'definition', 1)
+    for name in sorted(needed):
+        for fixture_name in sorted(needed[name]):
+            add(name, fixture_name, 'fixture', len(instanced[name]))
+
+    def matching(objects):
+        return select_names(only_object, objects)
+
+    def npairs(objects1, objects2, x=None):
+        # the pairs in which either object is selected
+        n1, n2 = len(objects1), len(objects2)
+        m1, m2 = matching(objects1), matching(objects2)
+        if x is not None:
+            return len([1 for a in objects1 for b in objects2
+                        if (a in m1 or b in m2) and pair_selected(x, a, b)])
+        return n1 * n2 - (n1 - len(m1)) * (n2 - len(m2))
+
+    nreports = 1 if create_reports else 0
+    pair_fixtures = defaultdict(set)  # (name, name2, fixture) -> pairs
+    for name in sorted(registrations):
+        r = registrations[name]
+        objects = names2objects[name]
+        add(name, 'define_tests_for', 'definition', 1)
+        if any(split_requiring(r)[1].values()):
+            add(name, 'define_tests_for', 'definition', 1)
+        for x in r['functions']:
+            f = x['function']
+            add(name, f.__name__, 'single', len(matching(objects)), x['dynamic'],
+                get_requires(f))
+            add(name, 'report_results_single', 'reports', nreports)
+            if get_requires(f):
+                add(name, 'report_results_single_jobs', 'reports', nreports)
+
+        for x in r['batched']:
+            f = x['function']
+            selected = matching(objects)
+            nchunks = len(get_chunks(objects, selected, x['chunk']))
+            add(name, f.__name__, 'batched', nchunks)
+            add(name, 'get_batched_result', 'batched_result', len(selected))
+            add(name, 'report_results_single', 'reports', nreports)
+
+        for x in r['some']:
+            f = x['function']
+            n = len(matching(select_names(x['which'], objects)))
+            add(name, f.__name__, 'some', n, x['dynamic'], get_requires(f))
+            add(name, 'report_results_single', 'reports', nreports)
+            if get_requires(f):
+                add(name, 'report_results_single_jobs', 'reports', nreports)
+
+        for x in r['pairs']:
+            f = x['function']
+            objects2 = names2objects.get(x['objspec2'].name, [])
+            add(name, f.__name__, 'pairs', npairs(objects, objects2, x),
+                x['dynamic'], get_requires(f))
+            add_pair_fixtures(pair_fixtures, name, x, objects, objects2)
+            add(name, 'report_results_pairs', 'reports', 2 * nreports)
+
+        for x in r['some_pairs']:
+            f = x['function']
+            objects2 = names2objects.get(x['objspec2'].name, [])
+            n = npairs(select_names(x['which1'], objects),
+                       select_names(x['which2'], objects2))
+            add(name, f.__name__, 'some_pairs', n, x['dynamic'],
+                get_requires(f))
+            add_pair_fixtures(pair_fixtures, name, x,
+                              select_names(x['which1'], objects),
+                              select_names(x['which2'], objects2))
+            add(name, 'report_results_pairs', 'reports', 2 * nreports)
+
+    for (name, _, fixture_name), pairs in sorted(pair_fixtures.items()):
+        add(name, fixture_name, 'fixture', len(pairs))
+
+    for x in get_regular():
+        if id(x) in ComptestsRegistrar.planned_regular:
+            continue
+        ComptestsRegistrar.planned_regular.add(id(x))
+        add(None, x['function'].__name__, 'simple', 1, x['dynamic'])
+
+    return [e for e in entries if e['njobs'] > 0]
+
+
+def jobs_registrar_simple(context, create_reports=False, retries=None,
+                          output_dir=None):
     """ Registers the simple "comptest" """
+    if retries is None:
+        retries = ComptestsRegistrar.settings['retries']
+    if output_dir is None:
+        output_dir = ComptestsRegistrar.settings['output_dir']
     # now register single
-    for x in ComptestsRegistrar.regular:
+    for x in get_regular():
         function = x['function']
         dynamic = x['dynamic']
         args  = x['args']
@@ -239,49 +685,191 @@ def jobs_registrar_simple(context):
         
         # print('registering %s' % x)
         if not dynamic:
-            res = context.comp_config(function, *args, **kwargs)
+            keep = keep_result(function, create_reports)
+            res = context.comp_config(wrap_func_simple, function, args, kwargs,
+                                      keep, retries=retries,
+                                      output_dir=output_dir,
+                                      command_name=function.__name__)
 
         else:
             res = context.comp_config_dynamic(function, *args, **kwargs)
       
 
 
-@contract(cm=ConfigMaster, 
+def get_regular():
+    """ 
+        The "comptest" tests selected by --only-function; they are
+        not selected if --only-objspec or --only-object are given.
+    """
+    settings = ComptestsRegistrar.settings
+    if settings['only_objspec'] is not None or settings['only_object'] is not None:
+        return []
+    return [x for x in ComptestsRegistrar.regular 
+            if function_selected(x['function']) and
+            shard_selected(None, x['function'])]
+
+
+@contract(cm=ConfigMaster, transports='None|dict(str:dict)',
+          shapes='None|list(tuple)', only_object='None|str',
           returns='dict(str:dict(str:str))')
-def get_testobjects_promises(context, cm):
+def get_testobjects_promises(context, cm, transports=None, shapes=None,
+                             only_object=None, cache=None, serializer=None):
+    """ 
+        Defines the instance jobs; if shapes is given, only for the 
+        objects needed by those tests (see get_needed_objects).
+        If cache (an InstanceCache) is given, the objects are taken from it;
+        if serializer is given, they are stored serialized.
+    """
+    if transports is None:
+        transports = {}
+    needed = None
+    if shapes is not None:
+        names2objects = {}
+        for name, objspec in cm.specs.items():
+            objspec.master.load()
+            names2objects[name] = sorted(objspec.keys())
+        needed = get_needed_objects(names2objects, shapes, only_object)
+
     names2test_objects = {}
     for name in sorted(cm.specs.keys()):
         objspec = cm.specs[name]
-        its = get_testobjects_promises_for_objspec(context, objspec)
+        which = None if needed is None else needed[name]
+        its = get_testobjects_promises_for_objspec(context, objspec,
+                                                   transport=transports.get(name),
+                                                   which=which, cache=cache,
+                                                   serializer=serializer)
         names2test_objects[name] = its
     return names2test_objects 
 
 
-@contract(name=str, create_reports='bool', 
+@contract(name=str, create_reports='bool', only_object='None|str',
           names2test_objects='dict(str:dict(str:str))') 
 def define_tests_for(context, cm, name, names2test_objects, 
 
                      pairs, functions, some, some_pairs,
 
-                     create_reports):
+                     create_reports, only_object=None, retries=0,
+                     fixtures=None, batched=(), required=None,
+                     serializer=None, output_dir=None):
+    """ 
+        fixtures: the per-object fixture jobs (see get_fixtures_promises()).
+        serializer: used for the pair fixtures.
+        required: the jobs of the tests required by these tests, as 
+        returned by define_tests_for() for their objspecs.
+        
+        Returns the jobs of the tests for all objects, as a dict
+        function name -> id_object -> job_id.
+    """
 
     objspec = cm.specs[name]
+    fixture_jobs = FixtureJobs(context, fixtures or {}, serializer=serializer)
 
-    define_tests_single(context, objspec, names2test_objects, 
-                        functions=functions, create_reports=create_reports)
+    jobs = define_tests_single(context, objspec, names2test_objects, 
+                        functions=functions, create_reports=create_reports,
+                        only_object=only_object, retries=retries,
+                        fixture_jobs=fixture_jobs, required=required,
+                        output_dir=output_dir)
     define_tests_pairs(context, objspec, names2test_objects, 
-                       pairs=pairs,create_reports=create_reports)
+                       pairs=pairs,create_reports=create_reports,
+                       only_object=only_object, retries=retries,
+                       fixture_jobs=fixture_jobs, required=required,
+                       output_dir=output_dir)
 
     define_tests_some_pairs(context, objspec, names2test_objects,
-                            some_pairs=some_pairs, create_reports=create_reports)
+                            some_pairs=some_pairs, create_reports=create_reports,
+                            only_object=only_object, retries=retries,
+                            fixture_jobs=fixture_jobs, required=required,
+                            output_dir=output_dir)
 
     define_tests_some(context, objspec, names2test_objects,
-                       some=some, create_reports=create_reports)
+                       some=some, create_reports=create_reports,
+                       only_object=only_object, retries=retries,
+                       fixture_jobs=fixture_jobs, required=required,
+                       output_dir=output_dir)
+
+    define_tests_batched(context, objspec, names2test_objects,
+                         batched=batched, create_reports=create_reports,
+                         only_object=only_object, retries=retries,
+                         output_dir=output_dir)
+    return jobs
+
+
+def get_all_objects(objspec, test_objects, only_object):
+    """ 
+        Returns the names of all objects of objspec; with only_object, 
+        test_objects (the instanced ones) might be a subset. 
+    """
+    if only_object is None:
+        return list(test_objects)
+    objspec.master.load()
+    return sorted(objspec.keys())
+
+
+def iterate_context_names_selected(context, names, selected, key=None):
+    """ 
+        Like iterate_context_names(), but only for the names in selected;
+        the contexts are named as if all names were used, so that
+        the job ids do not depend on the selection.
+    """
+    if not names or not selected:
+        return
+    for c, x in iterate_context_names(context, list(names), key=key):
+        if x in selected:
+            yield c, x
+
+
+def iterate_pairs_selected(context, names1, names2, objs1, objs2, only_object,
+                           key1, key2):
+    """ 
+        Yields (context, id_ob1, id_ob2) for the pairs of instanced objects 
+        (objs1, objs2) in which either object matches only_object. 
+    """
+    if key1 == key2:  # pairs of the same objspec
+        key2 = key2 + '2'
+    selected1 = select_names(only_object, names1)
+    selected2 = select_names(only_object, names2)
+    for cc, id_ob1 in iterate_context_names_selected(context, names1, objs1,
+                                                     key=key1):
+        if id_ob1 in selected1:
+            which2 = objs2
+        else:
+            which2 = [x for x in objs2 if x in selected2]
+        for c, id_ob2 in iterate_context_names_selected(cc, names2, which2,
+                                                        key=key2):
+            yield c, id_ob1, id_ob2
+
+
+def add_report_jobs(c, f, objspec_name, results, report_type):
+    """ 
+        Adds the report that shows the state of each job, so that the 
+        tests blocked by a failed requirement are visible.
+    """
+    jobs = dict((k, v.job_id) for k, v in results.items())
+    r = c.comp_dynamic(report_results_single_jobs, f, objspec_name, jobs,
+                       extra_dep=list(results.values()))
+    c.add_report(r, report_type)
+
+
+def pair_selected(x, id_ob1, id_ob2):
+    """ Whether the pair test x is defined for the pair (id_ob1, id_ob2). """
+    if id_ob1 == id_ob2:
+        return x.get('include_diagonal', True)
+    if x.get('symmetric', False):
+        return id_ob1 < id_ob2
+    return True
+
+
+def mirror_pairs(x, results):
+    """ For a symmetric test, adds (b, a) with the value for (a, b). """
+    if x.get('symmetric', False):
+        for (a, b), res in list(results.items()):
+            results[(b, a)] = res
 
 
 @contract(names2test_objects='dict(str:dict(str:str))')
 def define_tests_some(context, objspec, names2test_objects,
-                        some, create_reports):
+                        some, create_reports, only_object=None, retries=0,
+                        fixture_jobs=None, required=None, output_dir=None):
 
     test_objects = names2test_objects[objspec.name]
 
@@ -306,14 +894,24 @@ def define_tests_some(context, objspec, names2test_objects,
         c = context.child(f.__name__)
         c.add_extra_report_keys(objspec=objspec.name, function=f.__name__)
 
-        objects = expand_string(which, list(test_objects))
-        if not objects:
-            msg = 'Which = %r did not give anything in %r.' % (which, test_objects)
-            raise ValueError(msg)
+        if only_object is None:
+            objects = expand_string(which, list(test_objects))
+            if not objects:
+                msg = 'Which = %r did not give anything in %r.' % (which, test_objects)
+                raise ValueError(msg)
+            selected = objects
+        else:
+            # only some objects were instanced
+            universe = get_all_objects(objspec, test_objects, only_object)
+            objects = select_names(which, universe)
+            selected = select_names(only_object,
+                                    [k for k in objects if k in test_objects])
+            if not selected:
+                continue
 
-        print('Testing %s for %s' % (f, objects))
+        print('Testing %s for %s' % (f, selected))
 
-        it = iterate_context_names(c, objects, key=objspec.name)
+        it = iterate_context_names_selected(c, objects, selected, key=objspec.name)
         for cc, id_object in it:
             ob_job_id = test_objects[id_object]
             assert_job_exists(ob_job_id, db)
@@ -321,28 +919,45 @@ def define_tests_some(context, objspec, names2test_objects,
             # bjob_id = 'f'  # XXX
             job_id = '%s-%s' % (f.__name__, id_object)
 
-            params = dict(job_id=job_id, command_name=f.__name__)
+            params = dict(job_id=job_id, command_name=f.__name__,
+                          output_dir=output_dir)
+            fixtures = get_fixtures_for(fixture_jobs, x, (objspec.name,),
+                                        (id_object,), (ob,))
+            if fixtures:
+                params['fixtures'] = fixtures
+            deps = get_requirements(required, x, (objspec.name,), (id_object,))
+            if deps:
+                params['extra_dep'] = deps
             if dynamic:
                 res = cc.comp_config_dynamic(wrap_func_dyn, f, id_object, ob,
-                                             **params)
+                                             objspecs=(objspec.name,), **params)
             else:
-                res = cc.comp_config(wrap_func, f, id_object, ob,
+                keep = keep_result(f, create_reports)
+                res = cc.comp_config(wrap_func, f, id_object, ob, keep,
+                                     objspecs=(objspec.name,), retries=retries,
                                      **params)
             results[id_object] = res
 
         if create_reports:
             r = c.comp(report_results_single, f, objspec.name, results)
             c.add_report(r, 'some')
+            if get_requires(f):
+                add_report_jobs(c, f, objspec.name, results, 'jobs_some')
 
 
 @contract(names2test_objects='dict(str:dict(str:str))')
 def define_tests_single(context, objspec, names2test_objects, 
-                        functions, create_reports):
+                        functions, create_reports, only_object=None,
+                        retries=0, fixture_jobs=None, required=None,
+                        output_dir=None):
+    """ Returns the jobs, as a dict function name -> id_object -> job_id. """
     test_objects = names2test_objects[objspec.name]
-    if not test_objects:
+    selected = select_names(only_object, list(test_objects))
+    if not selected:
         msg = 'No test_objects for objects of kind %r.' % objspec.name
         print(msg)
-        return
+        return {}
+    universe = get_all_objects(objspec, test_objects, only_object)
 
     if not functions:
         msg = 'No mcdp_lang_tests specified for objects of kind %r.' % objspec.name
@@ -350,6 +965,7 @@ def define_tests_single(context, objspec, names2test_objects,
         
     db = context.cc.get_compmake_db()
 
+    jobs = {}
     for x in functions:
         f = x['function']
         dynamic = x['dynamic']
@@ -358,29 +974,106 @@ def define_tests_single(context, objspec, names2test_objects,
         c = context.child(f.__name__)
         c.add_extra_report_keys(objspec=objspec.name, function=f.__name__)
 
-        it = iterate_context_names(c, list(test_objects), key=objspec.name)
+        it = iterate_context_names_selected(c, universe, selected,
+                                            key=objspec.name)
         for cc, id_object in it:
             ob_job_id = test_objects[id_object]
             assert_job_exists(ob_job_id, db)
             ob = Promise(ob_job_id)
             job_id = 'f'
             
-            params = dict(job_id=job_id, command_name=f.__name__)
+            params = dict(job_id=job_id, command_name=f.__name__,
+                          output_dir=output_dir)
+            fixtures = get_fixtures_for(fixture_jobs, x, (objspec.name,),
+                                        (id_object,), (ob,))
+            if fixtures:
+                params['fixtures'] = fixtures
+            deps = get_requirements(required, x, (objspec.name,), (id_object,))
+            if deps:
+                params['extra_dep'] = deps
             if dynamic:
                 res = cc.comp_config_dynamic(wrap_func_dyn, f, id_object, ob, 
-                                             **params)
+                                             objspecs=(objspec.name,), **params)
             else:
-                res = cc.comp_config(wrap_func, f, id_object, ob, 
+                keep = keep_result(f, create_reports)
+                res = cc.comp_config(wrap_func, f, id_object, ob, keep,
+                                     objspecs=(objspec.name,), retries=retries,
                                      **params)
             results[id_object] = res
+        jobs[f.__name__] = dict((k, v.job_id) for k, v in results.items())
 
         if create_reports:
             r = c.comp(report_results_single, f, objspec.name, results)
             c.add_report(r, 'single')
+            if get_requires(f):
+                add_report_jobs(c, f, objspec.name, results, 'jobs_single')
+    return jobs
+
+
+@contract(names2test_objects='dict(str:dict(str:str))')
+def define_tests_batched(context, objspec, names2test_objects, batched,
+                         create_reports, only_object=None, retries=0,
+                         output_dir=None):
+    test_objects = names2test_objects[objspec.name]
+    selected = select_names(only_object, list(test_objects))
+    if not batched or not selected:
+        return
+    universe = sorted(get_all_objects(objspec, test_objects, only_object))
+    db = context.cc.get_compmake_db()
+
+    for x in batched:
+        f = x['function']
+        results = {}
+
+        c = context.child(f.__name__)
+        c.add_extra_report_keys(objspec=objspec.name, function=f.__name__)
+
+        keep = keep_result(f, create_reports)
+        batches = {}
+        for i, ids in get_chunks(universe, selected, x['chunk']):
+            for id_object in ids:
+                assert_job_exists(test_objects[id_object], db)
+            obs = [Promise(test_objects[id_object]) for id_object in ids]
+            batch = c.comp_config(wrap_func_batched, f, ids, obs, keep,
+                                  objspecs=(objspec.name,), retries=retries,
+                                  job_id='batch%d' % i, command_name=f.__name__)
+            for id_object in ids:
+                batches[id_object] = batch
+
+        it = iterate_context_names_selected(c, universe, selected,
+                                            key=objspec.name)
+        for cc, id_object in it:
+            res = cc.comp_config(get_batched_result, f, batches[id_object],
+                                 id_object, keep, objspecs=(objspec.name,),
+                                 output_dir=output_dir, job_id='f')
+            results[id_object] = res
+
+        if create_reports:
+            r = c.comp(report_results_single, f, objspec.name, results)
+            c.add_report(r, 'batched')
+
+
+@contract(universe='list(str)', selected='list(str)', chunk='None|int,>=1')
+def get_chunks(universe, selected, chunk):
+    """ 
+        Returns the list of (i, objects) for the chunks of a batched test.
+        The chunks are taken from all the objects, so that they do not 
+        depend on the selection; the empty ones are omitted.
+    """
+    if chunk is None:
+        chunk = max(1, len(universe))
+    chunks = []
+    for i in range(0, len(universe), chunk):
+        ids = [x for x in universe[i:i + chunk] if x in selected]
+        if ids:
+            chunks.append((i // chunk, ids))
+    return chunks
 
 
 @contract(names2test_objects='dict(str:dict(str:str))', create_reports='bool')
-def define_tests_pairs(context, objspec1, names2test_objects, pairs, create_reports):
+def define_tests_pairs(context, objspec1, names2test_objects, pairs, create_reports,
+                       only_object=None, retries=0, fixture_jobs=None,
+                       required=None, output_dir=None):
     objs1 = names2test_objects[objspec1.name]
 
     if not pairs:
@@ -408,26 +1101,46 @@ def define_tests_pairs(context, objspec1, names2test_objects, pairs, create_repo
         
         db = context.cc.get_compmake_db()
         
-        combinations = iterate_context_names_pair(cx, list(objs1), list(objs2),
-                                                  key1=objspec1.name, key2=objspec2.name)
+        names1 = get_all_objects(objspec1, objs1, only_object)
+        names2 = get_all_objects(objspec2, objs2, only_object)
+        combinations = iterate_pairs_selected(cx, names1, names2, 
+                                              list(objs1), list(objs2),
+                                              only_object, key1=objspec1.name,
+                                              key2=objspec2.name)
         for c, id_ob1, id_ob2 in combinations:
+            if not pair_selected(x, id_ob1, id_ob2):
+                continue
             assert_job_exists(objs1[id_ob1], db) 
             assert_job_exists(objs2[id_ob2], db)
             ob1 = Promise(objs1[id_ob1])
             ob2 = Promise(objs2[id_ob2])
             
-            params=dict(job_id='f', command_name=func.__name__)
+            params = dict(job_id='f', command_name=func.__name__,
+                          output_dir=output_dir)
+            objspecs = (objspec1.name, objspec2.name)
+            fixtures = get_fixtures_for(fixture_jobs, x, objspecs,
+                                        (id_ob1, id_ob2), (ob1, ob2))
+            if fixtures:
+                params['fixtures'] = fixtures
+            deps = get_requirements(required, x, objspecs, (id_ob1, id_ob2))
+            if deps:
+                params['extra_dep'] = deps
             if dynamic:
                 res = c.comp_config_dynamic(wrap_func_pair_dyn,
                                             func, id_ob1, ob1, id_ob2, ob2,
-                                            **params)
+                                            objspecs=objspecs, **params)
             else:
+                keep = keep_result(func, create_reports)
                 res = c.comp_config(wrap_func_pair,
-                                    func, id_ob1, ob1, id_ob2, ob2,
+                                    func, id_ob1, ob1, id_ob2, ob2, keep,
+                                    objspecs=objspecs, retries=retries,
                                     **params)
             results[(id_ob1, id_ob2)] = res
             jobs[(id_ob1, id_ob2)] = res.job_id
 
+        mirror_pairs(x, results)
+        mirror_pairs(x, jobs)
+
         warnings.warn('disabled report functionality')
 
         if create_reports:
@@ -441,7 +1154,9 @@ def define_tests_pairs(context, objspec1, names2test_objects, pairs, create_repo
 
 
 @contract(names2test_objects='dict(str:dict(str:str))', create_reports='bool')
-def define_tests_some_pairs(context, objspec1, names2test_objects, some_pairs, create_reports):
+def define_tests_some_pairs(context, objspec1, names2test_objects, some_pairs, create_reports,
+                            only_object=None, retries=0, fixture_jobs=None,
+                            required=None, output_dir=None):
     if not some_pairs:
         print('No %s+x pairs mcdp_lang_tests.' % (objspec1.name))
         return
@@ -458,8 +1173,20 @@ def define_tests_some_pairs(context, objspec1, names2test_objects, some_pairs, c
         allobjs1 = names2test_objects[objspec1.name]
         allobjs2 = names2test_objects[objspec2.name]
 
-        objs1 = expand_string(which1, list(allobjs1))
-        objs2 = expand_string(which2, list(allobjs2))
+        if only_object is not None:
+            # only some objects were instanced
+            names1 = select_names(which1, get_all_objects(objspec1, allobjs1,
+                                                          only_object))
+            names2 = select_names(which2, get_all_objects(objspec2, allobjs2,
+                                                          only_object))
+            objs1 = [k for k in names1 if k in allobjs1]
+            objs2 = [k for k in names2 if k in allobjs2]
+            if not objs1 or not objs2:
+                continue
+        else:
+            objs1 = expand_string(which1, list(allobjs1))
+            objs2 = expand_string(which2, list(allobjs2))
+            names1, names2 = objs1, objs2
 
         if not objs1:
             msg = 'No objects %r in %r.' % (which1, list(allobjs1))
@@ -469,14 +1196,14 @@ def define_tests_some_pairs(context, objspec1, names2test_objects, some_pairs, c
             msg = 'No objects %r in %r.' % (which2, list(allobjs2))
             raise ValueError(msg)
 
-        for x in objs1:
-            if not x in allobjs1:
-                msg = '%r expanded to %r but %r is not in universe %r.' % (which1, objs1, x, list(allobjs1))
+        for id_ob in objs1:
+            if not id_ob in allobjs1:
+                msg = '%r expanded to %r but %r is not in universe %r.' % (which1, objs1, id_ob, list(allobjs1))
                 raise ValueError(msg)
 
-        for x in objs2:
-            if not x in allobjs2:
-                msg = '%r expanded to %r but %r is not in universe %r.' % (which2, objs2, x, list(allobjs2))
+        for id_ob in objs2:
+            if not id_ob in allobjs2:
+                msg = '%r expanded to %r but %r is not in universe %r.' % (which2, objs2, id_ob, list(allobjs2))
                 raise ValueError(msg)
 
         cx = context.child(func.__name__)
@@ -486,28 +1213,54 @@ def define_tests_some_pairs(context, objspec1, names2test_objects, some_pairs, c
 
         use_objs1 = dict((k, allobjs1[k]) for k in objs1)
         use_objs2 = dict((k, allobjs2[k]) for k in objs2)
-        define_tests_some_pairs_(cx, db, objspec1, objspec2, use_objs1, use_objs2, func, dynamic, create_reports)
-
-def define_tests_some_pairs_(cx, db, objspec1, objspec2, objs1, objs2, func, dynamic, create_reports):
+        define_tests_some_pairs_(cx, db, objspec1, objspec2, use_objs1, use_objs2, func, dynamic, create_reports,
+                                 only_object=only_object, names1=names1, names2=names2,
+                                 retries=retries, fixture_jobs=fixture_jobs,
+                                 test=x, required=required,
+                                 output_dir=output_dir)
+
+def define_tests_some_pairs_(cx, db, objspec1, objspec2, objs1, objs2, func, dynamic, create_reports,
+                             only_object=None, names1=None, names2=None,
+                             retries=0, fixture_jobs=None, test=None,
+                             required=None, output_dir=None):
+    """ 
+        names1, names2: the objects used for naming the contexts (default: objs1, objs2) 
+        test: the registration, for its fixtures
+    """
     results = {}
     jobs = {}
-    combinations = iterate_context_names_pair(cx, list(objs1), list(objs2),
-                                              key1=objspec1.name, key2=objspec2.name)
+    if names1 is None:
+        names1 = list(objs1)
+    if names2 is None:
+        names2 = list(objs2)
+    combinations = iterate_pairs_selected(cx, names1, names2, 
+                                          list(objs1), list(objs2), only_object,
+                                          key1=objspec1.name, key2=objspec2.name)
     for c, id_ob1, id_ob2 in combinations:
         assert_job_exists(objs1[id_ob1], db)
         assert_job_exists(objs2[id_ob2], db)
         ob1 = Promise(objs1[id_ob1])
         ob2 = Promise(objs2[id_ob2])
 
-        params = dict(job_id='f', command_name=func.__name__)
+        params = dict(job_id='f', command_name=func.__name__,
+                      output_dir=output_dir)
+        objspecs = (objspec1.name, objspec2.name)
+        fixtures = get_fixtures_for(fixture_jobs, test, objspecs,
+                                    (id_ob1, id_ob2), (ob1, ob2))
+        if fixtures:
+            params['fixtures'] = fixtures
+        deps = get_requirements(required, test, objspecs, (id_ob1, id_ob2))
+        if deps:
+            params['extra_dep'] = deps
         if dynamic:
             res = c.comp_config_dynamic(wrap_func_pair_dyn,
                                         func, id_ob1, ob1, id_ob2, ob2,
-                                        **params)
+                                        objspecs=objspecs, **params)
         else:
+            keep = keep_result(func, create_reports)
             res = c.comp_config(wrap_func_pair,
-                                func, id_ob1, ob1, id_ob2, ob2,
-                                **params)
+                                func, id_ob1, ob1, id_ob2, ob2, keep,
+                                objspecs=objspecs, retries=retries, **params)
         results[(id_ob1, id_ob2)] = res
         jobs[(id_ob1, id_ob2)] = res.job_id
 
@@ -522,30 +1275,147 @@ def define_tests_some_pairs_(cx, db, objspec1, objspec2, objs1, objs2, func, dyn
         cx.add_report(r, 'pairs_some')
 
 
-def wrap_func(func, id_ob1, ob1):
-    # print('%20s: %s' % (id_ob1, describe_value(ob1)))
-    return func(id_ob1, ob1)
+# The wrappers record the outcome of each test (see outcomes.py)
+
+def get_fixtures_for(fixture_jobs, test, objspecs, ids, obs):
+    """ Returns the fixtures (dict parameter -> Promise) for one test job. """
+    if fixture_jobs is None or test is None or not test.get('fixtures'):
+        return {}
+    return fixture_jobs.get_promises(test['fixtures'], objspecs, ids, obs)
 
-def wrap_func_dyn(context, func, id_ob1, ob1):
+def wrap_func_simple(func, args, kwargs, keep, retries=0, output_dir=None):
+    with record_outcome(func, (), (), output_dir) as outcome:
+        res = call_with_retries(outcome, retries, func, *args, **kwargs)
+        outcome.set_result(res)
+    return compact_result(res, keep)
+
+def wrap_func(func, id_ob1, ob1, keep=True, objspecs=(), retries=0,
+              fixtures=None, output_dir=None):
+    # print('%20s: %s' % (id_ob1, describe_value(ob1)))
+    ob1 = transport_load(ob1)
+    with record_outcome(func, objspecs, (id_ob1,), output_dir) as outcome:
+        res = call_with_retries(outcome, retries, func, id_ob1, ob1,
+                                **load_fixtures(fixtures))
+        outcome.set_result(res)
+    return compact_result(res, keep)
+
+def wrap_func_dyn(context, func, id_ob1, ob1, objspecs=(), fixtures=None,
+                  output_dir=None):
     # print('%20s: %s' % (id_ob1, describe_value(ob1)))
-    return func(context, id_ob1,ob1)
+    ob1 = transport_load(ob1)
+    with record_outcome(func, objspecs, (id_ob1,), output_dir):
+        return func(context, id_ob1,ob1, **load_fixtures(fixtures))
   
-def wrap_func_pair_dyn(context, func, id_ob1, ob1, id_ob2, ob2):
+def wrap_func_pair_dyn(context, func, id_ob1, ob1, id_ob2, ob2, objspecs=(),
+                       fixtures=None, output_dir=None):
     # print('%20s: %s' % (id_ob1, describe_value(ob1)))
     # print('%20s: %s' % (id_ob2, describe_value(ob2)))
-    return func(context, id_ob1,ob1,id_ob2,ob2)
+    ob1 = transport_load(ob1)
+    ob2 = transport_load(ob2)
+    with record_outcome(func, objspecs, (id_ob1, id_ob2), output_dir):
+        return func(context, id_ob1,ob1,id_ob2,ob2, **load_fixtures(fixtures))
  
-def wrap_func_pair(func, id_ob1, ob1, id_ob2, ob2):
+def wrap_func_pair(func, id_ob1, ob1, id_ob2, ob2, keep=True, objspecs=(),
+                   retries=0, fixtures=None, output_dir=None):
     # print('%20s: %s' % (id_ob1, describe_value(ob1)))
     # print('%20s: %s' % (id_ob2, describe_value(ob2)))
-    return func(id_ob1,ob1,id_ob2,ob2)
+    ob1 = transport_load(ob1)
+    ob2 = transport_load(ob2)
+    with record_outcome(func, objspecs, (id_ob1, id_ob2), output_dir) as outcome:
+        res = call_with_retries(outcome, retries, func, id_ob1, ob1, id_ob2, ob2,
+                                **load_fixtures(fixtures))
+        outcome.set_result(res)
+    return compact_result(res, keep)
+
+def wrap_func_batched(func, ids, obs, keep=True, objspecs=(), retries=0):
+    obs = [transport_load(ob) for ob in obs]
+    # the outcome of each object is recorded by get_batched_result()
+    if isinstance(func, ConcurrentWrap):
+        # retried per object, not running the others again
+        batch = func(list(zip(ids, obs)), retries=retries)
+    else:
+        batch = call_with_retries(NoOutcome(), retries, func, 
+                                  list(zip(ids, obs)))
+    return compact_batch(batch, keep)
 
-@contract(objspec=ObjectSpec, returns='dict(str:str)')
-def get_testobjects_promises_for_objspec(context, objspec):
+def compact_batch(batch, keep):
+    """ 
+        Applies compact_result() to the result of each object; the
+        exceptions are replaced by an ObjectFailure, which can be pickled.
+    """
+    if isinstance(batch, Flaky):
+        return Flaky(compact_batch(batch.get_result(), keep), 
+                     batch.get_attempts())
+    if not isinstance(batch, dict):  # reported by get_batched_result()
+        return batch
+    res = {}
+    for id_object, x in batch.items():
+        if isinstance(x, Exception):
+            x = ObjectFailure(exception=type(x).__name__, message=str(x),
+                              traceback='',
+                              assertion=isinstance(x, AssertionError))
+        if not isinstance(x, ObjectFailure):
+            x = compact_result(x, keep)
+        res[id_object] = x
+    return res
+
+def get_batched_result(func, batch, id_object, keep=True, objspecs=(),
+                       output_dir=None):
+    """ Returns the result of one object of a batched test. """
+    with record_outcome(func, objspecs, (id_object,), output_dir) as outcome:
+        attempts = None
+        if isinstance(batch, Flaky):
+            attempts = batch.get_attempts()
+            batch = batch.get_result()
+        if not isinstance(batch, dict) or not id_object in batch:
+            msg = ('%s did not return a result for %r.' %
+                   (func.__name__, id_object))
+            raise ValueError(msg)
+        res = batch[id_object]
+        if isinstance(res, ObjectFailure):  # raised for this object
+            raise res.get_exception()
+        if isinstance(res, Flaky):  # retried alone (ConcurrentWrap)
+            attempts = res.get_attempts()
+            res = res.get_result()
+        if attempts is not None:
+            outcome.set_attempts(attempts, flaky=True)
+            res = Flaky(res, attempts)
+        outcome.set_result(res)
+    return compact_result(res, keep)
+
+def call_with_retries(outcome, retries, func, *args, **kwargs):
+    """ 
+        Calls func; if it raises an exception, calls it again, up to
+        "retries" times. A test that passes after failing is flaky:
+        the result is wrapped in Flaky and the outcome records the attempts.
+    """
+    for attempt in range(1, retries + 2):
+        try:
+            res = func(*args, **kwargs)
+        except Exception as e:
+            if attempt > retries:
+                if attempt > 1:
+                    outcome.set_attempts(attempt, flaky=False)
+                raise
+            logger.warn('%s failed (attempt %d of %d): %s' %
+                        (func.__name__, attempt, retries + 1, e))
+            continue
+        if attempt > 1:
+            outcome.set_attempts(attempt, flaky=True)
+            return Flaky(res, attempt)
+        return res
+
+@contract(objspec=ObjectSpec, transport='None|dict', which='None|list(str)',
+          returns='dict(str:str)')
+def get_testobjects_promises_for_objspec(context, objspec, transport=None,
+                                         which=None, cache=None,
+                                         serializer=None):
+    """ Defines the instance jobs for the objects in which (default: all). """
     warnings.warn('Need to be smarter here.')
     objspec.master.load()
-    warnings.warn('Select test objects here.')
     objects = sorted(objspec.keys())
+    if which is not None:
+        objects = [x for x in objects if x in which]
 
     if False:
         warnings.warn("Maybe warn here.")
@@ -557,10 +1427,25 @@ def get_testobjects_promises_for_objspec(context, objspec):
     for id_object in objects:
         params = dict(job_id='%s-instance-%s' % (objspec.name, id_object),
                       command_name='instance_%s' %objspec.name)
+        if cache is not None and objspec.instance_method is not None:
+            # not passed otherwise, not to redefine the existing jobs
+            params['cache'] = cache
+        if (serializer is not None and objspec.instance_method is not None
+                and transport is None):
+            params['serializer'] = serializer
         if objspec.instance_method is None:
             job = context.comp_config(get_spec, master_name=objspec.master.name,
                                   objspec_name=objspec.name, id_object=id_object,
                                   **params)
+        elif transport is not None:
+            dirname = os.path.join(os.path.realpath(context.get_output_dir()),
+                                   'shared-arrays')
+            job = context.comp_config(instance_object_shared,
+                                      master_name=objspec.master.name,
+                                      objspec_name=objspec.name, id_object=id_object,
+                                      dirname=dirname, prefix=params['job_id'],
+                                      threshold=transport['threshold'],
+                                      **params)
         else:
             job = context.comp_config(instance_object, 
                                       master_name=objspec.master.name,
@@ -581,9 +1466,35 @@ def get_spec(master_name, objspec_name, id_object):
     return objspec[id_object]
 
 
-def instance_object(master_name, objspec_name, id_object):
+def instance_object(master_name, objspec_name, id_object, cache=None,
+                    serializer=None):
     objspec = get_objspec(master_name, objspec_name)
-    return objspec.instance(id_object)
+    if cache is None:
+        ob = objspec.instance(id_object)
+    else:
+        key = get_instance_key(objspec, id_object, cache.salt)
+        found, ob = cache.get(key)
+        if found:
+            logger.debug('Instance of %s from the cache.' % id_object)
+        else:
+            ob = objspec.instance(id_object)
+            cache.put(key, ob)
+    return serialize(ob, serializer)
+
+
+def get_instance_cache():
+    """ Returns the InstanceCache given on the command line, or None. """
+    options = ComptestsRegistrar.settings['instance_cache']
+    if options is None:
+        return None
+    return InstanceCache(**options)
+
+
+def instance_object_shared(master_name, objspec_name, id_object, dirname,
+                           prefix, threshold, cache=None):
+    ob = instance_object(master_name, objspec_name, id_object, cache=cache)
+    return shared_arrays_dump(ob, dirname=dirname, prefix=prefix,
+                              threshold=threshold)
 
 
 def get_objspec(master_name, objspec_name):
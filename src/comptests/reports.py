@@ -1,4 +1,4 @@
-from .results import PartiallySkipped, Skipped
+from .results import BenchmarkResult, Flaky, PartiallySkipped, Skipped
 from compmake.jobs.storage import get_job_cache, get_job_userobject
 from compmake.structures import Cache
 from contracts import contract
@@ -10,24 +10,41 @@ __all__ = [
     'report_results_single',
     'report_results_pairs', 
     'report_results_pairs_jobs',          
+    'report_results_single_jobs',
 ]
 
+
+def get_string_result(res, reason2symbol=None):
+    """
+        Describes the result of a test in a report cell. If reason2symbol
+        is given, the skip reasons are numbered in it (for the notes).
+    """
+    if isinstance(res, Flaky):
+        return 'flaky(%d) %s' % (res.get_attempts(),
+                                 get_string_result(res.get_result(),
+                                                   reason2symbol))
+    if res is None:
+        s = 'ok'
+    elif isinstance(res, Skipped):
+        s = 'skipped'
+        if reason2symbol is not None:
+            reason = res.get_reason()
+            if not reason in reason2symbol:
+                reason2symbol[reason] = len(reason2symbol) + 1
+            s += '(%s)' % reason2symbol[reason]
+    elif isinstance(res, PartiallySkipped):
+        parts = res.get_skipped_parts()
+        s = 'no ' + ','.join(parts)
+    elif isinstance(res, BenchmarkResult):
+        s = res.get_string()
+    else:
+        print('how to interpret %s? ' % describe_value(res))
+        s = '?'
+    return s
+
+
 @contract(results='dict(str:*)')
 def report_results_single(func, objspec_name, results):
-    
-    def get_string_result(res):
-        if res is None:
-            s = 'ok'
-        elif isinstance(res, Skipped):
-            s = 'skipped'
-        elif isinstance(res, PartiallySkipped):
-            parts = res.get_skipped_parts()
-            s = 'no ' +','.join(parts)
-        else:
-            print('how to interpret %s? ' % describe_value(res))
-            s = '?'
-        return s
-
     r = Report()
     if not results:
         r.text('warning', 'no test objects defined')
@@ -44,6 +61,33 @@ def report_results_single(func, objspec_name, results):
     r.table('summary', rows=rows, data=data)
     return r
 
+
+@contract(jobs='dict(str:str)')
+def report_results_single_jobs(context, func, objspec_name, jobs):
+    """ This version gets the jobs ID, and shows the blocked ones. """
+    r = Report()
+    if not jobs:
+        r.text('warning', 'no test objects defined')
+        return r
+
+    db = context.cc.get_compmake_db()
+    rows = sorted(jobs)
+    data = []
+    for id_object in rows:
+        cache = get_job_cache(jobs[id_object], db)
+        if cache.state == Cache.DONE:
+            s = get_string_result(get_job_userobject(jobs[id_object], db))
+        elif cache.state == Cache.FAILED:
+            s = 'FAIL'
+        elif cache.state == Cache.BLOCKED:
+            s = 'blocked'
+        else:
+            s = ' '
+        data.append([s])
+
+    r.table('summary', rows=rows, data=data)
+    return r
+
         
     
 
@@ -51,25 +95,6 @@ def report_results_single(func, objspec_name, results):
 def report_results_pairs(func, objspec1_name, objspec2_name, results):
     reason2symbol = {}
 
-    def get_string_result(res):
-        if res is None:
-            s = 'ok'
-        elif isinstance(res, Skipped):
-            s = 'skipped'
-            reason = res.get_reason()
-            if not reason in reason2symbol:
-                reason2symbol[reason] = len(reason2symbol) + 1
-            s += '(%s)' %  reason2symbol[reason]
-                
-        elif isinstance(res, PartiallySkipped):
-            parts = res.get_skipped_parts()
-            s = 'no ' +','.join(parts)
-        else:
-            print('how to interpret %s? ' % describe_value(res))
-            s = '?'
-        return s
-    
-
     r = Report()
     if not results:
         r.text('warning', 'no test objects defined')
@@ -81,8 +106,11 @@ def report_results_pairs(func, objspec1_name, objspec2_name, results):
     # a nice bug: data = [[None * len(cols)] * len(rows)
 
     for ((i, id_object1), (j, id_object2)) in itertools.product(enumerate(rows), enumerate(cols)):
+        if not (id_object1, id_object2) in results:  # e.g. include_diagonal=False
+            data[i][j] = '-'
+            continue
         res = results[(id_object1, id_object2)]
-        data[i][j] = get_string_result(res)
+        data[i][j] = get_string_result(res, reason2symbol)
  
     r.table('summary', rows=rows, data=data, cols=cols)
     
@@ -99,25 +127,6 @@ def report_results_pairs_jobs(context, func, objspec1_name, objspec2_name, jobs)
     """ This version gets the jobs ID """
     reason2symbol = {}
 
-    def get_string_result(res):
-        if res is None:
-            s = 'ok'
-        elif isinstance(res, Skipped):
-            s = 'skipped'
-            reason = res.get_reason()
-            if not reason in reason2symbol:
-                reason2symbol[reason] = len(reason2symbol) + 1
-            s += '(%s)' %  reason2symbol[reason]
-                
-        elif isinstance(res, PartiallySkipped):
-            parts = res.get_skipped_parts()
-            s = 'no ' +','.join(parts)
-        else:
-            print('how to interpret %s? ' % describe_value(res))
-            s = '?'
-        return s
-    
-
     r = Report()
     if not jobs:
         r.text('warning', 'no test objects defined')
@@ -128,16 +137,19 @@ def report_results_pairs_jobs(context, func, objspec1_name, objspec2_name, jobs)
     data = [[None for a in range(len(cols))] for b in range(len(rows))]
     # a nice bug: data = [[None * len(cols)] * len(rows)
 
-    db = context.get_compmake_db()
+    db = context.cc.get_compmake_db()
     
     comb = itertools.product(enumerate(rows), enumerate(cols))
     for ((i, id_object1), (j, id_object2)) in comb:
+        if not (id_object1, id_object2) in jobs:
+            data[i][j] = '-'
+            continue
         job_id = jobs[(id_object1, id_object2)]
         cache = get_job_cache(job_id, db)
         
         if cache.state == Cache.DONE:
             res = get_job_userobject(job_id, db)
-            s = get_string_result(res)
+            s = get_string_result(res, reason2symbol)
         elif cache.state == Cache.FAILED:
             s = 'FAIL'
         elif cache.state == Cache.BLOCKED:
@@ -0,0 +1,100 @@
+from compmake import Promise
+from contracts import contract
+
+
+__all__ = [
+    'comptests_requires',
+]
+
+
+def comptests_requires(*functions):
+    """
+        Decorator for a test that must run only if the given tests
+        (registered with comptests_for_all) passed for its object(s);
+        otherwise its job is blocked and not executed:
+
+            @for_all_robot_world_pairs
+            @comptests_requires(check_robot_type)
+            def check_navigation(id_robot, robot, id_world, world):
+                ...
+    """
+    def register(f):
+        f.comptests_requires = list(functions)
+        return f
+    return register
+
+
+def get_requires(f):
+    return getattr(f, 'comptests_requires', [])
+
+
+@contract(registrations='dict(str:dict)', registered='dict(str:list)')
+def check_requirements(registrations, registered):
+    """
+        Checks that the tests require only tests registered for all the
+        objects of (one of) their objspecs, which do not require other tests.
+
+        registered: objspec name -> functions registered with comptests_for_all.
+    """
+    for name, r in registrations.items():
+        for k, tests in r.items():
+            for x in tests:
+                f = x['function']
+                requires = get_requires(f)
+                if requires and k == 'batched':
+                    msg = 'Batched test %s cannot require other tests.' % f.__name__
+                    raise ValueError(msg)
+                names = [name]
+                if 'objspec2' in x:
+                    names.append(x['objspec2'].name)
+                for g in requires:
+                    if not any(g in registered.get(n, []) for n in names):
+                        msg = ('Test %s requires %s, which is not registered '
+                               'with comptests_for_all() for %s.' %
+                               (f.__name__, getattr(g, '__name__', g),
+                                ' or '.join(names)))
+                        raise ValueError(msg)
+                    if get_requires(g):
+                        msg = ('Test %s requires %s, which requires other '
+                               'tests.' % (f.__name__, g.__name__))
+                        raise ValueError(msg)
+
+
+@contract(r='dict(str:list)', returns='tuple(dict, dict)')
+def split_requiring(r):
+    """
+        Splits the registrations of one objspec (see get_registrations())
+        in the tests that can be defined first and the ones that must be
+        defined after the tests they require. The pair tests are
+        kept together, as they share the pair fixtures.
+    """
+    pairs_later = any(get_requires(x['function'])
+                      for k in ['pairs', 'some_pairs'] for x in r.get(k, []))
+    first = dict((k, []) for k in r)
+    later = dict((k, []) for k in r)
+    for k, tests in r.items():
+        for x in tests:
+            if (get_requires(x['function']) or
+                    (pairs_later and k in ['pairs', 'some_pairs'])):
+                later[k].append(x)
+            else:
+                first[k].append(x)
+    return first, later
+
+
+def get_requirements(required, test, objspecs, ids):
+    """
+        Returns the jobs (as Promises) of the tests required by test for
+        the objects ids. required is objspec name -> function name ->
+        id_object -> job_id; the tests not defined (for example,
+        not selected) are ignored.
+    """
+    deps = []
+    if not required or test is None:
+        return deps
+    for g in get_requires(test['function']):
+        for name, id_object in zip(objspecs, ids):
+            job_id = required.get(name, {}).get(g.__name__, {}).get(id_object)
+            if job_id is not None and not job_id in [d.job_id for d in deps]:
+                deps.append(Promise(job_id))
+    return deps
@@ -3,6 +3,8 @@ from contracts import contract
 __all__ = [
     'Skipped',
     'PartiallySkipped',
+    'BenchmarkResult',
+    'Flaky',
 ]
 
 class Skipped():
@@ -27,4 +29,55 @@ class PartiallySkipped():
         self.skipped = set(skipped)
         
     def get_skipped_parts(self):
-        return self.skipped
\ No newline at end of file
+        return self.skipped
+
+class BenchmarkResult():
+    """
+        Returned by the benchmarks: timing statistics for this run
+        and for the baseline (None if there was no baseline).
+    """
+    @contract(stats='dict', baseline='None|dict', tolerance='float|int')
+    def __init__(self, stats, baseline, tolerance):
+        self.stats = stats
+        self.baseline = baseline
+        self.tolerance = tolerance
+
+    def get_stats(self):
+        return self.stats
+
+    def get_relative_change(self):
+        """ Returns the relative change of the median, or None. """
+        if self.baseline is None or self.baseline['median'] <= 0:
+            return None
+        return self.stats['median'] / self.baseline['median'] - 1
+
+    def is_regression(self):
+        change = self.get_relative_change()
+        return change is not None and change > self.tolerance
+
+    def get_string(self):
+        s = '%.3gms' % (self.stats['median'] * 1000)
+        change = self.get_relative_change()
+        if change is not None:
+            s += ' (%+d%%)' % round(change * 100)
+            if self.is_regression():
+                s = 'REGRESSION ' + s
+        elif self.baseline is None:
+            s += ' (no baseline)'
+        return s
+
+class Flaky():
+    """
+        Wraps the result of a test that passed only after failing
+        (with --retries); attempts is the number of executions.
+    """
+    @contract(attempts='int,>=2')
+    def __init__(self, result, attempts):
+        self.result = result
+        self.attempts = attempts
+
+    def get_result(self):
+        return self.result
+
+    def get_attempts(self):
+        return self.attempts
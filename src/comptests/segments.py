@@ -0,0 +1,112 @@
+import atexit
+import json
+from multiprocessing.util import Finalize
+import os
+import socket
+import time
+
+from contracts import contract
+
+
+__all__ = [
+    'SegmentLog',
+    'get_segment_log',
+    'iterate_segments',
+    'set_output_dir',
+    'get_output_path',
+]
+
+
+class SegmentLog(object):
+    """
+        Append-only log of JSON records, stored in a directory.
+
+        Each process appends JSON lines to its own segment file
+        (so that no locking is needed, also on network filesystems);
+        the records are buffered and written in batches.
+    """
+
+    @contract(dirname='str', batch_size='int,>=1', interval='float|int')
+    def __init__(self, dirname, batch_size=100, interval=5.0):
+        self.dirname = dirname
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buffer = []
+        self.last_flush = time.time()
+        self.segment = '%s-%s.jsonl' % (socket.gethostname(), os.getpid())
+
+    @contract(record='dict')
+    def append_record(self, record):
+        self.buffer.append(record)
+        if (len(self.buffer) >= self.batch_size or
+                time.time() - self.last_flush > self.interval):
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if not self.buffer:
+            return
+        if not os.path.exists(self.dirname):
+            os.makedirs(self.dirname)
+        data = ''.join(json.dumps(r) + '\n' for r in self.buffer)
+        with open(os.path.join(self.dirname, self.segment), 'a') as f:
+            f.write(data)
+        self.buffer = []
+
+
+class OutputDir(object):
+    """
+        Static storage: the output dir (comptests -o) of the jobs that
+        this process executes; the test wrappers set it (see record_outcome).
+    """
+    dirname = 'out-comptests'
+
+
+def set_output_dir(dirname):
+    if dirname is not None:
+        OutputDir.dirname = dirname
+
+
+def get_output_path(name, output_dir=None):
+    """ Returns the path of name in output_dir (default: the current one). """
+    return os.path.join(output_dir or OutputDir.dirname, name)
+
+
+class SegmentLogStorage(object):
+    """ Static storage """
+    # (class, dirname, pid) -> SegmentLog
+    logs = {}
+
+
+def get_segment_log(log_class, dirname):
+    """ 
+        Returns the log for this process (forked workers get a new one),
+        which is flushed at exit.
+    """
+    key = (log_class, os.path.realpath(dirname), os.getpid())
+    if not key in SegmentLogStorage.logs:
+        log = log_class(dirname)
+        SegmentLogStorage.logs[key] = log
+        atexit.register(log.flush)
+        # the workers of multiprocessing do not run the atexit functions
+        Finalize(None, log.flush, exitpriority=10)
+    return SegmentLogStorage.logs[key]
+
+
+def iterate_segments(dirname):
+    """ Yields (segment, offset, record). """
+    if not os.path.exists(dirname):
+        return
+    for segment in sorted(os.listdir(dirname)):
+        if not segment.endswith('.jsonl'):
+            continue
+        with open(os.path.join(dirname, segment)) as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                # the last line might be partially written
+                if not line.endswith('\n'):
+                    break
+                yield segment, offset, json.loads(line)
@@ -0,0 +1,153 @@
+import zlib
+
+try:
+    import cPickle as pickle
+    from cStringIO import StringIO as BytesIO  # much faster with cPickle
+except ImportError:  # pragma: no cover
+    import pickle
+    from io import BytesIO
+
+from contracts import contract
+
+
+__all__ = [
+    'PickleSerializer',
+    'SerializedObject',
+    'register_serializer',
+    'get_serializer',
+]
+
+
+class SerializedObject():
+    """
+        An object serialized by a Serializer; this is what the compmake
+        DB stores instead of the object (see transport_load()).
+    """
+    def __init__(self, serializer, data, buffers):
+        self.serializer = serializer
+        self.data = data
+        self.buffers = buffers
+
+    def load(self):
+        return self.serializer.loads(self)
+
+    def get_size(self):
+        return len(self.data) + sum(len(b) for b in self.buffers)
+
+
+class PickleSerializer():
+    """
+        Pickles with the highest protocol, optionally compressing with
+        "zlib" or "lz4" (if installed). The contiguous NumPy arrays
+        larger than array_threshold bytes are stored out of band,
+        as raw buffers compressed separately, instead of inside the pickle.
+    """
+    @contract(compression='None|str', level='int,>=0', array_threshold='int,>=0')
+    def __init__(self, compression=None, level=1, array_threshold=64 * 1024):
+        if not compression in [None, 'zlib', 'lz4']:
+            msg = 'Unknown compression %r.' % compression
+            raise ValueError(msg)
+        if compression == 'lz4':
+            import_lz4()
+        self.compression = compression
+        self.level = level
+        self.array_threshold = array_threshold
+
+    def __repr__(self):
+        return 'PickleSerializer(%s)' % self.compression
+
+    def compress(self, data):
+        if self.compression == 'zlib':
+            return zlib.compress(data, self.level)
+        if self.compression == 'lz4':
+            return import_lz4().compress(data)
+        return data
+
+    def decompress(self, data):
+        if self.compression == 'zlib':
+            return zlib.decompress(data)
+        if self.compression == 'lz4':
+            return import_lz4().decompress(data)
+        return data
+
+    def dumps(self, ob):
+        """ Returns a SerializedObject. """
+        buffers = []
+
+        def persistent_id(x):
+            if not is_large_array(x, self.array_threshold):
+                return None
+            order = 'C' if x.flags.c_contiguous else 'F'
+            buffers.append(self.compress(x.tobytes(order=order)))
+            return (len(buffers) - 1, x.dtype.str, x.shape, order)
+
+        s = BytesIO()
+        p = pickle.Pickler(s, pickle.HIGHEST_PROTOCOL)
+        if pickle.__name__ == 'cPickle':
+            # only called for the objects of non-builtin types
+            p.inst_persistent_id = persistent_id
+        else:
+            p.persistent_id = persistent_id
+        p.dump(ob)
+        return SerializedObject(self, self.compress(s.getvalue()), buffers)
+
+    def loads(self, x):
+        def persistent_load(pid):
+            import numpy as np
+            i, dtype, shape, order = pid
+            raw = bytearray(self.decompress(x.buffers[i]))  # writable
+            a = np.frombuffer(raw, dtype=np.dtype(dtype))
+            return a.reshape(shape, order=order)
+
+        u = pickle.Unpickler(BytesIO(self.decompress(x.data)))
+        u.persistent_load = persistent_load
+        return u.load()
+
+
+def is_large_array(x, threshold):
+    if type(x).__name__ != 'ndarray' or type(x).__module__ != 'numpy':
+        return False
+    return (x.dtype.fields is None and not x.dtype.hasobject and
+            x.nbytes >= threshold and
+            (x.flags.c_contiguous or x.flags.f_contiguous))
+
+
+def import_lz4():
+    try:
+        import lz4.frame
+    except ImportError as e:
+        msg = 'The "lz4" compression needs the package lz4: %s' % e
+        raise ValueError(msg)
+    return lz4.frame
+
+
+def serialize(ob, serializer):
+    """ Returns the SerializedObject for ob, or ob if serializer is None. """
+    return ob if serializer is None else serializer.dumps(ob)
+
+
+# name -> serializer, for the option --serializer
+serializers = {}
+
+
+def register_serializer(name, serializer):
+    """
+        Registers a serializer (an object with dumps(ob), returning a
+        SerializedObject, and loads(x)), which must be picklable.
+    """
+    serializers[name] = serializer
+
+
+@contract(name='str')
+def get_serializer(name):
+    if name == 'lz4' and not name in serializers:
+        register_serializer('lz4', PickleSerializer('lz4'))
+    if not name in serializers:
+        msg = ('Unknown serializer %r; available: %s.' %
+               (name, ', '.join(sorted(set(serializers) | set(['lz4'])))))
+        raise ValueError(msg)
+    return serializers[name]
+
+
+register_serializer('pickle', PickleSerializer())
+register_serializer('zlib', PickleSerializer('zlib'))
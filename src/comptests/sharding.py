@@ -0,0 +1,249 @@
+from collections import defaultdict
+import heapq
+import json
+import os
+
+from contracts import contract
+from quickapp import QuickAppBase
+
+from .export import write_results
+
+
+__all__ = [
+    'parse_shard',
+    'get_shard_units',
+    'assign_shards',
+    'merge_results',
+    'CompTestsMerge',
+    'main_comptests_merge',
+]
+
+# The kinds of plan entries (see plan_registrar()) which are tests
+test_kinds = ['single', 'batched', 'some', 'pairs', 'some_pairs', 'simple']
+
+
+def get_test_key(module, objspec, function):
+    """ The name of a test in the units and in the durations. """
+    return '%s:%s:%s' % (module, objspec or '', function)
+
+
+@contract(s='str', returns='tuple(int,int)')
+def parse_shard(s):
+    """ Parses "i/N" (1 <= i <= N) and returns (i, N). """
+    try:
+        i, n = [int(x) for x in s.split('/')]
+    except ValueError:
+        msg = 'Invalid shard %r: expected "i/N", such as "1/8".' % s
+        raise ValueError(msg)
+    if not 1 <= i <= n:
+        msg = 'Invalid shard %r: need 1 <= i <= N.' % s
+        raise ValueError(msg)
+    return i, n
+
+
+@contract(entries='list(dict)', nose_modules='list(str)', returns='list(dict)')
+def get_shard_units(entries, nose_modules):
+    """
+        Groups the tests of the plan entries (see plan_modules()) in the
+        units that are assigned to the shards: one per module, objspec
+        and function, with the tests required by comptests_requires()
+        in the same unit as the ones requiring them; plus one unit for
+        the nosetests of each module.
+        Returns a list of dict(name, tests, functions, nose, njobs), where
+        tests are the (module, objspec, function) of the unit (see 
+        shard_selected()) and functions
+        the (key, njobs) of its plan entries (see get_test_key()).
+        The jobs returning the results of the batched tests
+        (kind "batched_result") are not tests: they are in no unit.
+    """
+    parent = {}
+
+    def find(k):
+        while parent[k] != k:
+            k = parent[k]
+        return k
+
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    tests = [e for e in entries if e['kind'] in test_kinds]
+    for e in tests:
+        k = (e['module'], e['objspec'] or '', e['function'])
+        parent.setdefault(k, k)
+    for e in tests:
+        for g in e.get('requires', []):
+            for e2 in tests:
+                if e2['module'] == e['module'] and e2['function'] == g:
+                    union((e['module'], e['objspec'] or '', e['function']),
+                          (e2['module'], e2['objspec'] or '', g))
+
+    groups = defaultdict(list)
+    for e in tests:
+        groups[find((e['module'], e['objspec'] or '', e['function']))].append(e)
+
+    units = []
+    for key in sorted(groups):
+        es = groups[key]
+        units.append(dict(name='%s:%s:%s' % key,
+                          tests=sorted(set((e['module'].split('.')[0],
+                                            e['objspec'], e['function'])
+                                           for e in es),
+                                       key=lambda x: (x[0], x[1] or '', x[2])),
+                          functions=[(get_test_key(e['module'], e['objspec'],
+                                                   e['function']), e['njobs'])
+                                     for e in es],
+                          nose=None, njobs=sum(e['njobs'] for e in es)))
+    for module in sorted(nose_modules):
+        units.append(dict(name='nose:%s' % module, tests=[], functions=[],
+                          nose=module, njobs=1))
+    return units
+
+
+@contract(units='list(dict)', durations='dict', n='int,>=1',
+          returns='list(list(dict))')
+def assign_shards(units, durations, n):
+    """
+        Partitions the units in n shards with similar total durations,
+        using the mean duration of each test function and the duration of
+        the nosetests of each module (see get_durations()); the unknown
+        ones count as the mean of the known ones. The largest units are
+        assigned first, each to the shard with the least load so far.
+        The result depends only on the arguments, so all the shards of
+        a run compute the same partition.
+    """
+    functions = durations.get('functions', {})
+    nose = durations.get('nose', {})
+    known = list(functions.values()) + list(nose.values())
+    default = sum(known) / len(known) if known else 1.0
+
+    def weight(unit):
+        if unit['nose'] is not None:
+            return nose.get(unit['nose'], default)
+        return sum(njobs * functions.get(f, default)
+                   for f, njobs in unit['functions'])
+
+    weighted = sorted(((weight(u), u) for u in units),
+                      key=lambda x: (-x[0], x[1]['name']))
+    shards = [[] for _ in range(n)]
+    loads = [(0.0, i) for i in range(n)]
+    for w, unit in weighted:
+        load, i = heapq.heappop(loads)
+        shards[i].append(dict(unit, weight=w))
+        heapq.heappush(loads, (load + w, i))
+    return shards
+
+
+@contract(records='list(dict)', returns='dict')
+def get_durations(records):
+    """
+        Returns dict(functions=key -> mean duration of its jobs,
+        nose=module -> total duration of its nosetests) from the records
+        of export_results(); they are what assign_shards() uses.
+        The key is that of get_test_key(), as the same function name can
+        be used in other modules, or for other objspecs.
+    """
+    functions = defaultdict(list)
+    nose = defaultdict(lambda: 0.0)
+    for r in records:
+        if r['source'] == 'nose':
+            nose[r['job_id'].split('.')[0]] += r['duration']
+        else:
+            objspecs = r.get('objspecs') or [None]
+            key = get_test_key(r.get('module'), objspecs[0], r['function'])
+            functions[key].append(r['duration'])
+    return dict(functions=dict((k, sum(v) / len(v))
+                               for k, v in functions.items()),
+                nose=dict(nose))
+
+
+@contract(filename='str', returns='dict')
+def read_durations(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def read_records(filename):
+    records = []
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    return records
+
+
+@contract(inputs='list(str)', junit='str', jsonl='str', durations='str',
+          returns='dict')
+def merge_results(inputs, junit, jsonl, durations):
+    """
+        Merges the JSON Lines files written by comptests-export for each
+        shard into one JUnit XML and one JSON Lines file, and writes the
+        durations to use for sharding the next runs.
+        A test present in more than one input is counted once (the first).
+        Returns the counts, as export_results(), plus "duplicates".
+    """
+    records = []
+    seen = set()
+    duplicates = 0
+    for filename in inputs:
+        for r in read_records(filename):
+            key = (r['source'], r['job_id'])
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            records.append(r)
+
+    counts = write_results(junit, jsonl, records)
+    counts['duplicates'] = duplicates
+
+    d = os.path.dirname(durations)
+    if d and not os.path.exists(d):
+        os.makedirs(d)
+    with open(durations, 'w') as f:
+        json.dump(get_durations(records), f, indent=2, sort_keys=True)
+    return counts
+
+
+class CompTestsMerge(QuickAppBase):
+    """
+        Merges the results of the shards of a run (comptests --shard i/N,
+        each exported with comptests-export) in one report.
+    """
+
+    cmd = 'comptests-merge'
+
+    def define_program_options(self, params):
+        params.add_string('junit', default='out/comptests-results.xml',
+                          help='JUnit XML file to write')
+        params.add_string('jsonl', default='out/comptests-results.jsonl',
+                          help='JSON Lines file to write')
+        params.add_string('durations', default='out/comptests-durations.json',
+                          help='File to write with the durations, for the '
+                               'option --shard_durations of the next runs')
+        params.accept_extra()
+
+    def go(self):
+        options = self.get_options()
+        inputs = [str(x) for x in self.options.get_extra()]
+        if not inputs:
+            raise ValueError('No input files given.')
+        for x in [options.junit, options.jsonl]:
+            if os.path.realpath(x) in [os.path.realpath(y) for y in inputs]:
+                msg = 'Cannot overwrite the input %r.' % x
+                raise ValueError(msg)
+        counts = merge_results(inputs, junit=str(options.junit),
+                               jsonl=str(options.jsonl),
+                               durations=str(options.durations))
+        self.info('%d tests (%d failures, %d errors, %d skipped) from %d shards'
+                  % (counts['tests'], counts['failures'], counts['errors'],
+                     counts['skipped'], len(inputs)))
+        if counts['duplicates']:
+            self.warn('%d tests were in more than one shard.' %
+                      counts['duplicates'])
+        self.info('Written %s, %s and %s' % (options.junit, options.jsonl,
+                                             options.durations))
+
+
+main_comptests_merge = CompTestsMerge.get_sys_main()
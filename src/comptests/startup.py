@@ -0,0 +1,119 @@
+"""
+    Measures the time spent importing comptests and the tested modules.
+
+    This file must be run with runpy.run_path() in a fresh interpreter
+    (see profile_startup()), so that nothing is imported before the
+    timer is installed; it uses only the standard library.
+"""
+import sys
+import time
+
+try:
+    import __builtin__ as builtins
+except ImportError:  # Python 3
+    import builtins
+
+
+__all__ = [
+    'ImportTimer',
+    'format_import_times',
+]
+
+
+class ImportTimer(object):
+    """
+        Wraps __import__ and records, for each module imported for
+        the first time, the total time of its import and the time
+        spent in the module itself (excluding the modules it imports).
+    """
+
+    def __init__(self):
+        self.total = {}
+        self.self_time = {}
+        self.order = []
+        # for each import in progress, the time spent in nested imports
+        self.nested = []
+
+    def install(self):
+        self.original = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        builtins.__import__ = self.original
+
+    def _import(self, name, *args, **kwargs):
+        before = len(sys.modules)
+        self.nested.append(0.0)
+        t0 = time.time()
+        try:
+            return self.original(name, *args, **kwargs)
+        finally:
+            dt = time.time() - t0
+            nested = self.nested.pop()
+            if len(sys.modules) != before:
+                key = self._module_name(name, *args[:3])
+                self.total[key] = self.total.get(key, 0.0) + dt
+                self.self_time[key] = (self.self_time.get(key, 0.0) +
+                                       dt - nested)
+                self.order.append(key)
+                if self.nested:
+                    self.nested[-1] += dt
+
+    def _module_name(self, name, globals_=None, locals_=None, fromlist=None):
+        """ Resolves relative imports ("results" -> "comptests.results"). """
+        if globals_:
+            package = globals_.get('__package__') or globals_.get('__name__')
+            if not name:  # from . import x
+                if fromlist and is_module(package + '.' + fromlist[0]):
+                    return package + '.' + fromlist[0]
+                return package
+            while package:
+                candidate = package + '.' + name
+                if is_module(candidate):
+                    return candidate
+                package = package.rpartition('.')[0]
+        return name or '?'
+
+
+def is_module(name):
+    # (Python 2 records the failed implicit relative imports as None)
+    return sys.modules.get(name) is not None
+
+
+def format_import_times(timer, n=25):
+    """ Returns a string with the times per package and the slowest modules. """
+    packages = {}
+    for name, t in timer.self_time.items():
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0.0) + t
+
+    s = 'Import time per package (excluding the packages it imports):\n'
+    for package, t in sorted(packages.items(), key=lambda x: -x[1])[:n]:
+        s += '  %7.3f s  %s\n' % (t, package)
+    s += '\nSlowest modules (including the modules they import):\n'
+    for name, t in sorted(timer.total.items(), key=lambda x: -x[1])[:n]:
+        s += '  %7.3f s  %7.3f s self  %s\n' % (t, timer.self_time[name], name)
+    return s
+
+
+def main(modules):
+    timer = ImportTimer()
+    timer.install()
+    t0 = time.time()
+    import comptests  # @UnusedImport
+    t_comptests = time.time() - t0
+    times = []
+    for module in modules:
+        t0 = time.time()
+        __import__(module)
+        times.append((module, time.time() - t0))
+    timer.uninstall()
+
+    print(format_import_times(timer))
+    print('%7.3f s  import comptests' % t_comptests)
+    for module, t in times:
+        print('%7.3f s  import %s (after comptests)' % (t, module))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
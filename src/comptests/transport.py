@@ -0,0 +1,86 @@
+import os
+
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: no cover
+    import pickle
+
+from contracts import contract
+
+from .serializers import SerializedObject
+
+
+__all__ = [
+    'SharedArraysObject',
+    'shared_arrays_dump',
+    'shared_arrays_load',
+    'transport_load',
+]
+
+
+class SharedArraysObject():
+    """
+        An object pickled without its large NumPy arrays, which
+        are stored once in .npy files and memory-mapped (read-only)
+        by each consumer. This is what the compmake DB stores
+        instead of the object.
+    """
+    def __init__(self, data, filenames):
+        self.data = data
+        self.filenames = filenames
+
+
+@contract(dirname='str', prefix='str', threshold='int,>=0')
+def shared_arrays_dump(ob, dirname, prefix, threshold):
+    """ Stores the arrays larger than threshold bytes in dirname. """
+    import numpy as np
+
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    filenames = []
+
+    def persistent_id(x):
+        if (type(x) is not np.ndarray or x.dtype.hasobject
+                or x.nbytes < threshold):
+            return None
+        fn = os.path.join(dirname, '%s-%d.npy' % (prefix, len(filenames)))
+        np.save(fn, x)
+        filenames.append(fn)
+        return fn
+
+    from io import BytesIO
+    s = BytesIO()
+    p = pickle.Pickler(s, pickle.HIGHEST_PROTOCOL)
+    p.persistent_id = persistent_id
+    p.dump(ob)
+    return SharedArraysObject(s.getvalue(), filenames)
+
+
+def shared_arrays_load(x):
+    """
+        If x is a SharedArraysObject, returns the object, with
+        the arrays as read-only memory maps; otherwise returns x.
+    """
+    if not isinstance(x, SharedArraysObject):
+        return x
+
+    import numpy as np
+
+    def persistent_load(fn):
+        return np.load(fn, mmap_mode='r')
+
+    from io import BytesIO
+    u = pickle.Unpickler(BytesIO(x.data))
+    u.persistent_load = persistent_load
+    return u.load()
+
+
+def transport_load(x):
+    """
+        Returns the object transported as x: a SerializedObject (see
+        serializers.py), a SharedArraysObject, or the object itself.
+    """
+    if isinstance(x, SerializedObject):
+        return x.load()
+    return shared_arrays_load(x)
@@ -0,0 +1,111 @@
+import pickle
+import threading
+import time
+
+from comptests import outcomes
+from comptests.asynctests import ConcurrentWrap, ObjectFailure
+from comptests.registrar import get_batched_result
+from comptests.results import Flaky
+
+
+def check_wait(id_ob, ob):
+    time.sleep(0.2)
+    if id_ob == 'bad':
+        raise ValueError(id_ob)
+    return ob, threading.current_thread().name
+
+
+def test_concurrent():
+    objects = [('a', 1), ('b', 2), ('bad', 3), ('c', 4)]
+    w = ConcurrentWrap(check_wait, max_concurrency=4)
+    assert w.__name__ == 'check_wait'
+    t0 = time.time()
+    res = w(objects)
+    elapsed = time.time() - t0
+    assert elapsed < 0.6, elapsed  # serially, 0.8
+    assert sorted(res) == ['a', 'b', 'bad', 'c']
+    assert res['b'][0] == 2
+    assert isinstance(res['bad'], ObjectFailure)
+    assert res['bad'].exception == 'ValueError'
+    assert len(set(res[k][1] for k in 'abc')) == 3
+    assert w([]) == {}
+
+
+class FailOnce(object):
+    def __init__(self, which):
+        self.which = which
+        self.calls = []
+        self.__name__ = 'fail_once'
+        self.__module__ = __name__
+
+    def __call__(self, id_ob, ob):
+        self.calls.append(id_ob)
+        if id_ob in self.which and self.calls.count(id_ob) == 1:
+            raise ValueError(id_ob)
+        return ob
+
+
+def test_concurrent_retries():
+    f = FailOnce(['b'])
+    w = ConcurrentWrap(f, max_concurrency=2)
+    res = w([('a', 1), ('b', 2)], retries=1)
+    assert res['a'] == 1
+    assert isinstance(res['b'], Flaky)
+    assert res['b'].get_result() == 2 and res['b'].get_attempts() == 2
+    # only the object that failed is tested again
+    assert sorted(f.calls) == ['a', 'b', 'b']
+
+    res = ConcurrentWrap(FailOnce(['b']), max_concurrency=2)([('b', 2)])
+    assert isinstance(res['b'], ObjectFailure)
+
+
+class CustomError(Exception):
+    def __init__(self, id_ob, reason):
+        Exception.__init__(self, '%s: %s' % (id_ob, reason))
+        self.id_ob = id_ob
+
+
+def check_custom(id_ob, ob):
+    if id_ob == 'bad':
+        raise CustomError(id_ob, 'broken')
+    if id_ob == 'wrong':
+        assert ob == 0, ob
+    return ob
+
+
+class FakeLog(object):
+    def __init__(self):
+        self.records = []
+
+    def append_record(self, record):
+        self.records.append(record)
+
+
+def test_concurrent_pickle():
+    # the batch is saved by compmake: the failures must unpickle
+    w = ConcurrentWrap(check_custom, max_concurrency=2)
+    batch = w([('a', 1), ('bad', 2), ('wrong', 3)])
+    batch = pickle.loads(pickle.dumps(batch, pickle.HIGHEST_PROTOCOL))
+    assert batch['a'] == 1
+    assert batch['bad'].exception == 'CustomError'
+    assert batch['bad'].message == 'bad: broken'
+    assert 'check_custom' in batch['bad'].traceback
+
+    log = FakeLog()
+    get_outcomes_log = outcomes.get_outcomes_log
+    outcomes.get_outcomes_log = lambda: log
+    try:
+        assert get_batched_result(w, batch, 'a') == 1
+        for id_ob in ['bad', 'wrong']:
+            try:
+                get_batched_result(w, batch, id_ob)
+            except Exception as e:
+                assert 'check_custom' in str(e)
+            else:
+                raise Exception('Expected an exception for %s' % id_ob)
+    finally:
+        outcomes.get_outcomes_log = get_outcomes_log
+    status = dict((r['objects'][0], r['status']) for r in log.records)
+    assert status == {'a': outcomes.OK, 'bad': outcomes.ERROR,
+                      'wrong': outcomes.FAILED}, status
+    assert 'CustomError: bad: broken' in log.records[1]['message']
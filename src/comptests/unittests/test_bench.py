@@ -0,0 +1,26 @@
+import json
+import os
+
+from .test_example_package import create_tmp_dir
+
+
+def test_bench():
+    from system_cmd import system_cmd_result
+
+    with create_tmp_dir() as cwd:
+        cmd = ['comptests-bench',
+               '--objspecs', '2',
+               '--objects', '2',
+               '--functions', '1']
+        system_cmd_result(cwd, cmd,
+                          display_stdout=True,
+                          display_stderr=True,
+                          raise_on_error=True)
+
+        fn = os.path.join(cwd, 'out-comptests-bench', 'bench.json')
+        with open(fn) as f:
+            res = json.load(f)
+        # 2 objspecs x 2 objects x 1 function, plus some pairs
+        assert res['ntests'] >= 4, res
+        assert res['nfailed'] == 0, res
+        assert res['db_size'] > 0
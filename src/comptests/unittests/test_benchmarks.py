@@ -0,0 +1,64 @@
+import json
+import os
+import shutil
+import tempfile
+
+from comptests.benchmarks import (BenchmarkWrap, get_current_filename,
+                                  get_stats_filename, set_benchmark_settings,
+                                  timing_stats)
+from comptests.results import BenchmarkResult
+from comptests.segments import OutputDir
+
+
+def f_bench(id_ob, ob, extra=0):
+    sum(range(ob + extra))
+
+
+def test_benchmark_baseline():
+    dirname = tempfile.mkdtemp()
+    output_dir = os.path.join(dirname, 'out')
+    baseline_dir = os.path.join(dirname, 'baseline')
+    previous = OutputDir.dirname
+    OutputDir.dirname = output_dir
+    try:
+        w = BenchmarkWrap(f_bench, warmup=1, repeat=3, tolerance=0.2,
+                          objspec='numbers')
+        key = 'comptests:numbers:f_bench-ob1'
+        assert w.get_key(['ob1']) == key
+        # fixtures are passed as keyword arguments
+        res = w('ob1', 1000, extra=10)
+        assert isinstance(res, BenchmarkResult)
+        assert os.path.exists(get_current_filename(key))
+        # without --benchmark_baseline there is nothing to compare with
+        assert res.baseline is None
+        assert 'no baseline' in res.get_string()
+
+        # the baseline is not created implicitly
+        set_benchmark_settings(output_dir, baseline=baseline_dir)
+        res = w('ob1', 1000)
+        assert res.baseline is None
+        baseline_fn = get_stats_filename(baseline_dir, key)
+        assert not os.path.exists(baseline_fn)
+
+        set_benchmark_settings(output_dir, baseline=baseline_dir, update=True)
+        w('ob1', 1000)
+        assert os.path.exists(baseline_fn)
+
+        # now make the baseline much faster than it is
+        set_benchmark_settings(output_dir, baseline=baseline_dir)
+        with open(baseline_fn) as f:
+            stats = json.load(f)
+        stats['median'] = stats['median'] / 100.0
+        with open(baseline_fn, 'w') as f:
+            json.dump(stats, f)
+        res2 = w('ob1', 1000)
+        assert res2.is_regression(), res2.get_string()
+        assert 'REGRESSION' in res2.get_string()
+    finally:
+        OutputDir.dirname = previous
+        shutil.rmtree(dirname)
+
+
+def test_timing_stats_median():
+    assert timing_stats([3.0, 1.0, 2.0])['median'] == 2.0
+    assert timing_stats([4.0, 1.0, 3.0, 2.0])['median'] == 2.5
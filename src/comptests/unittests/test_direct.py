@@ -0,0 +1,67 @@
+from comptests.direct import DirectContext, DirectExecutor
+
+
+def add(a, b):
+    return a + b
+
+
+def fails(_):
+    raise ValueError('expected')
+
+
+def define_more(context, x):
+    c = context.child('more')
+    y = c.comp(add, x, 1, job_id='y')
+    return c.comp(add, y, dict(v=[y])['v'][0], job_id='z').job_id
+
+
+def run_executor(processes):
+    executor = DirectExecutor(processes=processes)
+    context = DirectContext(executor)
+    a = context.comp(add, 1, 2, job_id='a')
+    context.comp_dynamic(define_more, a, job_id='define')
+    f = context.comp(fails, a, job_id='f')
+    context.comp(add, f, 1, job_id='blocked')
+    context.comp(add, 1, 1, job_id='after', extra_dep=[f])
+    executor.run()
+    return executor
+
+
+def test_direct():
+    for processes in [0, 2]:
+        executor = run_executor(processes)
+        assert executor.results['a'] == 3
+        assert executor.results['define'] == 'more-z'
+        assert executor.results['more-z'] == 8
+        status = executor.status
+        assert status['f'] == 'failed'
+        assert executor.errors['f'] == 'ValueError: expected'
+        assert status['blocked'] == status['after'] == 'blocked'
+        assert sorted(executor.get_failed()) == ['after', 'blocked', 'f']
+        assert '7 jobs' in executor.get_summary()
+
+
+def define_only(context):
+    c = context.child('sub')
+    c.comp(add, 1, 1, job_id='x')
+    return 'defined'
+
+
+def test_direct_compute():
+    executor = DirectExecutor()
+    context = DirectContext(executor)
+    context.comp_dynamic(define_only, job_id='define')
+    a = context.comp(add, 1, 2, job_id='a')
+    context.comp_dynamic(define_more, a, job_id='later')
+    f = context.comp(fails, a, job_id='f')
+    context.comp(add, f, 1, job_id='blocked')
+    executor.define()
+    # only the definitions not depending on the other jobs are executed
+    assert sorted(executor.status) == ['define']
+    assert 'sub-x' in executor.jobs
+    assert executor.compute('blocked') == 'blocked'
+    assert executor.get_failure_cause('blocked') == 'f'
+    assert sorted(executor.status) == ['a', 'blocked', 'define', 'f']
+    assert executor.compute('later') == 'done'
+    assert executor.compute('more-z') == 'done'
+    assert executor.results['more-z'] == 8
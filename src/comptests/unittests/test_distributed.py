@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from comptests.distributed import DistributedQueue
+
+
+def test_distributed_queue():
+    dirname = tempfile.mkdtemp()
+    try:
+        q1 = DistributedQueue(dirname, timeout=60)
+        q1.create_session()
+        assert q1.session_exists()
+        q2 = DistributedQueue(dirname, timeout=60)
+        q2.worker = 'other'
+
+        assert q1.try_acquire('j1')
+        assert not q2.try_acquire('j1')
+        assert q1.active_leases() == ['j1']
+
+        q1.mark_finished('j1', 'failed')
+        assert q1.active_leases() == []
+        assert q2.is_finished('j1')
+        # a finished job is not executed again
+        assert not q2.try_acquire('j1')
+        assert q2.get_failed() == ['j1']
+
+        # the lease of a worker that stopped touching it expires
+        assert q1.try_acquire('j2')
+        old = time.time() - 100
+        os.utime(os.path.join(dirname, 'leases', 'j2'), (old, old))
+        assert q1.active_leases() == []
+        assert q2.try_acquire('j2')
+        q2.heartbeat('j2')
+        assert not q1.try_acquire('j2')
+        assert q1.active_leases() == ['j2']
+    finally:
+        shutil.rmtree(dirname)
+
+
+def g_sum(*values):
+    time.sleep(0.1)
+    return sum(values)
+
+
+def g_fail():
+    raise ValueError('expected failure')
+
+
+def g_define(context, n):
+    return context.comp(g_sum, *range(n))
+
+
+def run_worker(dirname, results):
+    from compmake import Context, StorageFilesystem
+    from comptests.distributed import distributed_worker, get_queue_dir
+    db = StorageFilesystem(os.path.join(dirname, 'compmake'))
+    queue = DistributedQueue(get_queue_dir(dirname), timeout=5)
+    context = Context(db=db, currently_executing=['root'])
+    results.put(distributed_worker(context, queue, poll=0.1))
+
+
+def test_distributed_workers():
+    from multiprocessing import Process, Queue
+    from compmake import Context, StorageFilesystem
+    from compmake.jobs.uptodate import CacheQueryDB
+    from comptests.distributed import get_queue_dir
+
+    dirname = tempfile.mkdtemp()
+    try:
+        db = StorageFilesystem(os.path.join(dirname, 'compmake'))
+        c = Context(db=db)
+        values = [c.comp(g_sum, i, job_id='v%d' % i) for i in range(8)]
+        c.comp(g_sum, *values, job_id='total')
+        c.comp_dynamic(g_define, 3, job_id='dynamic')
+        failed = c.comp(g_fail, job_id='failing')
+        c.comp(g_sum, failed, job_id='blocked')
+
+        queue = DistributedQueue(get_queue_dir(dirname), timeout=5)
+        queue.create_session()
+        # a worker died while executing v0
+        dead = DistributedQueue(queue.dirname, timeout=5)
+        dead.worker = 'dead'
+        assert dead.try_acquire('v0')
+        old = time.time() - 100
+        os.utime(os.path.join(queue.leases, 'v0'), (old, old))
+
+        results = Queue()
+        workers = [Process(target=run_worker, args=(dirname, results))
+                   for _ in range(2)]
+        for p in workers:
+            p.start()
+        counts = [results.get(timeout=120) for _ in workers]
+        for p in workers:
+            p.join()
+
+        # v0-v7, total, dynamic, the job it defines, failing
+        assert sum(x['done'] for x in counts) == 11, counts
+        assert sum(x['failed'] for x in counts) == 1, counts
+        assert queue.get_failed() == ['failing']
+        assert queue.active_leases() == []
+        assert not queue.is_finished('blocked')
+        with open(os.path.join(queue.finished, 'v0')) as f:
+            assert json.load(f)['worker'] != 'dead'
+
+        cq = CacheQueryDB(StorageFilesystem(os.path.join(dirname, 'compmake')))
+        for job_id in ['v0', 'total', 'dynamic']:
+            assert cq.up_to_date(job_id)[0], job_id
+        assert not cq.up_to_date('blocked')[0]
+    finally:
+        shutil.rmtree(dirname)
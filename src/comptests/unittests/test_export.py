@@ -0,0 +1,56 @@
+import json
+import os
+import shutil
+import tempfile
+from xml.etree import ElementTree as ET
+
+from comptests.export import export_results
+from comptests.outcomes import OutcomesLog, read_outcomes
+
+
+def test_export_results():
+    dirname = tempfile.mkdtemp()
+    try:
+        outcomes = os.path.join(dirname, 'outcomes')
+        log = OutcomesLog(outcomes)
+        base = dict(function='f', objspecs=['robots'], objects=['r1'],
+                    message=None, duration=0.5)
+        for i, (job_id, status) in enumerate([('j1', 'ok'), ('j2', 'failed'),
+                                              ('j3', 'skipped'),
+                                              ('j1', 'error')]):
+            r = dict(base, job_id=job_id, status=status, timestamp=i)
+            log.append_record(r)
+        log.flush()
+        # only the last outcome of j1 counts
+        assert read_outcomes(outcomes)['j1']['status'] == 'error'
+
+        nose = os.path.join(dirname, 'nose')
+        os.makedirs(nose)
+        with open(os.path.join(nose, 'mod.xml'), 'w') as f:
+            f.write('<testsuite><testcase classname="mod.tests" name="t1" '
+                    'time="0.1"/><testcase classname="mod.tests" name="t2" '
+                    'time="0.1"><failure message="no">tb</failure>'
+                    '</testcase></testsuite>')
+
+        junit = os.path.join(dirname, 'res.xml')
+        jsonl = os.path.join(dirname, 'res.jsonl')
+        counts = export_results(junit, jsonl, outcomes=outcomes, nose=nose)
+        assert counts['tests'] == 5, counts
+        assert counts['failures'] == 2, counts
+        assert counts['errors'] == 1, counts
+        assert counts['skipped'] == 1, counts
+
+        suite = ET.parse(junit).getroot()
+        assert suite.get('tests') == '5'
+        tc = suite.find("testcase[@name='j2']")
+        assert tc.find('failure') is not None
+        props = [(p.get('name'), p.get('value'))
+                 for p in tc.find('properties')]
+        assert props == [('objspec', 'robots'), ('object', 'r1')], props
+
+        with open(jsonl) as f:
+            records = [json.loads(line) for line in f]
+        assert len(records) == 5
+        assert records[-1]['job_id'] == 'mod.tests.t2'
+    finally:
+        shutil.rmtree(dirname)
@@ -0,0 +1,31 @@
+import os
+import shutil
+import tempfile
+
+from comptests.failures import FailuresLog, query_failures
+
+
+def test_failures_log():
+    dirname = tempfile.mkdtemp()
+    try:
+        log = FailuresLog(dirname, batch_size=2, interval=1000)
+        log.append('job1', 'f1', 'ValueError', 'msg', 'tb')
+        # not written yet
+        assert not os.path.exists(dirname) or not os.listdir(dirname)
+        log.append('job2', 'f1', 'KeyError', 'msg', 'tb')
+        log.append('job3', 'f2', 'ValueError', 'msg', 'tb')
+        log.flush()
+
+        assert len(query_failures(dirname)) == 3
+        r = query_failures(dirname, function='f1')
+        assert [x['job_id'] for x in r] == ['job1', 'job2'], r
+        r = query_failures(dirname, exception='ValueError', function='f2')
+        assert [x['job_id'] for x in r] == ['job3'], r
+        assert query_failures(dirname, job_id='nope') == []
+
+        # the index is updated when there are new records
+        log.append('job4', 'f2', 'ValueError', 'msg', 'tb')
+        log.flush()
+        assert len(query_failures(dirname, function='f2')) == 2
+    finally:
+        shutil.rmtree(dirname)
@@ -0,0 +1,77 @@
+from comptests.benchmarks import BenchmarkWrap
+from comptests.fixtures import (ComptestsFixtures, add_fixtures_used,
+    get_fixture_params, get_needed_fixtures, fixtures_used_by)
+
+
+def robot_spec(id_robot, robot):
+    return id_robot
+
+
+def robot_world(id_robot, robot, id_world, world):
+    return id_robot, id_world
+
+
+def check_spec(id_robot, robot, robot_spec, verbose=False):
+    pass
+
+
+def check_pair(id_robot, robot, id_world, world, robot_spec, robot_world):
+    pass
+
+
+def check_missing(id_robot, robot, world_map):
+    pass
+
+
+class FakeObjSpec(object):
+    def __init__(self, name):
+        self.name = name
+
+
+def test_fixtures():
+    saved = (dict(ComptestsFixtures.objspec2fixtures),
+             dict(ComptestsFixtures.objspecs2fixtures))
+    try:
+        ComptestsFixtures.objspec2fixtures['robots'] = dict(robot_spec=robot_spec)
+        ComptestsFixtures.objspecs2fixtures[('robots', 'worlds')] = \
+            dict(robot_world=robot_world)
+
+        assert get_fixture_params(check_spec, 2) == ['robot_spec']
+        assert get_fixture_params(check_pair, 4) == ['robot_spec',
+                                                     'robot_world']
+        # the wrapped function is inspected
+        bench = BenchmarkWrap(check_spec, warmup=0, repeat=1, tolerance=0.2)
+        assert get_fixture_params(bench, 2) == ['robot_spec']
+
+        fixtures = fixtures_used_by(check_spec, False, 'robots')
+        assert fixtures == dict(robot_spec=(1, robot_spec)), fixtures
+        try:
+            fixtures_used_by(check_pair, False, 'worlds', 'robots')
+        except ValueError:  # robot_world is only for (robots, worlds)
+            pass
+        else:
+            raise Exception('Expected ValueError')
+
+        try:
+            fixtures_used_by(check_missing, False, 'robots')
+        except ValueError as e:
+            assert 'world_map' in str(e)
+        else:
+            raise Exception('Expected ValueError')
+
+        registrations = dict(robots=dict(
+            functions=[dict(function=check_spec, dynamic=False)],
+            pairs=[dict(function=check_pair, dynamic=False,
+                        objspec2=FakeObjSpec('worlds'))],
+            some=[], some_pairs=[]))
+        registrations = add_fixtures_used(registrations)
+        pair = registrations['robots']['pairs'][0]['fixtures']
+        assert pair == dict(robot_spec=(1, robot_spec),
+                            robot_world=(0, robot_world)), pair
+        needed = get_needed_fixtures(registrations)
+        assert needed == dict(robots=dict(robot_spec=robot_spec)), needed
+    finally:
+        ComptestsFixtures.objspec2fixtures.clear()
+        ComptestsFixtures.objspec2fixtures.update(saved[0])
+        ComptestsFixtures.objspecs2fixtures.clear()
+        ComptestsFixtures.objspecs2fixtures.update(saved[1])
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+
+from comptests.history import HistoryDB
+
+
+def test_history():
+    dirname = tempfile.mkdtemp()
+    try:
+        history = HistoryDB(os.path.join(dirname, 'history.sqlite'))
+
+        def outcome(job_id, status, duration):
+            return dict(job_id=job_id, function='check_pair',
+                        objspecs=['robots', 'maps'], objects=job_id.split('-'),
+                        status=status, duration=duration, message=None,
+                        timestamp=0)
+
+        runs = [[('r1-m1', 'ok', 1.0), ('r2-m1', 'ok', 1.0)],
+                [('r1-m1', 'failed', 1.0), ('r2-m1', 'ok', 1.1)],
+                [('r1-m1', 'ok', 1.0), ('r2-m1', 'ok', 1.0)],
+                [('r1-m1', 'failed', 1.0), ('r2-m1', 'ok', 3.0)],
+                [('r1-m1', 'error', 1.0), ('r2-m1', 'ok', 3.0)]]
+        for i, run in enumerate(runs):
+            records = [outcome(*x) for x in run]
+            run_id = history.add_run(records, commit_id='c%d' % i,
+                                     modules=['m'])
+            assert run_id == i + 1
+
+        assert len(history.runs()) == 5
+        assert history.runs()[0]['nfailed'] == 1
+        assert len(history.outcomes(obj='r2')) == 5
+        assert len(history.outcomes(job='r*', status='failed')) == 2
+
+        ff = history.first_failures()
+        assert len(ff) == 1
+        assert ff[0]['job_id'] == 'r1-m1'
+        assert ff[0]['first']['run_id'] == 4
+        assert ff[0]['first']['commit_id'] == 'c3'
+        assert ff[0]['last_ok']['run_id'] == 3
+
+        slower = history.slower(factor=1.5)
+        assert [x[0] for x in slower] == ['r2-m1'], slower
+        history.close()
+    finally:
+        shutil.rmtree(dirname)
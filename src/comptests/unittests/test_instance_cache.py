@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import time
+
+from comptests.instance_cache import (InstanceCache, get_constructors,
+    get_instance_key, get_package_version)
+
+
+def test_instance_cache():
+    dirname = tempfile.mkdtemp()
+    try:
+        for compress in [False, True]:
+            cache = InstanceCache(os.path.join(dirname, str(compress)),
+                                  max_size=10 ** 6, compress=compress)
+            assert cache.get('aa01') == (False, None)
+            cache.put('aa01', dict(x=[1, 2]))
+            assert cache.get('aa01') == (True, dict(x=[1, 2]))
+            assert len(cache.get_entries()) == 1
+
+        cache = InstanceCache(os.path.join(dirname, 'lru'), max_size=2500)
+        for key in ['aa01', 'bb02']:
+            cache.put(key, 'x' * 1000)
+        # aa01 becomes the most recently used
+        t = time.time() - 100
+        os.utime(cache.get_filename('bb02'), (t, t))
+        assert cache.get('aa01')[0]
+        cache.put('cc03', 'x' * 1000)
+        assert not cache.get('bb02')[0]
+        assert cache.get('aa01')[0] and cache.get('cc03')[0]
+
+        with open(cache.get_filename('cc03'), 'wb') as f:
+            f.write(b'garbage')
+        assert cache.get('cc03') == (False, None)
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_constructors():
+    spec = dict(id='r1', code=['pkg.Robot', dict(
+        sensor=dict(code=['pkg.Sensor', {}]), n=2)])
+    assert sorted(get_constructors(spec)) == ['pkg.Robot', 'pkg.Sensor']
+
+
+def test_instance_cache_size():
+    dirname = tempfile.mkdtemp()
+    try:
+        cache = InstanceCache(dirname, max_size=10 ** 6)
+        scans = []
+        get_entries = cache.get_entries
+        cache.get_entries = lambda: scans.append(1) or get_entries()
+        for i in range(50):
+            cache.put('%02d' % i, 'x' * 100)
+        cache.put('00', 'x' * 200)  # replaced
+        # the directory is read once, not at each put
+        assert len(scans) == 1
+        assert cache.get_size() == sum(x[1] for x in get_entries())
+
+        cache.max_size = 3000
+        cache.put('50', 'x' * 100)
+        assert len(scans) == 2
+        assert cache.get_size() <= 2700
+        assert cache.get_size() == sum(x[1] for x in get_entries())
+    finally:
+        InstanceCache.sizes.pop(dirname, None)
+        shutil.rmtree(dirname)
+
+
+class FakeObjSpec(dict):
+    name = 'robots'
+
+
+def test_instance_key():
+    objspec = FakeObjSpec(r1=dict(code=['comptests.results.Skipped', {}]))
+    key = get_instance_key(objspec, 'r1')
+    assert key == get_instance_key(objspec, 'r1', '')
+    assert key != get_instance_key(objspec, 'r1', 'salt')
+    version, source = get_package_version('comptests')
+    assert source is not None
+    assert get_package_version('not_a_package_xyz') == (None, None)
@@ -0,0 +1,76 @@
+from collections import defaultdict
+import shutil
+import tempfile
+
+from comptests.direct import run_direct
+from comptests.planner import estimate_plan, format_plan, plan_modules
+from comptests.registrar import default_settings
+from comptests.sharding import test_kinds
+
+
+def test_estimate_plan():
+    entries = [dict(module='m', objspec='robots', function='f', kind='single',
+                    njobs=4, dynamic=False),
+               dict(module='m', objspec='robots', function='g', kind='pairs',
+                    njobs=2, dynamic=False),
+               dict(module='m', objspec=None, function='h', kind='simple',
+                    njobs=1, dynamic=True),
+               dict(module='m', objspec=None, function='define_tests_for',
+                    kind='definition', njobs=1, dynamic=True)]
+    # the tests are named by module, objspec and function
+    history = {'m:robots:f': 1.0, 'm:robots:g': 3.0, 'other:robots:h': 5.0,
+               'm:cars:f': 10.0, 'define_tests_for': 2.0}
+    e = estimate_plan(entries, history, workers=2)
+    assert e['njobs'] == 8
+    assert e['nunknown'] == 1
+    assert e['cpu_time'] == 12.0
+    # 3+2+1 / 3+1+1+1
+    assert e['makespan'] == 6.0, e
+
+    e = estimate_plan(entries, history, workers=1)
+    assert e['makespan'] == 12.0
+
+    s = format_plan(entries, e)
+    assert 'dynamic' in s
+
+
+# the functions calling the test (or fixture) given as next argument
+wrappers = ['wrap_func', 'wrap_func_dyn', 'wrap_func_pair', 
+            'wrap_func_pair_dyn', 'wrap_func_batched', 'wrap_func_simple',
+            'compute_fixture', 'compute_pair_fixture']
+
+
+def get_job_function(job):
+    """ The name of the function (test, fixture, ...) run by the job. """
+    names = [getattr(x, '__name__', None) for x in job.args]
+    if not 'ConfigState' in [type(x).__name__ for x in job.args]:
+        return job.f.__name__
+    i = [type(x).__name__ for x in job.args].index('ConfigState') + 1
+    if names[i] in wrappers:
+        return names[i + 1]
+    return names[i]
+
+
+def test_plan_example_package():
+    # the plan counts the jobs that are then defined
+    dirname = tempfile.mkdtemp()
+    try:
+        settings = dict(default_settings, output_dir=dirname)
+        entries = plan_modules(['example_package'], settings, dirname)
+        executor = run_direct(['example_package'], settings,
+                              output_dir=dirname)
+    finally:
+        shutil.rmtree(dirname)
+
+    planned = defaultdict(lambda: 0)
+    for e in entries:
+        if e['kind'] in test_kinds + ['batched_result', 'fixture']:
+            planned[e['function']] += e['njobs']
+    defined = defaultdict(lambda: 0)
+    for job in executor.jobs.values():
+        name = get_job_function(job)
+        if name in planned:
+            defined[name] += 1
+    assert dict(planned) == dict(defined), (dict(planned), dict(defined))
+    assert planned['check_class1_class1'] == 1
+    assert planned['get_batched_result'] == 4
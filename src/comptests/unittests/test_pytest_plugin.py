@@ -0,0 +1,94 @@
+"""
+    Tests of the pytest plugin, using pytester. They are run by pytest
+    in a new process (see test_pytest_plugin()), so that each one
+    defines the comptests from scratch.
+"""
+import os
+import subprocess
+import sys
+
+from nose.plugins.skip import SkipTest
+
+
+def test_pytest_plugin():
+    try:
+        import pytest  # @UnusedImport
+    except ImportError:
+        raise SkipTest('pytest is not installed')
+    filename = __file__
+    if filename.endswith('.pyc'):
+        filename = filename[:-1]
+    cmd = [sys.executable, '-m', 'pytest', '-p', 'pytester',
+           '-p', 'no:cacheprovider', '-o', 'python_functions=pytester_*',
+           '-q', filename]
+    ret = subprocess.call(cmd, cwd=os.path.dirname(filename))
+    assert ret == 0, ret
+
+
+def get_collected(testdir, module):
+    result = testdir.runpytest_subprocess('--comptests', module,
+                                          '--collect-only', '-q')
+    prefix = 'comptests-%s::' % module
+    return [x[len(prefix):] for x in result.outlines if x.startswith(prefix)]
+
+
+def pytester_ids(testdir):
+    ids = get_collected(testdir, 'example_package')
+    assert 'check_class1[c1a]' in ids, ids
+    assert 'check_class1[c1b]' in ids, ids
+    assert 'check_class1_class1[c1a-c1b]' in ids, ids
+
+
+def pytester_order(testdir):
+    ids = get_collected(testdir, 'example_package')
+    assert ids == sorted(ids)
+    assert get_collected(testdir, 'example_package') == ids
+
+
+requires_module = '''
+from comptests import comptests_for_all, comptests_requires
+
+
+def jobs_comptests(context):
+    from conf_tools import GlobalConfig
+    GlobalConfig.global_load_dir('example_package.configs')
+    from example_package import (get_conftools_example_class1,
+                                 get_example_package_config)
+    for_all_class1 = comptests_for_all(get_conftools_example_class1())
+
+    @for_all_class1
+    def check_first(id_ob, _):
+        assert id_ob != 'c1a'
+
+    @for_all_class1
+    @comptests_requires(check_first)
+    def check_second(id_ob, _):
+        pass
+
+    from comptests import jobs_registrar
+    jobs_registrar(context, get_example_package_config())
+'''
+
+
+def pytester_requires(testdir):
+    testdir.makepyfile(comptests_requires_pkg=requires_module)
+    result = testdir.runpytest_subprocess('--comptests',
+                                          'comptests_requires_pkg', '-v')
+    result.assert_outcomes(passed=2, failed=1, skipped=1)
+    # the test requiring a failed one is skipped, not failed
+    result.stdout.fnmatch_lines(['*::check_first?c1a? FAILED*',
+                                 '*::check_first?c1b? PASSED*',
+                                 '*::check_second?c1a? SKIPPED*',
+                                 '*::check_second?c1b? PASSED*'])
+
+
+def pytester_lazy(testdir):
+    # without modules, the plugin does not import comptests
+    testdir.makepyfile(test_lazy="""
+        import sys
+
+        def test_not_imported():
+            assert not 'comptests' in sys.modules
+    """)
+    result = testdir.runpytest_subprocess('-p', 'no:cacheprovider')
+    result.assert_outcomes(passed=1)
@@ -0,0 +1,76 @@
+from comptests.requirements import (check_requirements, comptests_requires,
+    get_requirements, split_requiring)
+
+
+class FakeObjSpec(object):
+    def __init__(self, name):
+        self.name = name
+
+
+def check_type(id_robot, robot):
+    pass
+
+
+@comptests_requires(check_type)
+def check_motion(id_robot, robot):
+    pass
+
+
+@comptests_requires(check_type)
+def check_navigation(id_robot, robot, id_world, world):
+    pass
+
+
+def check_world(id_robot, robot, id_world, world):
+    pass
+
+
+@comptests_requires(check_motion)
+def check_chained(id_robot, robot):
+    pass
+
+
+def test_requirements():
+    r = dict(functions=[dict(function=check_type),
+                        dict(function=check_motion)],
+             pairs=[dict(function=check_navigation,
+                         objspec2=FakeObjSpec('worlds')),
+                    dict(function=check_world,
+                         objspec2=FakeObjSpec('worlds'))],
+             some=[], some_pairs=[], batched=[])
+    check_requirements(dict(robots=r), dict(robots=[check_type, check_motion]))
+
+    first, later = split_requiring(r)
+    assert [x['function'] for x in first['functions']] == [check_type]
+    assert [x['function'] for x in later['functions']] == [check_motion]
+    # the pair tests are kept together
+    assert first['pairs'] == []
+    assert len(later['pairs']) == 2
+
+    required = dict(robots=dict(check_type=dict(r1='robots-check_type-r1-f')))
+    deps = get_requirements(required, r['pairs'][0], ['robots', 'worlds'],
+                            ['r1', 'w1'])
+    assert [d.job_id for d in deps] == ['robots-check_type-r1-f'], deps
+    assert get_requirements(required, r['pairs'][1], ['robots', 'worlds'],
+                            ['r1', 'w1']) == []
+    # not defined (e.g. not selected)
+    assert get_requirements(required, r['functions'][1], ['robots'],
+                            ['r2']) == []
+
+
+def test_requirements_errors():
+    def fails(registrations, registered):
+        try:
+            check_requirements(registrations, registered)
+        except ValueError:
+            pass
+        else:
+            raise Exception('Expected ValueError')
+
+    r = dict(functions=[dict(function=check_motion)])
+    fails(dict(robots=r), dict(robots=[]))
+    fails(dict(robots=r), dict(worlds=[check_type]))
+    r = dict(functions=[dict(function=check_chained)])
+    fails(dict(robots=r), dict(robots=[check_motion, check_type]))
+    r = dict(batched=[dict(function=check_motion)])
+    fails(dict(robots=r), dict(robots=[check_type]))
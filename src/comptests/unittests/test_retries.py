@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+
+from comptests import outcomes
+from comptests.asynctests import ConcurrentWrap, ObjectFailure
+from comptests.history import HistoryDB
+from comptests.registrar import (call_with_retries, get_batched_result,
+                                 wrap_func_batched)
+from comptests.results import Flaky, Skipped
+
+
+class FakeOutcome(object):
+    def __init__(self):
+        self.attempts = None
+
+    def set_attempts(self, attempts, flaky):
+        self.attempts = (attempts, flaky)
+
+
+def make_failing(n):
+    """ Returns a function that fails the first n times. """
+    calls = []
+
+    def f(x):
+        calls.append(x)
+        if len(calls) <= n:
+            raise ValueError('attempt %d' % len(calls))
+        return x
+    return f
+
+
+def test_retries():
+    outcome = FakeOutcome()
+    assert call_with_retries(outcome, 2, make_failing(0), 42) == 42
+    assert outcome.attempts is None
+
+    res = call_with_retries(outcome, 2, make_failing(2), 42)
+    assert isinstance(res, Flaky)
+    assert res.get_result() == 42
+    assert res.get_attempts() == 3
+    assert outcome.attempts == (3, True)
+
+    outcome = FakeOutcome()
+    try:
+        call_with_retries(outcome, 1, make_failing(2), 42)
+    except ValueError as e:
+        assert str(e) == 'attempt 2'
+    else:
+        raise Exception('Expected ValueError')
+    assert outcome.attempts == (2, False)
+
+
+class FakeLog(object):
+    def __init__(self):
+        self.records = []
+
+    def append_record(self, r):
+        self.records.append(r)
+
+
+def test_retries_batched():
+    # only the objects are recorded, not the chunk
+    log = FakeLog()
+    get_outcomes_log = outcomes.get_outcomes_log
+    outcomes.get_outcomes_log = lambda: log
+    try:
+        f = make_failing(1)
+        batch = wrap_func_batched(lambda pairs: dict(f(pairs)), ['a', 'b'],
+                                  [1, 2], objspecs=['s'], retries=1)
+        assert isinstance(batch, Flaky)
+        assert log.records == []
+        res = get_batched_result(f, batch, 'a', objspecs=['s'])
+        assert res.get_result() == 1
+        assert [r['objects'] for r in log.records] == [['a']]
+        assert log.records[0]['flaky']
+    finally:
+        outcomes.get_outcomes_log = get_outcomes_log
+
+
+def test_batched_compact():
+    # the batch job keeps only what the reports need of each result
+    def check(pairs):
+        return dict(a=[0] * 1000, b=Skipped('no b'), c=ValueError('c'))
+    batch = wrap_func_batched(check, ['a', 'b', 'c'], [1, 2, 3], False)
+    assert batch['a'] is None
+    assert isinstance(batch['b'], Skipped)
+    assert isinstance(batch['c'], ObjectFailure)
+    assert batch['c'].message == 'c'
+    batch = wrap_func_batched(check, ['a', 'b', 'c'], [1, 2, 3], True)
+    assert len(batch['a']) == 1000
+
+
+def test_retries_concurrent():
+    # the concurrent tests are retried per object
+    log = FakeLog()
+    get_outcomes_log = outcomes.get_outcomes_log
+    outcomes.get_outcomes_log = lambda: log
+    try:
+        f = make_failing(1)
+        w = ConcurrentWrap(lambda id_ob, ob: f(ob), max_concurrency=1)
+        batch = wrap_func_batched(w, ['a', 'b'], [1, 2], retries=1)
+        assert not isinstance(batch, Flaky)
+        flaky = [k for k in batch if isinstance(batch[k], Flaky)]
+        assert len(flaky) == 1
+        for id_ob in ['a', 'b']:
+            get_batched_result(w, batch, id_ob)
+        assert [r.get('flaky', False) for r in log.records] == \
+            [id_ob in flaky for id_ob in ['a', 'b']]
+    finally:
+        outcomes.get_outcomes_log = get_outcomes_log
+
+
+def test_flakiness():
+    dirname = tempfile.mkdtemp()
+    try:
+        history = HistoryDB(os.path.join(dirname, 'history.sqlite'))
+
+        def outcome(status, attempts, flaky):
+            return dict(job_id='r1-check', function='check',
+                        objspecs=['robots'], objects=['r1'], status=status,
+                        duration=1.0, message=None, timestamp=0,
+                        attempts=attempts, flaky=flaky)
+
+        runs = [('ok', 1, False), ('ok', 2, True), ('failed', 3, False),
+                ('ok', 1, False)]
+        for run in runs:
+            history.add_run([outcome(*run)], commit_id='c', modules=['m'])
+
+        flaky = history.flakiness()
+        assert len(flaky) == 1
+        assert flaky[0]['nflaky'] == 1
+        assert flaky[0]['n'] == 4
+        assert flaky[0]['nfailed'] == 1
+        assert flaky[0]['rate'] == 0.25
+        assert history.flakiness(min_rate=0.5) == []
+        history.close()
+    finally:
+        shutil.rmtree(dirname)
@@ -0,0 +1,63 @@
+from comptests.registrar import (get_chunks, get_needed_objects, mirror_pairs,
+    pair_selected, select_names)
+
+
+def test_select_names():
+    names = ['r1', 'r2', 'w1']
+    assert select_names(None, names) == names
+    assert select_names('r*', names) == ['r1', 'r2']
+    assert select_names('w1,r2', names) == ['r2', 'w1']
+    assert select_names('x*', names) == []
+    assert select_names('x', names) == []
+
+
+def test_needed_objects():
+    names2objects = dict(robots=['r1', 'r2'], worlds=['w1', 'w2'])
+    robots = (('robots', None),)
+    robots_worlds = (('robots', None), ('worlds', None))
+
+    # only the objects used by some test are instanced
+    needed = get_needed_objects(names2objects, [robots])
+    assert needed == dict(robots=['r1', 'r2'], worlds=[]), needed
+    needed = get_needed_objects(names2objects, [(('worlds', 'w2'),)])
+    assert needed == dict(robots=[], worlds=['w2']), needed
+    needed = get_needed_objects(names2objects,
+                                [(('robots', 'r*'), ('worlds', 'w1'))])
+    assert needed == dict(robots=['r1', 'r2'], worlds=['w1']), needed
+
+    needed = get_needed_objects(names2objects, [robots], 'r1')
+    assert needed == dict(robots=['r1'], worlds=[]), needed
+
+    # for pairs, all the partners of the selected objects are needed
+    needed = get_needed_objects(names2objects, [robots_worlds], 'r1')
+    assert needed == dict(robots=['r1'], worlds=['w1', 'w2']), needed
+
+    needed = get_needed_objects(names2objects, [robots_worlds], 'r1,w2')
+    assert needed == dict(robots=['r1', 'r2'], worlds=['w1', 'w2']), needed
+
+
+def test_chunks():
+    universe = ['r1', 'r2', 'r3', 'w1', 'w2']
+    assert get_chunks(universe, universe, None) == [(0, universe)]
+    assert get_chunks(universe, universe, 2) == [(0, ['r1', 'r2']),
+                                                 (1, ['r3', 'w1']),
+                                                 (2, ['w2'])]
+    # the chunks do not depend on the selection
+    assert get_chunks(universe, ['r1', 'w2'], 2) == [(0, ['r1']), (2, ['w2'])]
+    assert get_chunks([], [], None) == []
+
+
+def test_symmetric_pairs():
+    objects = ['r1', 'r2', 'r3']
+    x = dict(symmetric=True, include_diagonal=False)
+    pairs = [(a, b) for a in objects for b in objects if pair_selected(x, a, b)]
+    assert pairs == [('r1', 'r2'), ('r1', 'r3'), ('r2', 'r3')], pairs
+    x = dict(symmetric=True, include_diagonal=True)
+    assert len([1 for a in objects for b in objects
+                if pair_selected(x, a, b)]) == 6
+    assert all(pair_selected(dict(), a, b) for a in objects for b in objects)
+
+    results = {('r1', 'r2'): 'a', ('r1', 'r1'): 'b'}
+    mirror_pairs(dict(symmetric=True), results)
+    assert results == {('r1', 'r2'): 'a', ('r2', 'r1'): 'a',
+                       ('r1', 'r1'): 'b'}, results
@@ -0,0 +1,39 @@
+from comptests.serializers import (PickleSerializer, SerializedObject,
+    get_serializer)
+from comptests.transport import transport_load
+
+
+class Carrier():
+    def __init__(self, big, small, fortran):
+        self.big = big
+        self.small = small
+        self.fortran = fortran
+
+
+def test_serializers():
+    import numpy as np
+
+    ob = Carrier(big=np.zeros((300, 300)), small=np.arange(3),
+                 fortran=np.asfortranarray(np.ones((200, 100))))
+    ob.big[1, 2] = 3
+    for name in ['pickle', 'zlib']:
+        x = get_serializer(name).dumps(ob)
+        assert isinstance(x, SerializedObject)
+        assert len(x.buffers) == 2  # small arrays are pickled as usual
+        ob2 = transport_load(x)
+        assert np.all(ob2.big == ob.big)
+        assert ob2.big.flags.writeable
+        assert ob2.fortran.shape == (200, 100)
+        assert ob2.fortran.flags.f_contiguous
+        assert list(ob2.small) == [0, 1, 2]
+    # the zeros compress well
+    assert get_serializer('zlib').dumps(ob).get_size() < 10000
+
+    assert transport_load(dict(a=1)) == dict(a=1)
+    for f, arg in [(get_serializer, 'unknown'), (PickleSerializer, 'bz2')]:
+        try:
+            f(arg)
+        except ValueError:
+            pass
+        else:
+            raise Exception('Expected ValueError')
@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+import tempfile
+
+from comptests.registrar import ComptestsRegistrar, shard_selected
+from comptests.sharding import (assign_shards, get_shard_units, merge_results,
+                                parse_shard)
+
+
+def entry(objspec, function, njobs, kind='single', requires=(), module='m'):
+    return dict(module=module, objspec=objspec, function=function, kind=kind,
+                njobs=njobs, dynamic=False, requires=list(requires))
+
+
+def test_parse_shard():
+    assert parse_shard('2/8') == (2, 8)
+    for s in ['0/8', '9/8', '2', 'a/b']:
+        try:
+            parse_shard(s)
+        except ValueError:
+            pass
+        else:
+            raise Exception('Accepted %r' % s)
+
+
+def test_assign_shards():
+    entries = [entry('robots', 'f', 4),
+               entry('robots', 'g', 2, requires=['f']),
+               entry('robots', 'h', 10, kind='pairs'),
+               entry(None, 'k', 1, kind='simple'),
+               entry('robots', 'instance_robots', 3, kind='instance'),
+               entry('robots', 'get_batched_result', 5,
+                     kind='batched_result')]
+    units = get_shard_units(entries, ['m'])
+    names = [u['name'] for u in units]
+    # g is with f, which it requires; the instances are not tests
+    assert names == ['m::k', 'm:robots:f', 'm:robots:h', 'nose:m'], names
+    assert units[1]['tests'] == [('m', 'robots', 'f'), ('m', 'robots', 'g')]
+
+    durations = dict(functions={'m:robots:f': 1.0, 'm:robots:g': 1.0,
+                                'm:robots:h': 0.5, 'm::k': 2.0,
+                                # the same name for another objspec
+                                'm:cars:f': 100.0},
+                     nose=dict(m=4.0))
+    shards = assign_shards(units, durations, 2)
+    assert shards == assign_shards(list(reversed(units)), durations, 2)
+    loads = [sum(u['weight'] for u in shard) for shard in shards]
+    # 6 (f, g) | 5 (h) + 4 (nose) ... -> 6+2, 5+4
+    assert sorted(loads) == [8.0, 9.0], loads
+
+    # without durations, by number of jobs
+    shards = assign_shards(units, {}, 3)
+    assert [len(s) for s in shards] == [1, 1, 2]
+
+
+def function_in(module):
+    def f(id_ob, ob):
+        pass
+    f.__module__ = module
+    return f
+
+
+def test_shard_modules():
+    # the same objspec and function name in two modules
+    entries = [entry('robots', 'f', 1, module='m1'),
+               entry('robots', 'f', 1, module='m2')]
+    units = get_shard_units(entries, [])
+    assert [u['tests'] for u in units] == [[('m1', 'robots', 'f')],
+                                           [('m2', 'robots', 'f')]]
+    settings = ComptestsRegistrar.settings
+    ComptestsRegistrar.settings = dict(settings, shard_tests=units[0]['tests'])
+    try:
+        assert shard_selected('robots', function_in('m1.unittests'))
+        assert not shard_selected('robots', function_in('m2.unittests'))
+        assert not shard_selected('cars', function_in('m1.unittests'))
+    finally:
+        ComptestsRegistrar.settings = settings
+
+
+def test_merge_results():
+    dirname = tempfile.mkdtemp()
+    try:
+        base = dict(source='comptests', module='m', function='f',
+                    objspecs=['robots'], objects=[], message=None,
+                    traceback=None, duration=1.0)
+        inputs = []
+        for i, records in enumerate([
+                [dict(base, job_id='j1', status='ok'),
+                 dict(base, job_id='j2', status='failed', duration=3.0)],
+                [dict(base, job_id='j3', status='ok'),
+                 dict(base, job_id='j1', status='ok'),
+                 dict(base, job_id='j4', objspecs=['cars'], status='ok'),
+                 dict(base, source='nose', job_id='m.tests.t1',
+                      function='t1', status='ok', duration=0.5)]]):
+            fn = os.path.join(dirname, 'shard%d.jsonl' % i)
+            with open(fn, 'w') as f:
+                for r in records:
+                    f.write(json.dumps(r) + '\n')
+            inputs.append(fn)
+
+        durations = os.path.join(dirname, 'durations.json')
+        counts = merge_results(inputs, junit=os.path.join(dirname, 'r.xml'),
+                               jsonl=os.path.join(dirname, 'r.jsonl'),
+                               durations=durations)
+        assert counts['tests'] == 5, counts
+        assert counts['failures'] == 1, counts
+        assert counts['duplicates'] == 1, counts
+        with open(durations) as f:
+            d = json.load(f)
+        assert d == dict(functions={'m:robots:f': 5.0 / 3, 'm:cars:f': 1.0},
+                         nose=dict(m=0.5)), d
+    finally:
+        shutil.rmtree(dirname)
@@ -0,0 +1,31 @@
+import os
+import shutil
+import sys
+import tempfile
+
+from comptests.startup import ImportTimer, format_import_times
+
+
+def test_import_timer():
+    dirname = tempfile.mkdtemp()
+    package = os.path.join(dirname, 'comptests_startup_pkg')
+    os.makedirs(package)
+    with open(os.path.join(package, '__init__.py'), 'w') as f:
+        f.write('from . import sub\n')
+    with open(os.path.join(package, 'sub.py'), 'w') as f:
+        f.write('import time\ntime.sleep(0.1)\n')
+    sys.path.insert(0, dirname)
+    timer = ImportTimer()
+    timer.install()
+    try:
+        import comptests_startup_pkg  # @UnusedImport
+    finally:
+        timer.uninstall()
+        sys.path.remove(dirname)
+        shutil.rmtree(dirname)
+
+    sub = 'comptests_startup_pkg.sub'
+    assert timer.self_time[sub] >= 0.1, timer.self_time
+    assert timer.total['comptests_startup_pkg'] >= timer.total[sub]
+    assert timer.self_time['comptests_startup_pkg'] < 0.1
+    assert 'comptests_startup_pkg' in format_import_times(timer)
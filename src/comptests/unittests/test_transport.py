@@ -0,0 +1,33 @@
+import shutil
+import tempfile
+
+from comptests.transport import shared_arrays_dump, shared_arrays_load
+
+
+class Carrier():
+    def __init__(self, big, small):
+        self.big = big
+        self.small = small
+
+
+def test_shared_arrays():
+    import numpy as np
+
+    dirname = tempfile.mkdtemp()
+    try:
+        ob = Carrier(big=np.arange(100000.0), small=np.zeros(3))
+        x = shared_arrays_dump(ob, dirname=dirname, prefix='ob',
+                               threshold=1000)
+        assert len(x.filenames) == 1
+        assert len(x.data) < 10000
+
+        ob2 = shared_arrays_load(x)
+        assert isinstance(ob2.big, np.memmap)
+        assert not ob2.big.flags.writeable
+        assert np.all(ob2.big == ob.big)
+        # small arrays are pickled as usual
+        assert not isinstance(ob2.small, np.memmap)
+
+        assert shared_arrays_load(ob) is ob
+    finally:
+        shutil.rmtree(dirname)
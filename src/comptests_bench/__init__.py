@@ -0,0 +1,18 @@
+from .configuration import *
+from .interfaces import *
+from .runner import *
+from .serializers import *
+
+
+def jobs_comptests(context):
+    # configuration
+    config = get_bench_config()
+    add_bench_objects(config)
+
+    # mcdp_lang_tests
+    from . import unittests
+
+    # instantiation
+    from comptests import jobs_registrar
+    jobs_registrar(context, config,
+                   create_reports=get_bench_params().create_reports)
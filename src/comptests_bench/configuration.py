@@ -0,0 +1,71 @@
+from collections import namedtuple
+import os
+
+from conf_tools import ConfigMaster
+
+
+__all__ = [
+    'BenchParams',
+    'get_bench_params',
+    'get_bench_config',
+    'add_bench_objects',
+]
+
+BenchParams = namedtuple('BenchParams',
+                         'nobjspecs nobjects nfunctions pair_density '
+                         'create_reports')
+
+# environment variables used to pass the parameters to the 
+# "comptests" process (and its workers)
+ENV_OBJSPECS = 'COMPTESTS_BENCH_OBJSPECS'
+ENV_OBJECTS = 'COMPTESTS_BENCH_OBJECTS'
+ENV_FUNCTIONS = 'COMPTESTS_BENCH_FUNCTIONS'
+ENV_PAIR_DENSITY = 'COMPTESTS_BENCH_PAIR_DENSITY'
+ENV_REPORTS = 'COMPTESTS_BENCH_REPORTS'
+
+
+def get_bench_params():
+    """ Reads the benchmark size from the environment. """
+    env = os.environ
+    return BenchParams(nobjspecs=int(env.get(ENV_OBJSPECS, 2)),
+                       nobjects=int(env.get(ENV_OBJECTS, 3)),
+                       nfunctions=int(env.get(ENV_FUNCTIONS, 2)),
+                       pair_density=float(env.get(ENV_PAIR_DENSITY, 0.5)),
+                       create_reports=env.get(ENV_REPORTS, '0') == '1')
+
+
+def bench_params_to_env(params):
+    return {
+        ENV_OBJSPECS: str(params.nobjspecs),
+        ENV_OBJECTS: str(params.nobjects),
+        ENV_FUNCTIONS: str(params.nfunctions),
+        ENV_PAIR_DENSITY: str(params.pair_density),
+        ENV_REPORTS: '1' if params.create_reports else '0',
+    }
+
+
+class BenchConfig(ConfigMaster):
+    def __init__(self):
+        ConfigMaster.__init__(self, 'BenchConfig')
+
+        from .interfaces import BenchObject
+        params = get_bench_params()
+        for i in range(params.nobjspecs):
+            name = 'bench%d' % i
+            self.add_class_generic(name, '*.%s.yaml' % name, BenchObject)
+
+
+def get_bench_config():
+    return BenchConfig.get_singleton()
+
+
+def add_bench_objects(config):
+    """ Adds the synthetic objects to each ObjectSpec. """
+    params = get_bench_params()
+    for name, objspec in config.specs.items():
+        for j in range(params.nobjects):
+            id_object = '%so%d' % (name, j)
+            if id_object in objspec:
+                continue
+            code = ['comptests_bench.BenchObject', dict(id_object=id_object)]
+            objspec.add_spec(id_object, 'Benchmark object', code)
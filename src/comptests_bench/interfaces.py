@@ -0,0 +1,30 @@
+
+__all__ = [
+    'BenchObject',
+    'NoOpTest',
+]
+
+
+class BenchObject():
+    """ The (cheap) object instantiated for each benchmark entry. """
+    def __init__(self, id_object):
+        self.id_object = id_object
+
+
+class NoOpTest():
+    """ 
+        A test that does nothing. We need one distinct, picklable 
+        function per registration, so we use a named callable.
+    """
+    def __init__(self, name):
+        self.__name__ = name
+        self.__module__ = __name__
+
+    def __call__(self, *args):
+        pass
+
+    def __eq__(self, other):
+        return isinstance(other, NoOpTest) and other.__name__ == self.__name__
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
@@ -0,0 +1,171 @@
+from collections import defaultdict
+import json
+import os
+import shutil
+import time
+
+from compmake import StorageFilesystem
+from compmake.jobs.storage import all_jobs, get_job, get_job_cache
+from compmake.structures import Cache
+from quickapp import QuickAppBase
+from system_cmd import system_cmd_result
+
+from .configuration import BenchParams, bench_params_to_env
+from .serializers import (benchmark_serializers, format_serializers_table,
+    get_realistic_objects)
+
+
+__all__ = [
+    'CompTestsBench',
+    'main_comptests_bench',
+]
+
+
+class CompTestsBench(QuickAppBase):
+    """
+        Measures the overhead of comptests itself, by running
+        the synthetic package "comptests_bench" (whose tests do nothing).
+    """
+
+    cmd = 'comptests-bench'
+
+    def define_program_options(self, params):
+        params.add_int('objspecs', default=2, help='Number of ObjectSpecs')
+        params.add_int('objects', default=3, help='Objects per ObjectSpec')
+        params.add_int('functions', default=2,
+                       help='Test functions per ObjectSpec')
+        params.add_float('pair_density', default=0.5,
+                         help='Fraction of ObjectSpec pairs with a pair test')
+        params.add_flag('reports', help='Also create the reports')
+        params.add_string('command', default=None,
+                          help='Compmake command to use (default: make all)')
+        params.add_string('output', short='o', default='out-comptests-bench',
+                          help='Output directory')
+        params.add_string('serializers', default=None,
+                          help='Instead, compare the size and load time of '
+                               'these serializers (comma separated, "none" '
+                               'for plain compmake) on realistic objects')
+
+    def go(self):
+        options = self.get_options()
+        params = BenchParams(nobjspecs=options.objspecs,
+                             nobjects=options.objects,
+                             nfunctions=options.functions,
+                             pair_density=options.pair_density,
+                             create_reports=options.reports)
+
+        outdir = os.path.realpath(options.output)
+        if os.path.exists(outdir):
+            shutil.rmtree(outdir)
+        os.makedirs(outdir)
+
+        if options.serializers is not None:
+            names = [str(x) for x in options.serializers.split(',')]
+            return self.go_serializers(outdir, names)
+
+        res = run_bench(outdir, params, options.command)
+
+        for k in ['njobs', 'nfailed', 'ntests', 'total', 'definition', 'instances',
+                  'tests', 'reports', 'overhead_per_job', 'db_size',
+                  'db_files']:
+            self.info('%20s: %s' % (k, res[k]))
+
+        out = os.path.join(outdir, 'bench.json')
+        with open(out, 'w') as f:
+            json.dump(res, f, indent=2, sort_keys=True)
+        self.info('Written to %s' % out)
+
+    def go_serializers(self, outdir, names):
+        rows = benchmark_serializers(get_realistic_objects(), names)
+        self.info('\n' + format_serializers_table(rows))
+        out = os.path.join(outdir, 'serializers.json')
+        with open(out, 'w') as f:
+            json.dump(rows, f, indent=2, sort_keys=True)
+        self.info('Written to %s' % out)
+
+
+main_comptests_bench = CompTestsBench.get_sys_main()
+
+
+def run_bench(outdir, params, command):
+    """ Runs comptests on the benchmark package and analyzes the DB. """
+    env = dict(os.environ)
+    env.update(bench_params_to_env(params))
+    # note: we use the default output dir "out-comptests" inside outdir
+    cmd = ['comptests', '--nonose']
+    if command is not None:
+        cmd.extend(['-c', command])
+    if params.create_reports:
+        cmd.append('--reports')
+    cmd.append('comptests_bench')
+
+    t0 = time.time()
+    # we still want the timing if some jobs fail
+    system_cmd_result(cwd=outdir, cmd=cmd, env=env,
+                      display_stdout=False,
+                      display_stderr=False,
+                      raise_on_error=False)
+    total = time.time() - t0
+
+    storage = os.path.join(outdir, 'out-comptests', 'compmake')
+    res = analyze_db(StorageFilesystem(storage))
+    res['db_size'], res['db_files'] = get_dir_size(storage)
+    res['total'] = total
+    res['overhead_per_job'] = (total - res['compute']) / max(res['njobs'], 1)
+    res['params'] = params._asdict()
+    return res
+
+
+def job_category(job):
+    """ Classifies the job as definition, instance, test, report, or other. """
+    desc = job.command_desc
+    if desc.startswith('report') or desc.startswith('_dynreports_create'):
+        return 'reports'
+    if desc.startswith('instance_'):
+        return 'instances'
+    if desc.startswith('bench_'):
+        return 'tests'
+    if job.needs_context:
+        return 'definition'
+    return 'other'
+
+
+def analyze_db(db):
+    """ Returns the compute time for each category of jobs. """
+    times = defaultdict(lambda: 0.0)
+    counts = defaultdict(lambda: 0)
+    compute = 0.0
+    njobs = 0
+    nfailed = 0
+    for job_id in all_jobs(db):
+        job = get_job(job_id, db)
+        cache = get_job_cache(job_id, db)
+        njobs += 1
+        category = job_category(job)
+        counts[category] += 1
+        if cache.state != Cache.DONE:
+            nfailed += 1
+            continue
+        t = cache.int_compute.get_walltime_used()
+        times[category] += t
+        compute += t
+
+    res = {}
+    for k in ['definition', 'instances', 'tests', 'reports', 'other']:
+        res[k] = times[k]
+    res['ntests'] = counts['tests']
+    res['njobs'] = njobs
+    res['nfailed'] = nfailed
+    res['compute'] = compute
+    return res
+
+
+def get_dir_size(dirname):
+    """ Returns total size and number of files. """
+    size = 0
+    nfiles = 0
+    for root, _, files in os.walk(dirname):
+        for f in files:
+            size += os.path.getsize(os.path.join(root, f))
+            nfiles += 1
+    return size, nfiles
@@ -0,0 +1,87 @@
+import gc
+import random
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: no cover
+    import pickle
+
+from comptests.serializers import get_serializer
+
+
+__all__ = [
+    'benchmark_serializers',
+    'get_realistic_objects',
+]
+
+
+def get_realistic_objects():
+    """
+        Returns a dict name -> object, with the kind of objects that the
+        tests use: configurations, logs, maps and sensor data.
+    """
+    rng = random.Random(0)
+    obs = {}
+    obs['config'] = dict(('param%d' % i, dict(value=rng.random(), unit='m',
+                                              bounds=[0, 10 * i]))
+                         for i in range(200))
+    obs['log'] = [dict(t=i * 0.01, event=rng.choice(['start', 'stop', 'move']),
+                       values=[rng.random() for _ in range(5)])
+                  for i in range(20000)]
+    try:
+        import numpy as np
+    except ImportError:  # the ones with arrays are skipped
+        return obs
+    state = np.random.RandomState(0)
+    occupancy = np.zeros((1000, 1000), dtype='uint8')
+    occupancy[200:300, 100:900] = 255
+    obs['map'] = dict(occupancy=occupancy, resolution=0.05)
+    obs['scans'] = dict(ranges=state.rand(1000, 360).astype('float32'),
+                        timestamps=np.arange(1000) * 0.1)
+    return obs
+
+
+def benchmark_serializers(objects, names, repeat=3):
+    """
+        Returns a list of dict(object, serializer, size, dump, load), where
+        dump and load are the best times over repeat runs, including the
+        pickling done by compmake for storing the result.
+        The serializer "none" is the default compmake storage.
+        As in timeit, the garbage collector is disabled while timing.
+    """
+    rows = []
+    for ob_name in sorted(objects):
+        ob = objects[ob_name]
+        for name in names:
+            serializer = None if name == 'none' else get_serializer(name)
+            dumps = []
+            loads = []
+            for _ in range(repeat):
+                gc.collect()
+                gc.disable()
+                try:
+                    t0 = time.time()
+                    x = ob if serializer is None else serializer.dumps(ob)
+                    data = pickle.dumps(x, pickle.HIGHEST_PROTOCOL)
+                    dumps.append(time.time() - t0)
+                    t0 = time.time()
+                    x = pickle.loads(data)
+                    if serializer is not None:
+                        x.load()
+                    loads.append(time.time() - t0)
+                finally:
+                    gc.enable()
+            rows.append(dict(object=ob_name, serializer=name, size=len(data),
+                             dump=min(dumps), load=min(loads)))
+    return rows
+
+
+def format_serializers_table(rows):
+    s = '%-8s %-10s %12s %10s %10s\n' % ('object', 'serializer', 'size',
+                                         'dump (ms)', 'load (ms)')
+    for r in rows:
+        s += '%-8s %-10s %12d %10.1f %10.1f\n' % (r['object'], r['serializer'],
+                                                  r['size'], r['dump'] * 1000,
+                                                  r['load'] * 1000)
+    return s
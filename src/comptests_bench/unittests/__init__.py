@@ -0,0 +1 @@
+from .generation import *
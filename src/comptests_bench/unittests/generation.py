@@ -0,0 +1,26 @@
+import random
+
+from comptests import comptests_for_all, comptests_for_all_pairs
+from comptests_bench import get_bench_config, get_bench_params, NoOpTest
+
+
+def register_bench_tests():
+    params = get_bench_params()
+    config = get_bench_config()
+    names = sorted(config.specs)
+    for name in names:
+        for_all = comptests_for_all(config.specs[name])
+        for k in range(params.nfunctions):
+            for_all(NoOpTest('bench_%s_f%d' % (name, k)))
+
+    # deterministic choice of the pairs of objspecs that are tested
+    # (pairs of the same objspec are not supported by define_tests_pairs)
+    rng = random.Random(0)
+    for name1 in names:
+        for name2 in names:
+            if name1 != name2 and rng.random() < params.pair_density:
+                for_all_pairs = comptests_for_all_pairs(config.specs[name1],
+                                                        config.specs[name2])
+                for_all_pairs(NoOpTest('bench_%s_%s_pair' % (name1, name2)))
+
+register_bench_tests()
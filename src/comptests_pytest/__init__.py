@@ -0,0 +1,41 @@
+"""
+    The pytest plugin of comptests (see comptests/pytest_plugin.py):
+
+        pytest --comptests example_package
+        pytest --comptests example_package -n auto   # with pytest-xdist
+
+    or, in the pytest configuration:
+
+        [pytest]
+        comptests_modules = example_package
+
+    pytest loads it in every session, so it is kept out of the comptests
+    package, which imports quickapp, reprep, etc.: comptests is imported
+    only when modules are given.
+"""
+import pytest
+
+
+__all__ = []
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('comptests')
+    group.addoption('--comptests', action='append', default=[],
+                    metavar='MODULE',
+                    help='Collects the comptests of MODULE (can be repeated).')
+    parser.addini('comptests_modules', type='linelist', default=[],
+                  help='Modules whose comptests are collected.')
+
+
+@pytest.hookimpl(tryfirst=True)  # before the deselection by -k/-m
+def pytest_collection_modifyitems(session, config, items):
+    modules = config.getoption('comptests') + config.getini('comptests_modules')
+    if not modules:
+        return
+    from comptests.pytest_plugin import ComptestsCollector, make_node
+    for module in modules:
+        name = 'comptests-%s' % module
+        collector = make_node(ComptestsCollector, parent=session, name=name,
+                              nodeid=name, module=module)
+        items.extend(collector.collect())
@@ -1,8 +1,11 @@
 from .generation import (for_all_class1, for_all_class1_class2, 
-    for_all_class1_class2_dynamic, for_all_class1_dynamic)
+    for_all_class1_class2_dynamic, for_all_class1_dynamic,
+    for_all_class1_benchmark, for_all_class1_batched, for_all_class1_class1,
+    for_all_class1_concurrent, fixture_class1, fixture_class1_class2)
 from example_package.unittests.generation import for_some_class1, \
     for_some_class1_class2
-from comptests.registrar import comptest, comptest_dynamic
+from comptests.registrar import comptest, comptest_dynamic, comptest_fails
+from comptests import comptests_requires
 
 
 @comptest
@@ -14,6 +17,11 @@ def dyn_simple_check(context):
     pass
 
 
+@comptest_fails
+def simple_check_fails():
+    raise ValueError('Expected failure')
+
+
 @for_all_class1
 def check_class1(id_ob, _):
     print('check_class1(%r)' % id_ob)
@@ -41,6 +49,53 @@ def check_class1_class2(id_ob1, _, id_ob2, _2):
     print('check_class1_class2(%r,%r)' % (id_ob1, id_ob2))
 
 
+@fixture_class1
+def class1_range(_, ob1):
+    return range(ob1.param1)
+
+
+@fixture_class1_class2
+def class1_class2_names(id_ob1, _, id_ob2, _2):
+    return (id_ob1, id_ob2)
+
+
+@for_all_class1
+def check_class1_fixture(_, ob1, class1_range):
+    assert len(class1_range) == ob1.param1
+
+
+@for_all_class1_class2
+def check_class1_class2_fixtures(id_ob1, _, id_ob2, _2, class1_range,
+                                 class1_class2_names):
+    assert class1_class2_names == (id_ob1, id_ob2)
+
+
+@for_all_class1_class2
+@comptests_requires(check_class1)
+def check_class1_class2_requires(id_ob1, _, id_ob2, _2):
+    pass
+
+
+@for_all_class1_class1
+def check_class1_class1(id_ob1, _, id_ob2, _2):
+    assert id_ob1 < id_ob2
+
+
+@for_all_class1_batched
+def check_class1_batched(objects):
+    return dict((id_ob, None) for id_ob, _ in objects)
+
+
+@for_all_class1_concurrent
+def check_class1_concurrent(_, ob1):
+    assert ob1.param1 >= 0
+
+
+@for_all_class1_benchmark
+def bench_class1(_, ob1):
+    sum(range(ob1.param1 * 100))
+
+
 @for_all_class1_dynamic
 def check_class1_dynamic(context, _, ob1):
     r = context.comp(report_class1, ob1)
@@ -1,6 +1,9 @@
-from comptests import (comptests_for_all, comptests_for_all_dynamic,
+from comptests import (comptests_fixture, comptests_for_all,
+    comptests_for_all_batched, comptests_for_all_benchmark,
+    comptests_for_all_concurrent,
+    comptests_for_all_dynamic,
     comptests_for_all_pairs, comptests_for_all_pairs_dynamic, comptests_for_some,
-    comptests_for_some_pairs)
+    comptests_for_some_pairs, comptests_pair_fixture)
 from example_package import (get_conftools_example_class1,
     get_conftools_example_class2)
 
@@ -14,4 +17,12 @@ for_some_class1_class2 = comptests_for_some_pairs(library_class1, library_class2
 for_all_class1_class2 = comptests_for_all_pairs(library_class1, library_class2)
 for_all_class1_dynamic = comptests_for_all_dynamic(library_class1)
 for_all_class1_class2_dynamic = comptests_for_all_pairs_dynamic(library_class1, library_class2)
+for_all_class1_benchmark = comptests_for_all_benchmark(library_class1)
+for_all_class1_batched = comptests_for_all_batched(library_class1, chunk=1)
+for_all_class1_concurrent = comptests_for_all_concurrent(library_class1)
 
+fixture_class1 = comptests_fixture(library_class1)
+fixture_class1_class2 = comptests_pair_fixture(library_class1, library_class2)
+for_all_class1_class1 = comptests_for_all_pairs(library_class1, library_class1,
+                                                symmetric=True,
+                                                include_diagonal=False)